@@ -1,25 +1,185 @@
 import streamlit as st
 
-def model_evaluator():
-    import streamlit as st
-    from pathlib import Path
-    from orchestrator import final_evaluator
+# the Bedrock models that can be selected for evaluation, built once instead of on every rerun of the script
+MODEL_OPTIONS = (
+    'anthropic.claude-instant-v1',
+    'anthropic.claude-v2',
+    'anthropic.claude-v2:1',
+    'anthropic.claude-3-haiku-20240307-v1:0',
+    'anthropic.claude-3-sonnet-20240229-v1:0',
+    'us.anthropic.claude-3-5-haiku-20241022-v1:0',
+    'mistral.mistral-7b-instruct-v0:2',
+    'mistral.mixtral-8x7b-instruct-v0:1',
+    'mistral.mistral-large-2402-v1:0',
+    'meta.llama2-13b-chat-v1',
+    'meta.llama2-70b-chat-v1',
+    'meta.llama3-8b-instruct-v1:0',
+    'meta.llama3-70b-instruct-v1:0',
+    'us.meta.llama3-1-70b-instruct-v1:0',
+    'us.meta.llama3-1-405b-instruct-v1:0',
+    'cohere.command-text-v14',
+    'cohere.command-light-text-v14',
+    'amazon.titan-text-lite-v1',
+    'amazon.titan-text-express-v1',
+    'ai21.j2-mid-v1',
+    'ai21.j2-ultra-v1',
+)
+
+
+@st.cache_resource
+def init_environment():
+    """
+    Loads the .env file and sets up the default AWS session, cached by streamlit so it only runs once per server process
+    instead of on every rerun of the script.
+
+    :return: A dictionary of the default save folder, AWS profile name and AWS region name.
+    """
     import os
     import boto3
     from dotenv import load_dotenv
 
     # load environment variables
     load_dotenv()
-
-    # set defaults if they are not already set in environment variables
-    current_directory = os.getcwd()
-    default_region_name = boto3.DEFAULT_SESSION.region_name if boto3.DEFAULT_SESSION else 'us-east-1'
     boto3.setup_default_session()
-    current_profile_name = boto3.DEFAULT_SESSION.profile_name
+    return {
+        'save_folder': os.getcwd(),
+        'profile_name': boto3.DEFAULT_SESSION.profile_name,
+        # the region of the AWS profile or environment, if one is configured
+        'region_name': boto3.DEFAULT_SESSION.region_name or 'us-east-1'
+    }
+
+
+@st.cache_resource
+def _tokenizer():
+    """
+    Loads the tokenizer used to count the tokens of the task prompt, cached by streamlit so it is only loaded once.
+
+    :return: The cl100k_base tiktoken encoding.
+    """
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def extract_text(pdf_sha256, cache_policy, _pdf_path):
+    """
+    Extracts the text of a PDF, memoized on the hash of the PDF so the same document is only parsed once. The text is
+    also cached on disk, so it is not parsed again after the server restarts.
+
+    :param pdf_sha256: The SHA256 hex digest of the PDF.
+    :param cache_policy: The cache policy of the evaluation, see CACHE_POLICIES, it decides if the text is read from
+    and written to the cache on disk.
+    :param _pdf_path: Path to the PDF file, it is not hashed by streamlit as pdf_sha256 already covers the PDF.
+    :return: The extracted text from the PDF file as a string.
+    """
+    import contextvars
+    from text_extractor_and_summarizer import text_extraction, text_extraction_tag
+    from evaluation_cache import load_text, save_text, current_cache_policy
+    # the cached text follows the cache policy like the cached responses, without changing the policy of the script
+    context = contextvars.copy_context()
+    context.run(current_cache_policy.set, cache_policy)
+    # the text is cached per extractor, so a text extracted by another extractor or version is not reused
+    extractor_tag = text_extraction_tag()
+    input_text_data = context.run(load_text, pdf_sha256, extractor_tag)
+    if input_text_data is None:
+        input_text_data = text_extraction(_pdf_path)
+        context.run(save_text, pdf_sha256, extractor_tag, input_text_data)
+    return input_text_data
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def run_eval(cache_key, models, prompt, max_tokens, latency_optimized, _input_text_data, _on_token=None, _client=None):
+    """
+    Runs the model evaluation, memoized by streamlit and shared by all sessions, so reruns of the script and other
+    sessions running the same evaluation do not invoke the models again.
+
+    :param cache_key: The key of the evaluation, it covers the PDF and all of the other arguments.
+    :param models: Tuple of the models to evaluate.
+    :param prompt: The task the models are evaluated on.
+    :param max_tokens: The maximum number of tokens the models can generate.
+    :param latency_optimized: Use latency-optimized inference for the models that support it.
+    :param _input_text_data: The text extracted from the PDF, it is not hashed by streamlit as the cache_key already
+    covers the PDF.
+    :param _on_token: Optional. The callback the streamed responses are passed to, it is not hashed by streamlit.
+    :param _client: Optional. The Amazon Bedrock Runtime client the models are invoked with, see get_bedrock_runtime, it
+    is not hashed by streamlit.
+    :return: The results of final_evaluator.
+    """
+    from orchestrator import final_evaluator
+    return final_evaluator(_input_text_data, list(models), prompt, max_tokens, latency_optimized, _on_token,
+                           _client)
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def summarize_results(results_df):
+    """
+    Derives the headline cost, latency and score metrics of an evaluation, memoized so reruns do not rescan the results.
 
-    os.environ.setdefault('save_folder', current_directory)
-    os.environ.setdefault('profile_name', current_profile_name)  # Use retrieved or fallback profile name
-    os.environ.setdefault('region_name', 'us-east-1')
+    :param results_df: The DataFrame of model performance metrics and costs.
+    :return: A tuple containing the lowest cost, the adjusted highest cost, the shortest time length, the fastest models,
+    the adjusted highest time, the highest score, the best scoring models and the adjusted lowest score. When none of
+    the models were scored, the highest score is "n/a", there are no best scoring models and the lowest score is None.
+    """
+    # Gather the min and max of every metric in a single pass over the results
+    metrics = results_df[['Total Cost', 'Time Length', 'Summary Score']].agg(['min', 'max'])
+    # Gather cost of the lowest cost model
+    lowest_cost = round(metrics.at['min', 'Total Cost'], 2)
+    # Gather the cost of the highest cost model
+    highest_cost = round(metrics.at['max', 'Total Cost'], 2)
+    # if it is not the lowest cost option, it returns itself
+    adjusted_highest_cost = 0 if highest_cost == lowest_cost else highest_cost
+    # Find the model with the lowest latency
+    shortest_time_length = round(metrics.at['min', 'Time Length'], 2)
+    # Find the model name of the model with the lowest latency, compared against the unrounded min
+    shortest_time_length_models = results_df.loc[results_df['Time Length'] == metrics.at['min', 'Time Length'],
+                                                 'Model'].tolist()
+    # Cast the model name as a comma-seperated string
+    shortest_time_length_models_str = ', '.join(shortest_time_length_models)
+    # find the model with the highest latency
+    highest_time = round(metrics.at['max', 'Time Length'], 2)
+    # if it is not the lowest latency model, return itself
+    adjusted_highest_time = 0 if highest_time == shortest_time_length else highest_time
+    # the models without a score are left out of the score metrics, their score is NaN, or NA in a pyarrow column
+    scores = results_df['Summary Score'].dropna()
+    if scores.empty:
+        # none of the models were scored, there is no best or worst score to show
+        return (lowest_cost, adjusted_highest_cost, shortest_time_length, shortest_time_length_models_str,
+                adjusted_highest_time, "n/a", "", None)
+    # Calculate the highest score from the 'Summary Score' column in the DataFrame df
+    highest_score = round(scores.max())
+    # Select rows from the DataFrame where the 'Summary Score' is equal to the highest score
+    # and extract the corresponding 'Model' values into a list
+    # compare against the unrounded max, as the rounded score may not match any model exactly
+    highest_score_models = results_df.loc[scores.index[scores == scores.max()], 'Model'].astype(str).tolist()
+    # Convert the list of highest scoring models to a comma-separated string
+    highest_score_models_str = ', '.join(highest_score_models)
+    # Calculate the lowest score from the 'Summary Score' column in the DataFrame df
+    lowest_score = round(scores.min())
+    # if it is not the highest score, return itself
+    adjusted_lowest_score_str = int(0 if lowest_score == highest_score else lowest_score)
+    return (lowest_cost, adjusted_highest_cost, shortest_time_length, shortest_time_length_models_str,
+            adjusted_highest_time, highest_score, highest_score_models_str, adjusted_lowest_score_str)
+
+
+def model_evaluator():
+    import streamlit as st
+    from pathlib import Path
+    from orchestrator import final_evaluator
+    from text_extractor_and_summarizer import LATENCY_OPTIMIZED_MODELS, latency_optimized_supported, get_bedrock_runtime
+    from evaluation_cache import CACHE_POLICIES, save_upload, evaluation_cache_key, load_evaluation, save_evaluation
+    from plotting_and_reporting import plot_model_comparisons, plot_model_performance_comparisons
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    import threading
+    import tempfile
+    import os
+
+    # load the environment variables and the AWS session defaults, only done once per server process
+    environment_defaults = init_environment()
+
+    # set defaults if they are not already set in environment variables
+    os.environ.setdefault('save_folder', environment_defaults['save_folder'])
+    os.environ.setdefault('profile_name', environment_defaults['profile_name'])  # Use retrieved or fallback profile name
+    os.environ.setdefault('region_name', environment_defaults['region_name'])
     os.environ.setdefault('max_tokens', '4096')
 
     # variables will use their respective values only if they weren't already set elsewhere
@@ -28,6 +188,12 @@ def model_evaluator():
     region_name = os.getenv("region_name")
     max_tokens = int(os.getenv("max_tokens"))        
 
+    # the cache policy for the evaluations, see evaluation_cache.py for what each policy does
+    cache_policy = st.sidebar.radio("Evaluation cache", CACHE_POLICIES)
+    # keep track of the cache hits and misses for this session
+    st.session_state.setdefault('cache_hits', 0)
+    st.session_state.setdefault('cache_misses', 0)
+
     # title of the streamlit app
     st.title(f""":rainbow[GenAI Model Evaluator]""")
     # default container that houses the document upload field, and model selection box
@@ -37,30 +203,16 @@ def model_evaluator():
         # the file upload field, the specific ui element that allows you to upload the file
         file = st.file_uploader('Upload a file', type=["pdf"], key="new")
         # the model selection box, the specific ui element that allows you to select multiple models
-        model_options = st.multiselect(
-            'Select the model(s) you want to compare',
-            ['anthropic.claude-instant-v1', 'anthropic.claude-v2', 'anthropic.claude-v2:1',
-            'anthropic.claude-3-haiku-20240307-v1:0',
-            'anthropic.claude-3-sonnet-20240229-v1:0',
-            'mistral.mistral-7b-instruct-v0:2',
-            'mistral.mixtral-8x7b-instruct-v0:1',
-            'mistral.mistral-large-2402-v1:0',
-            'meta.llama2-13b-chat-v1',
-            'meta.llama2-70b-chat-v1',
-            'meta.llama3-8b-instruct-v1:0',
-            'meta.llama3-70b-instruct-v1:0',
-            'cohere.command-text-v14',
-            'cohere.command-light-text-v14',
-            'amazon.titan-text-lite-v1',
-            'amazon.titan-text-express-v1',
-            'ai21.j2-mid-v1',
-            'ai21.j2-ultra-v1'
-            ])
+        model_options = st.multiselect('Select the model(s) you want to compare', MODEL_OPTIONS)
         # Setting placeholder text in the text box
         txt = st.text_area(
             "Document Summary Task",
             "Summarize this document in 2 sentences. ",
             )
+        # latency-optimized inference is only used for the selected models that support it, and the option is only
+        # shown if the installed botocore can request it
+        latency_optimized = latency_optimized_supported() and st.checkbox(
+            "Use latency-optimized inference", help="Supported models: " + ", ".join(sorted(LATENCY_OPTIMIZED_MODELS)))
         # A button used to trigger the start of a model evaluation job - One button for each job type
         short_form_summary = st.button("Evaluate Models")
         # if the button is clicked for Short form summarization...start the processing
@@ -74,129 +226,158 @@ def model_evaluator():
             elif len(model_options) < 1:
                 # send a warning message to the user that they need to select at least two models to compare
                 st.warning("Please select at least two models to compare")
-            elif (len(txt) / 2.5) > max_tokens:
-                st.error("You can't use more than {max_tokens} characters")
+            # count the tokens of the task prompt, instead of estimating them from the character count
+            elif len(_tokenizer().encode(txt)) > max_tokens:
+                st.error(f"You can't use more than {max_tokens} tokens")
             else:
-                # determine the path to temporarily save the PDF file that was uploaded
+                # determine the folder to temporarily save the PDF file that was uploaded
                 save_folder = os.getenv("save_folder")
-                # create a posix path of save_folder and the file name
-                save_path = Path(save_folder, file.name)
-                # write the uploaded PDF to the save_folder you specified
-                with open(save_path, mode='wb') as w:
-                    w.write(file.getvalue())
-                # once the save path exists...
-                if save_path:
-                    # write a success message saying the file has been successfully saved
-                    st.success(f'File {file.name} is successfully saved and Processing.')
-                    # running the summarization task, and outputting the results to the front end, that contains a
-                    # dataframe, the evaluation results, and the cost evaluation results
-                    st.success(f'Running Evaluations for  {len(model_options)} models.')
-                    results_df, evaluation_results, costs_eval_results, score_rubric_df = final_evaluator(save_path,
-                                                                                                        model_options, txt, max_tokens)
-                    st.success(f'Evaluations Completed')
-                    # Gather cost of the lowest cost model
-                    lowest_cost = round(results_df['Total Cost'].min(),2)
-                    # Gather name of lowest cost model
-                    lowest_cost_models = results_df[results_df['Total Cost'] == lowest_cost]['Model'].tolist()
-                    # Take the list of models name gathered above and cast it to a comma-separated string
-                    lowest_cost_models_str = ', '.join(lowest_cost_models)
-                    # Gather the cost of the highest cost model
-                    highest_cost = round(results_df['Total Cost'].max(),2)
-                    # if it is not the lowest cost option, it returns itself
-                    adjust_highest_cost = lambda x: 0 if x == lowest_cost else x
-                    # determines the differences between the lowest cost model and highest cost model
-                    adjusted_highest_cost = round(adjust_highest_cost(highest_cost),2)
-                    # Find the model with the lowest latency
-                    shortest_time_length = round(results_df['Time Length'].min(),2)
-                    # Find the model name of the model with the lowest latency
-                    shortest_time_length_models = results_df[results_df['Time Length'] == shortest_time_length][
-                        'Model'].tolist()
-                    # Cast the model name as a comma-seperated string
-                    shortest_time_length_models_str = ', '.join(shortest_time_length_models)
-                    # find the model with the highest latency
-                    highest_time = round(results_df['Time Length'].max(),2)
-                    # if it is not the lowest latency model, return itself
-                    adjust_highest_time = lambda x: 0 if x == shortest_time_length else x
-                    # identify the latency of the highest latency model
-                    adjusted_highest_time = round(adjust_highest_time(highest_time),2)
-                    # Calculate the highest score from the 'Summary Score' column in the DataFrame df
-                    highest_score = round(results_df['Summary Score'].max())
-                    # Select rows from the DataFrame where the 'Summary Score' is equal to the lowest cost
-                    # and extract the corresponding 'Model' values into a list
-                    highest_score_models = results_df[results_df['Summary Score'] == lowest_cost]['Model'].tolist()
-                    # Convert the list of lowest cost models to a comma-separated string
-                    highest_score_models_str = ', '.join(lowest_cost_models)
-                    # Calculate the lowest score from the 'Summary Score' column in the DataFrame df
-                    lowest_score = round(results_df['Summary Score'].min())
-                    # Define a lambda function to adjust the lowest score
-                    # It returns 0 if the input x is equal to the highest_score, otherwise it returns x
-                    adjust_lowest_score = lambda x: 0 if x == highest_score else x
-                    # Apply the adjust_highest_time function to the lowest_score and convert the result to an integer
-                    adjusted_lowest_score_str = int(adjust_lowest_score(lowest_score))
-                    # Header for model performance graphs
-                    st.subheader("Model Performance")
-                    # configure the streamlit front end to have 3 columns
-                    col1, col2, col3 = st.columns(3)
-                    # Display a metric in column 1 with a label indicating the lowest cost model(s) and their
-                    # corresponding cost(s) in ($/1000), Display the current lowest cost value, and the difference
-                    # between the adjusted highest cost and the lowest cost
-                    col1.metric(label=f"Lowest Cost Model ($/1000 docs):",
-                                value=lowest_cost, delta=round(adjusted_highest_cost - lowest_cost,2))
-                    # Display a metric in column 2 with a label indicating the fastest model(s) and their corresponding
-                    # time(s) in seconds, Display the current shortest time length value, and the difference between the
-                    # adjusted highest time and the shortest time length
-                    col2.metric(label=f"Fastest (secs)\n: {shortest_time_length_models_str}", value=shortest_time_length,
-                                delta=round(adjusted_highest_time - shortest_time_length,2))
-                    # Display a metric in column 3 with a label indicating the best result model(s) and their
-                    # corresponding score(s) in the range 0-5, Display the current highest score value,
-                    # and the difference between the highest score and the adjusted lowest score
-                    col3.metric(label=f"Best Results (0-5): \n {highest_score_models_str}", value=highest_score,
-                                delta=highest_score - adjusted_lowest_score_str)
-                    # display image containing a graph of the model evaluation results
-                    st.image('reports/graph.png')
-                    
-                    # display a table containing the model ID and the respective evaluation results
-                    st.write(results_df[['Model', 'Total Cost(1000)', 'Time Length', 'Summary Score', 'Input Cost',
-                                        'Output Cost', 'Character Count']])
-                    
-                    st.subheader("Model Invoke Responses")
-                    # display a table containing the model ID and the respective summary it generated
-                    st.write(results_df[['Model', 'Invoke Response']].style.set_properties(**{'white-space': 'pre-wrap'}))
-                    
-                    
-                    st.subheader("Model Performance Scores")
-                    # display scoring rubric
-                    st.image('reports/rubric_graph.png')
-                    
-                    st.write(score_rubric_df)
-                    # display in markdown a written summary of the cost evaluation results
-                    st.markdown(costs_eval_results)
-                    # removing the PDF that was temporarily saved to perform the summarization task
-                    os.remove(save_path)
-
-    
+                # create a uniquely named temporary file in the save_folder, so concurrent sessions do not overwrite
+                # each other's upload
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=save_folder) as temporary_file:
+                    save_path = Path(temporary_file.name)
+                try:
+                    # stream the uploaded PDF to the temporary file, hashing it on the way
+                    pdf_digest = save_upload(file, save_path)
+                    # the key of the evaluation in the cache, any change to the PDF, models, prompt, max tokens or
+                    # evaluator settings is a miss
+                    cache_key = evaluation_cache_key(pdf_digest, model_options, txt, max_tokens, latency_optimized)
+                    # look up the evaluation in the cache unless the policy skips reading it
+                    cached_evaluation = load_evaluation(cache_key) if cache_policy in ('enabled', 'replay') else None
+                    if cached_evaluation is not None:
+                        # count the cache hit and reuse the cached evaluation instead of invoking the models
+                        st.session_state.cache_hits += 1
+                        st.success(f'Loaded the evaluations for {len(model_options)} models from the cache.')
+                        results_df, evaluation_results, costs_eval_results, score_rubric_df = cached_evaluation
+                        # draw the graphs of the cached evaluation
+                        graph_fig = plot_model_comparisons(results_df)
+                        rubric_fig = plot_model_performance_comparisons(score_rubric_df)
+                    elif cache_policy == 'replay':
+                        # in replay mode the models are never invoked, so a miss ends the job
+                        st.session_state.cache_misses += 1
+                        st.error("This evaluation is not in the cache, change the cache policy to run it")
+                        return
+                    else:
+                        if cache_policy != 'disabled':
+                            st.session_state.cache_misses += 1
+                        # write a success message saying the file has been successfully saved
+                        st.success(f'File {file.name} is successfully saved and Processing.')
+                        # running the summarization task, and outputting the results to the front end, that contains a
+                        # dataframe, the evaluation results, and the cost evaluation results
+                        st.success(f'Running Evaluations for  {len(model_options)} models.')
+                        # extract the text of the PDF once, it is shared by every model and reused for the same PDF
+                        input_text_data = extract_text(pdf_digest.hexdigest(), cache_policy, save_path)
+                        # one placeholder per model, that shows its response while it is being generated
+                        placeholders = {model: st.empty() for model in model_options}
+                        # the models are invoked from worker threads, which need the script context to update the UI
+                        script_run_ctx = get_script_run_ctx()
+
+                        def show_streamed_response(model_id, partial_text):
+                            add_script_run_ctx(threading.current_thread(), script_run_ctx)
+                            # the cost analysis of the evaluator model is streamed after the models, to its own placeholder
+                            if model_id not in placeholders:
+                                placeholders[model_id] = st.empty()
+                            placeholders[model_id].info(f"**{model_id}**\n\n{partial_text}")
+
+                        # the models are evaluated in the same order whatever the cache policy, so the rows of the
+                        # results, the plots and the rubric do not change with it
+                        sorted_models = tuple(sorted(model_options))
+                        # write-only always invokes the models, so it skips the memoized run_eval like disabled does
+                        if cache_policy in ('disabled', 'write-only'):
+                            (results_df, evaluation_results, costs_eval_results, score_rubric_df, graph_fig,
+                             rubric_fig) = final_evaluator(
+                                input_text_data, list(sorted_models), txt, max_tokens, latency_optimized,
+                                show_streamed_response, get_bedrock_runtime(), cache_policy)
+                        else:
+                            # memoized on the cache key and shared by all sessions, so the same job is not invoked twice
+                            (results_df, evaluation_results, costs_eval_results, score_rubric_df, graph_fig,
+                             rubric_fig) = run_eval(
+                                cache_key, sorted_models, txt, max_tokens, latency_optimized,
+                                input_text_data, show_streamed_response, get_bedrock_runtime())
+                        # the full responses are shown in the results below
+                        for placeholder in placeholders.values():
+                            placeholder.empty()
+                        # none of the selected models could be evaluated, there are no results to store or show
+                        if results_df.empty:
+                            st.warning("None of the selected models can be evaluated, please select a text model")
+                            return
+                        # store the evaluation so the same job can be loaded from the cache next time
+                        if cache_policy in ('enabled', 'write-only'):
+                            save_evaluation(cache_key, results_df, evaluation_results, costs_eval_results, score_rubric_df)
+                        st.success(f'Evaluations Completed')
+                finally:
+                    # removing the PDF that was temporarily saved, even if the evaluation failed
+                    save_path.unlink(missing_ok=True)
+                # show the cache statistics of this session
+                st.sidebar.caption(f"Cache hits: {st.session_state.cache_hits} | "
+                                   f"Cache misses: {st.session_state.cache_misses}")
+                # use pyarrow backed columns and a categorical model column, which are faster to mask and render
+                results_df = results_df.convert_dtypes(dtype_backend="pyarrow")
+                results_df['Model'] = results_df['Model'].astype('category')
+                # Gather the cost, latency and score metrics of the evaluation
+                (lowest_cost, adjusted_highest_cost, shortest_time_length, shortest_time_length_models_str,
+                 adjusted_highest_time, highest_score, highest_score_models_str,
+                 adjusted_lowest_score_str) = summarize_results(results_df)
+                # Header for model performance graphs
+                st.subheader("Model Performance")
+                # configure the streamlit front end to have 3 columns
+                col1, col2, col3 = st.columns(3)
+                # Display a metric in column 1 with a label indicating the lowest cost model(s) and their
+                # corresponding cost(s) in ($/1000), Display the current lowest cost value, and the difference
+                # between the adjusted highest cost and the lowest cost
+                col1.metric(label=f"Lowest Cost Model ($/1000 docs):",
+                            value=lowest_cost, delta=round(adjusted_highest_cost - lowest_cost,2))
+                # Display a metric in column 2 with a label indicating the fastest model(s) and their corresponding
+                # time(s) in seconds, Display the current shortest time length value, and the difference between the
+                # adjusted highest time and the shortest time length
+                col2.metric(label=f"Fastest (secs)\n: {shortest_time_length_models_str}", value=shortest_time_length,
+                            delta=round(adjusted_highest_time - shortest_time_length,2))
+                # Display a metric in column 3 with a label indicating the best result model(s) and their
+                # corresponding score(s) in the range 0-5, Display the current highest score value,
+                # and the difference between the highest score and the adjusted lowest score
+                col3.metric(label=f"Best Results (0-5): \n {highest_score_models_str}", value=highest_score,
+                            delta=None if adjusted_lowest_score_str is None
+                            else highest_score - adjusted_lowest_score_str)
+                # display image containing a graph of the model evaluation results
+                st.pyplot(graph_fig)
+                
+                # display a table containing the model ID and the respective evaluation results
+                # reindex, as evaluations cached before the first token time was recorded do not have it
+                st.write(results_df.reindex(columns=['Model', 'Total Cost(1000)', 'Time Length', 'First Token Time',
+                                                     'Summary Score', 'Input Cost', 'Output Cost', 'Character Count']))
+                
+                st.subheader("Model Invoke Responses")
+                # display a table containing the model ID and the respective summary it generated
+                st.dataframe(results_df[['Model', 'Invoke Response']], use_container_width=True, hide_index=True,
+                             column_config={'Invoke Response': st.column_config.TextColumn(help='Model output', width='large')})
+                
+                
+                st.subheader("Model Performance Scores")
+                # display scoring rubric
+                st.pyplot(rubric_fig)
+                
+                st.write(score_rubric_df)
+                # display in markdown a written summary of the cost evaluation results
+                st.markdown(costs_eval_results)
+
+
 
 def rag_evaluator():
     import streamlit as st
     from pathlib import Path
     from knowledge_base_fetcher import fetch_knowledge_bases, get_knowledge_base
     from orchestrator import final_rag_evaluator
+    from evaluation_cache import save_upload
+    import tempfile
     import os
-    import boto3
-    from dotenv import load_dotenv
 
-    # load environment variables
-    load_dotenv()
+    # load the environment variables and the AWS session defaults, only done once per server process
+    environment_defaults = init_environment()
 
     # set defaults if they are not already set in environment variables
-    current_directory = os.getcwd()
-    default_region_name = boto3.DEFAULT_SESSION.region_name if boto3.DEFAULT_SESSION else 'us-east-1'
-    boto3.setup_default_session()
-    current_profile_name = boto3.DEFAULT_SESSION.profile_name
-
-    os.environ.setdefault('save_folder', current_directory)
-    os.environ.setdefault('profile_name', current_profile_name)  # Use retrieved or fallback profile name
-    os.environ.setdefault('region_name', default_region_name)
+    os.environ.setdefault('save_folder', environment_defaults['save_folder'])
+    os.environ.setdefault('profile_name', environment_defaults['profile_name'])  # Use retrieved or fallback profile name
+    os.environ.setdefault('region_name', environment_defaults['region_name'])
 
     # variables will use their respective values only if they weren't already set elsewhere
     save_folder = os.getenv("save_folder")
@@ -244,106 +425,106 @@ def rag_evaluator():
                 # send a warning message to the user that they need to select at least one knowledge bases to compare
                 st.warning("Please select at least one knowledge bases to compare")
             else:
-                # determine the path to temporarily save the CSV file that was uploaded
+                # determine the folder to temporarily save the CSV files that were uploaded
                 save_folder = os.getenv("save_folder")
-                # create a posix path of save_folder and the file name
-                save_path_1 = Path(save_folder, questionFile.name)
-                save_path_2 = Path(save_folder, answerFile.name)
-                # write the uploaded CSV to the save_folder you specified
-                with open(save_path_1, mode='wb') as w:
-                    w.write(questionFile.getvalue())
-                with open(save_path_2, mode='wb') as w:
-                    w.write(answerFile.getvalue())
-                # once the save path exists...
-                if save_path_1 and save_path_2:
-                    # write a success message saying the file has been successfully saved
+                # create uniquely named temporary files in the save_folder
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".csv", dir=save_folder) as temporary_file:
+                    save_path_1 = Path(temporary_file.name)
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".csv", dir=save_folder) as temporary_file:
+                    save_path_2 = Path(temporary_file.name)
+                try:
+                    # write the uploaded CSV to the save_folder you specified
+                    save_upload(questionFile, save_path_1)
+                    save_upload(answerFile, save_path_2)
+                    # running the accuracy task, that returns a dataframe, the evaluation results, and the cost
+                    # evaluation results
                     st.success(f'Files {questionFile.name} and {answerFile.name} are successfully saved and Processing.')
-                    # running the accuracy task, and outputting the results to the front end, that contains a
-                    # dataframe, the evaluation results, and the cost evaluation results
                     st.success(f'Running Evaluations for  {len(knowledge_base_options)} knowledge bases.')
-                    results_df, evaluation_results, costs_eval_results, score_rubric_df = final_rag_evaluator(save_path_1, save_path_2, 
-                                                                                                        knowledge_base_options)  
-                    st.success(f'Evaluations Completed')
-                    # Gather cost of the lowest cost model
-                    lowest_cost = round(results_df['Total Embedding Cost'].min(),8)
-                    # Gather name of lowest cost model
-                    lowest_cost_models = results_df[results_df['Total Embedding Cost'] == lowest_cost]['Model'].tolist()
-                    # Take the list of models name gathered above and cast it to a comma-separated string
-                    lowest_cost_models_str = ', '.join(lowest_cost_models)
-                    # Gather the cost of the highest cost model
-                    highest_cost = round(results_df['Total Embedding Cost'].max(),8)
-                    # if it is not the lowest cost option, it returns itself
-                    adjust_highest_cost = lambda x: 0 if x == lowest_cost else x
-                    # determines the differences between the lowest cost model and highest cost model
-                    adjusted_highest_cost = round(adjust_highest_cost(highest_cost),2)
-                    # Find the model with the lowest latency
-                    shortest_time_length = round(results_df['Time Length'].min(),2)
-                    # Find the model name of the model with the lowest latency
-                    shortest_time_length_models = results_df[results_df['Time Length'] == shortest_time_length][
-                        'Model'].tolist()
-                    # Cast the model name as a comma-seperated string
-                    shortest_time_length_models_str = ', '.join(shortest_time_length_models)
-                    # find the model with the highest latency
-                    highest_time = round(results_df['Time Length'].max(),2)
-                    # if it is not the lowest latency model, return itself
-                    adjust_highest_time = lambda x: 0 if x == shortest_time_length else x
-                    # identify the latency of the highest latency model
-                    adjusted_highest_time = round(adjust_highest_time(highest_time),2)
-                    # Calculate the highest score from the 'Score' column in the DataFrame df
-                    highest_score = round(results_df['Score'].max(), 2)
-                    # Select rows from the DataFrame where the 'Score' is equal to the lowest cost
-                    # and extract the corresponding 'Model' values into a list
-                    highest_score_models = results_df[results_df['Score'] == highest_score]['Model'].tolist()
-                    # Convert the list of lowest cost models to a comma-separated string
-                    highest_score_models_str = ', '.join(lowest_cost_models)
-                    # Calculate the lowest score from the 'Score' column in the DataFrame df
-                    lowest_score = round(results_df['Score'].min(), 2)
-                    # Define a lambda function to adjust the lowest score
-                    # It returns 0 if the input x is equal to the highest_score, otherwise it returns x
-                    adjust_lowest_score = lambda x: 0 if x == highest_score else x
-                    # Apply the adjust_highest_time function to the lowest_score and convert the result to an integer
-                    adjusted_lowest_score_str = adjust_lowest_score(lowest_score)
-                    # Header for model performance graphs
-                    st.subheader("Model Performance")
-                    # configure the streamlit front end to have 3 columns
-                    col1, col2, col3 = st.columns(3)
-                    # Display a metric in column 1 with a label indicating the lowest cost model(s) and their
-                    # corresponding cost(s) in ($/1000), Display the current lowest cost value, and the difference
-                    # between the adjusted highest cost and the lowest cost
-                    col1.metric(label=f"Lowest Cost Model:",
-                                value="{:.6f}".format(lowest_cost), delta=round(adjusted_highest_cost - lowest_cost,2))
-                    # Display a metric in column 2 with a label indicating the fastest model(s) and their corresponding
-                    # time(s) in seconds, Display the current shortest time length value, and the difference between the
-                    # adjusted highest time and the shortest time length
-                    col2.metric(label=f"Fastest (secs)\n: {shortest_time_length_models_str}", value=shortest_time_length,
-                                delta=round(adjusted_highest_time - shortest_time_length,2))
-                    # Display a metric in column 3 with a label indicating the best result model(s) and their
-                    # corresponding score(s) in the range 0-1, Display the current highest score value,
-                    # and the difference between the highest score and the adjusted lowest score
-                    col3.metric(label=f"Best Results (0-1): \n {highest_score_models_str}", value=highest_score,
-                                delta=round(highest_score - adjusted_lowest_score_str, 2))
-                    # display image containing a graph of the model evaluation results
-                    st.image('reports/graph.png')
-                    
-                    # display a table containing the model ID and the respective evaluation results
-                    st.write(results_df[['Model', 'Total Embedding Cost(1000)', 'Total LLM Cost(1000)', 'Time Length', 'Score',
-                                        'Embedding Character Count', 'LLM Character Count']])
-                    
-                    st.subheader("Model Invoke Responses")
-                    # display a table containing the model ID and the respective output it generated
-                    st.write(results_df[['Model', 'Invoke Response']].style.set_properties(**{'white-space': 'pre-wrap'}))
-                    
-                    
-                    st.subheader("Model Performance Scores")
-                    # display scoring rubric
-                    st.image('reports/rubric_graph.png')
-                    
-                    st.write(score_rubric_df)
-                    # display in markdown a written summary of the cost evaluation results
-                    st.markdown(costs_eval_results)
-                    # removing the PDF that was temporarily saved to perform the summarization task
-                    os.remove(save_path_1)
-                    os.remove(save_path_2)
+                    (results_df, evaluation_results, costs_eval_results, score_rubric_df, graph_fig,
+                     rubric_fig) = final_rag_evaluator(
+                        save_path_1, save_path_2, knowledge_base_options)
+                finally:
+                    # removing the CSVs that were temporarily saved, even if the evaluation failed
+                    save_path_1.unlink(missing_ok=True)
+                    save_path_2.unlink(missing_ok=True)
+                st.success(f'Evaluations Completed')
+                # use pyarrow backed columns and a categorical model column, which are faster to mask and render
+                results_df = results_df.convert_dtypes(dtype_backend="pyarrow")
+                results_df['Model'] = results_df['Model'].astype('category')
+                # Gather cost of the lowest cost model
+                lowest_cost = round(results_df['Total Embedding Cost'].min(),8)
+                # Gather name of lowest cost model, compared against the unrounded min like the highest score
+                # models below
+                lowest_cost_models = results_df[results_df['Total Embedding Cost'] ==
+                                                results_df['Total Embedding Cost'].min()]['Model'].tolist()
+                # Take the list of models name gathered above and cast it to a comma-separated string
+                lowest_cost_models_str = ', '.join(lowest_cost_models)
+                # Gather the cost of the highest cost model
+                highest_cost = round(results_df['Total Embedding Cost'].max(),8)
+                # if it is not the lowest cost option, it returns itself
+                adjusted_highest_cost = round(0 if highest_cost == lowest_cost else highest_cost, 2)
+                # Find the model with the lowest latency
+                shortest_time_length = round(results_df['Time Length'].min(),2)
+                # Find the model name of the model with the lowest latency, compared against the unrounded min
+                shortest_time_length_models = results_df[results_df['Time Length'] ==
+                                                         results_df['Time Length'].min()]['Model'].tolist()
+                # Cast the model name as a comma-seperated string
+                shortest_time_length_models_str = ', '.join(shortest_time_length_models)
+                # find the model with the highest latency
+                highest_time = round(results_df['Time Length'].max(),2)
+                # if it is not the lowest latency model, return itself
+                adjusted_highest_time = 0 if highest_time == shortest_time_length else highest_time
+                # Calculate the highest score from the 'Score' column in the DataFrame df
+                highest_score = round(results_df['Score'].max(), 2)
+                # Select rows from the DataFrame where the 'Score' is equal to the unrounded highest score, the
+                # RAGAS scores are not rounded, and extract the corresponding 'Model' values into a list
+                highest_score_models = results_df[results_df['Score'] == results_df['Score'].max()][
+                    'Model'].tolist()
+                # Convert the list of highest scoring models to a comma-separated string
+                highest_score_models_str = ', '.join(highest_score_models)
+                # Calculate the lowest score from the 'Score' column in the DataFrame df
+                lowest_score = round(results_df['Score'].min(), 2)
+                # if it is not the highest score, return itself
+                adjusted_lowest_score_str = 0 if lowest_score == highest_score else lowest_score
+                # Header for model performance graphs
+                st.subheader("Model Performance")
+                # configure the streamlit front end to have 3 columns
+                col1, col2, col3 = st.columns(3)
+                # Display a metric in column 1 with a label indicating the lowest cost model(s) and their
+                # corresponding cost(s) in ($/1000), Display the current lowest cost value, and the difference
+                # between the adjusted highest cost and the lowest cost
+                col1.metric(label=f"Lowest Cost Model:",
+                            value="{:.6f}".format(lowest_cost), delta=round(adjusted_highest_cost - lowest_cost,2))
+                # Display a metric in column 2 with a label indicating the fastest model(s) and their corresponding
+                # time(s) in seconds, Display the current shortest time length value, and the difference between the
+                # adjusted highest time and the shortest time length
+                col2.metric(label=f"Fastest (secs)\n: {shortest_time_length_models_str}", value=shortest_time_length,
+                            delta=round(adjusted_highest_time - shortest_time_length,2))
+                # Display a metric in column 3 with a label indicating the best result model(s) and their
+                # corresponding score(s) in the range 0-1, Display the current highest score value,
+                # and the difference between the highest score and the adjusted lowest score
+                col3.metric(label=f"Best Results (0-1): \n {highest_score_models_str}", value=highest_score,
+                            delta=round(highest_score - adjusted_lowest_score_str, 2))
+                # display image containing a graph of the model evaluation results
+                st.pyplot(graph_fig)
+                
+                # display a table containing the model ID and the respective evaluation results
+                st.write(results_df[['Model', 'Total Embedding Cost(1000)', 'Total LLM Cost(1000)', 'Time Length', 'Score',
+                                    'Embedding Character Count', 'LLM Character Count']])
+                
+                st.subheader("Model Invoke Responses")
+                # display a table containing the model ID and the respective output it generated
+                st.dataframe(results_df[['Model', 'Invoke Response']], use_container_width=True, hide_index=True,
+                             column_config={'Invoke Response': st.column_config.TextColumn(help='Model output', width='large')})
+                
+                
+                st.subheader("Model Performance Scores")
+                # display scoring rubric
+                st.pyplot(rubric_fig)
+                
+                st.write(score_rubric_df)
+                # display in markdown a written summary of the cost evaluation results
+                st.markdown(costs_eval_results)
 
 
 
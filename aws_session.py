@@ -0,0 +1,71 @@
+import os
+from functools import lru_cache
+import boto3
+from botocore.config import Config
+from dotenv import load_dotenv
+
+# Loading environment variables from a .env file, once for every module that creates an AWS client
+load_dotenv()
+
+# The configuration of every synchronous client, the connection pool is large enough for the models and evaluations
+# that are invoked in parallel, throttled calls are retried with adaptive backoff, and idle connections are kept alive
+CLIENT_CONFIG = Config(
+    max_pool_connections=64,
+    retries={'mode': 'adaptive', 'max_attempts': 8},
+    tcp_keepalive=True,
+    read_timeout=120,
+    connect_timeout=5,
+)
+
+
+def get_profile_name():
+    """
+    Returns the AWS profile name of the sessions, None uses the default credential chain of boto3.
+
+    :return: The profile_name set in the .env or the environment, or None.
+    """
+    return os.getenv("profile_name") or None
+
+
+def get_region_name():
+    """
+    Returns the AWS region name of the clients.
+
+    :return: The region_name set in the .env or the environment, defaults to us-east-1.
+    """
+    return os.getenv("region_name") or "us-east-1"
+
+
+@lru_cache(maxsize=1)
+def get_session():
+    """
+    Creates the boto3 session that every client of the application is created from. It is only created once, on
+    the first call, so the profile and region set by the app before the first call are used, and the credentials are
+    resolved once instead of the default session being replaced by each module.
+
+    :return: The shared boto3 Session.
+    """
+    return boto3.session.Session(profile_name=get_profile_name(), region_name=get_region_name())
+
+
+@lru_cache(maxsize=1)
+def get_aio_session():
+    """
+    Creates the aioboto3 session of the asynchronous clients, only once, see get_session. The clients are still opened
+    in each event loop, since they are bound to the loop they are opened in.
+
+    :return: The shared aioboto3 Session.
+    """
+    import aioboto3
+    return aioboto3.Session(profile_name=get_profile_name(), region_name=get_region_name())
+
+
+def create_client(service_name, config=CLIENT_CONFIG):
+    """
+    Creates a client of an AWS service from the shared session, in the region of the application.
+
+    :param service_name: The name of the AWS service, for example bedrock-runtime.
+    :param config: Optional. The botocore Config of the client. Defaults to CLIENT_CONFIG.
+    :return: The boto3 client.
+    """
+    return get_session().client(service_name=service_name, region_name=get_region_name(), config=config)
@@ -0,0 +1,288 @@
+import os
+import time
+import hashlib
+import shutil
+import logging
+import contextvars
+import orjson
+import pandas as pd
+from pathlib import Path
+from dotenv import load_dotenv
+
+# load environment variables
+load_dotenv()
+# configure the logger
+logger = logging.getLogger(__name__)
+# the folder the cached evaluations are written to, defaults to .cache in the current directory
+os.environ.setdefault('cache_folder', os.path.join(os.getcwd(), '.cache'))
+# the number of days a cached evaluator model response is reused, 0 turns the response cache off
+os.environ.setdefault('response_cache_days', '30')
+
+# the cache policies that can be selected in the UI
+#   enabled    - read cached evaluations, and write new evaluations to the cache
+#   replay     - only read cached evaluations, never invoke the models
+#   write-only - always invoke the models, and write the new evaluations to the cache
+#   disabled   - never read or write the cache
+CACHE_POLICIES = ('enabled', 'replay', 'write-only', 'disabled')
+# the cache policy of the evaluation running in the current context, it also applies to the cached evaluator model
+# responses. It is set by final_evaluator, and copied into the threads the evaluation runs in
+current_cache_policy = contextvars.ContextVar('cache_policy', default='enabled')
+
+
+class _HashingWriter:
+    """
+    A file wrapper that hashes the bytes as they are written to the file.
+    """
+
+    def __init__(self, file):
+        """
+        Initializes an instance of the _HashingWriter class.
+        :param file: The file object the bytes are written to.
+        """
+        self.file = file
+        self.digest = hashlib.sha256()
+
+    def write(self, chunk):
+        """
+        Hashes the chunk and writes it to the file.
+
+        :param chunk: The bytes to write.
+        :return: The number of bytes written.
+        """
+        self.digest.update(chunk)
+        return self.file.write(chunk)
+
+
+def save_upload(uploaded_file, save_path):
+    """
+    Streams an uploaded file to disk in 1MB chunks, and hashes it in the same pass.
+
+    :param uploaded_file: The file uploaded through streamlit.
+    :param save_path: The path the file is written to.
+    :return: The SHA256 hash object of the file contents.
+    """
+    # rewind the upload in case it was already read in a previous run of the script
+    uploaded_file.seek(0)
+    with open(save_path, mode='wb') as w:
+        writer = _HashingWriter(w)
+        # copy in chunks, so the upload is never copied into a second full bytes object
+        shutil.copyfileobj(uploaded_file, writer, 1024 * 1024)
+    return writer.digest
+
+
+def evaluation_cache_key(pdf_digest, models, prompt, max_tokens, latency_optimized=False):
+    """
+    Builds a deterministic key for an evaluation out of everything that changes its result, the inputs of the
+    evaluation and the evaluator settings of the .env.
+
+    :param pdf_digest: The SHA256 hash object of the PDF, as returned by save_upload.
+    :param models: The list of model ids that are evaluated, the order they were selected in does not matter.
+    :param prompt: The task prompt the models are evaluated on.
+    :param max_tokens: The max tokens the models are invoked with.
+    :param latency_optimized: Optional. Whether latency-optimized inference was used. Defaults to False.
+    :return: The SHA256 hex digest of the inputs (str).
+    """
+    # the evaluator settings of the .env change the scores and the cost report too, imported here as evaluation_steps
+    # imports this module
+    from evaluation_steps import EVALUATOR_MODEL_ID, use_fused_rubric, evaluation_batch_size, performance_narrative
+    # continue the hash of the PDF with the evaluation settings, without changing the hash of the PDF itself. The
+    # settings are hashed as one JSON array, so the boundary between two fields can not shift between evaluations
+    digest = pdf_digest.copy()
+    digest.update(orjson.dumps([sorted(models), prompt, str(max_tokens), bool(latency_optimized), EVALUATOR_MODEL_ID,
+                                use_fused_rubric, evaluation_batch_size, performance_narrative]))
+    return digest.hexdigest()
+
+
+def _cache_paths(key):
+    """
+    Returns the paths of the files an evaluation is cached in.
+
+    :param key: The key of the evaluation.
+    :return: A tuple of the results parquet path, the rubric parquet path and the text reports json path.
+    """
+    cache_folder = Path(os.getenv('cache_folder'))
+    return (cache_folder / f"{key}.parquet",
+            cache_folder / f"{key}-rubric.parquet",
+            cache_folder / f"{key}.json")
+
+
+def load_evaluation(key):
+    """
+    Loads a cached evaluation.
+
+    :param key: The key of the evaluation.
+    :return: A tuple of the results DataFrame, the evaluation results, the costs evaluation results and the scoring
+    rubric DataFrame, or None if the evaluation is not cached.
+    """
+    results_path, rubric_path, reports_path = _cache_paths(key)
+    # the reports file is written last, so an evaluation is only complete if it exists
+    if not reports_path.exists():
+        return None
+    try:
+        results_df = pd.read_parquet(results_path)
+        score_rubric_df = pd.read_parquet(rubric_path)
+        reports = orjson.loads(reports_path.read_bytes())
+    except Exception as e:
+        # a corrupted cache entry is treated as a miss
+        logger.warning(f"Could not read the cached evaluation {key}: {e}")
+        return None
+    return results_df, reports['evaluation_results'], reports['costs_eval_results'], score_rubric_df
+
+
+def save_evaluation(key, results_df, evaluation_results, costs_eval_results, score_rubric_df):
+    """
+    Writes an evaluation to the cache.
+
+    :param key: The key of the evaluation.
+    :param results_df: The DataFrame of model performance metrics and costs.
+    :param evaluation_results: The written summary of the evaluation results.
+    :param costs_eval_results: The written evaluation of the costs.
+    :param score_rubric_df: The DataFrame of the scoring rubric.
+    :return: None
+    """
+    results_path, rubric_path, reports_path = _cache_paths(key)
+    # make sure the cache folder exists
+    results_path.parent.mkdir(parents=True, exist_ok=True)
+    results_df.to_parquet(results_path, index=False)
+    score_rubric_df.to_parquet(rubric_path, index=False)
+    reports_path.write_bytes(orjson.dumps({'evaluation_results': evaluation_results,
+                                           'costs_eval_results': costs_eval_results}))
+
+
+def response_cache_key(model_id, body):
+    """
+    Builds the key of a single model response out of the model and the full request body.
+
+    :param model_id: The ID of the model that is invoked, so identical prompts to different models never collide.
+    :param body: The serialized request body (bytes), which includes every decoding parameter.
+    :return: The BLAKE2b hex digest of the model id and the body (str).
+    """
+    digest = hashlib.blake2b(model_id.encode(), digest_size=32)
+    digest.update(b"|")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _response_path(key):
+    """
+    Returns the path of the file a model response is cached in.
+
+    :param key: The key of the response, see response_cache_key.
+    :return: The path of the response json.
+    """
+    return Path(os.getenv('cache_folder')) / 'responses' / f"{key}.json"
+
+
+def _read_fresh(path):
+    """
+    Reads a cached file, if it was written less than response_cache_days ago.
+
+    :param path: The path of the cached file.
+    :return: The bytes of the file, or None if it is not cached, expired or the cache is turned off.
+    """
+    max_age_days = float(os.getenv('response_cache_days'))
+    if max_age_days <= 0:
+        return None
+    try:
+        if time.time() - path.stat().st_mtime > max_age_days * 24 * 60 * 60:
+            return None
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def _write_atomic(path, data):
+    """
+    Writes a file to the cache, unless the cache is turned off.
+
+    :param path: The path of the cached file.
+    :param data: The bytes to write.
+    :return: None
+    """
+    if float(os.getenv('response_cache_days')) <= 0:
+        return
+    # make sure the folder exists
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # write to a temporary file first, so a concurrent evaluation never reads a partially written file
+    temp_path = path.with_suffix(f".{os.getpid()}.{id(data)}.tmp")
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+
+
+def load_response(key):
+    """
+    Loads a cached model response, if it was cached less than response_cache_days ago.
+
+    :param key: The key of the response, see response_cache_key.
+    :return: The cached response, or None if it is not cached, expired, the response cache is turned off or the cache
+    policy does not read the cache.
+    """
+    if current_cache_policy.get() in ('write-only', 'disabled'):
+        return None
+    try:
+        data = _read_fresh(_response_path(key))
+        return None if data is None else orjson.loads(data)
+    except Exception as e:
+        # a corrupted cache entry is treated as a miss
+        logger.warning(f"Could not read the cached response {key}: {e}")
+        return None
+
+
+def save_response(key, response):
+    """
+    Writes a model response to the cache, unless the response cache is turned off or the cache policy is disabled.
+
+    :param key: The key of the response, see response_cache_key.
+    :param response: The response to cache, anything orjson can serialize.
+    :return: None
+    """
+    if current_cache_policy.get() == 'disabled':
+        return
+    _write_atomic(_response_path(key), orjson.dumps(response))
+
+
+def _text_path(pdf_sha256, extractor_tag):
+    """
+    Returns the path of the file the extracted text of a PDF is cached in.
+
+    :param pdf_sha256: The SHA256 hex digest of the PDF.
+    :param extractor_tag: The extractor and version the text is extracted with, see text_extraction_tag.
+    :return: The path of the text file.
+    """
+    # the tag is hashed, so it can not contain a character that is not valid in a file name
+    tag_digest = hashlib.sha256(extractor_tag.encode()).hexdigest()[:16]
+    return Path(os.getenv('cache_folder')) / 'texts' / f"{pdf_sha256}-{tag_digest}.txt"
+
+
+def load_text(pdf_sha256, extractor_tag):
+    """
+    Loads the cached extracted text of a PDF, it expires with the responses, see response_cache_days.
+
+    :param pdf_sha256: The SHA256 hex digest of the PDF.
+    :param extractor_tag: The extractor and version the text is extracted with, see text_extraction_tag.
+    :return: The extracted text, or None if it is not cached or the cache policy does not read the cache.
+    """
+    if current_cache_policy.get() in ('write-only', 'disabled'):
+        return None
+    try:
+        data = _read_fresh(_text_path(pdf_sha256, extractor_tag))
+        return None if data is None else data.decode('utf-8')
+    except Exception as e:
+        # a corrupted cache entry is treated as a miss
+        logger.warning(f"Could not read the cached text of {pdf_sha256}: {e}")
+        return None
+
+
+def save_text(pdf_sha256, extractor_tag, text):
+    """
+    Writes the extracted text of a PDF to the cache, unless the response cache is turned off or the cache policy is
+    disabled.
+
+    :param pdf_sha256: The SHA256 hex digest of the PDF.
+    :param extractor_tag: The extractor and version the text was extracted with, see text_extraction_tag.
+    :param text: The extracted text.
+    :return: None
+    """
+    if current_cache_policy.get() == 'disabled':
+        return
+    _write_atomic(_text_path(pdf_sha256, extractor_tag), text.encode('utf-8'))
@@ -1,134 +1,415 @@
-import boto3
 from dotenv import load_dotenv
 import logging
-import json
+import orjson
 import os
 import asyncio
-import aioboto3
+from aiobotocore.config import AioConfig
 import re
+import threading
+import contextvars
+from functools import lru_cache
+import pandas as pd
+from text_extractor_and_summarizer import (performance_config, get_bedrock_runtime, latency_optimized_supported,
+                                            StreamedText)
+from evaluation_cache import response_cache_key, load_response, save_response, current_cache_policy
+from aws_session import get_aio_session, get_region_name
 
 # Setting up a logger with default settings
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 # Load environment variables from the .env file into the environment
 load_dotenv()
-# Setting up the default boto3 session with a specified AWS profile name
-boto3.setup_default_session(profile_name=os.getenv("profile_name"))
-
-async def get_bedrock_client():
+# The Anthropic model that evaluates the summaries and the costs, it can be changed with evaluator_model_id in the .env
+EVALUATOR_MODEL_ID = os.getenv("evaluator_model_id") or "anthropic.claude-3-sonnet-20240229-v1:0"
+# Adding bedrock_latency_mode=optimized to the .env invokes the evaluator model with latency-optimized inference, the
+# setting is ignored when the evaluator model does not support it, see performance_config
+evaluator_latency_optimized = os.getenv("bedrock_latency_mode", "standard") == "optimized"
+# the installed botocore, which aiobotocore shares, rejects every judge call that passes the setting if it predates it
+if evaluator_latency_optimized and not latency_optimized_supported():
+    logger.warning("bedrock_latency_mode=optimized is ignored, it requires boto3/botocore 1.35.74 or later")
+    evaluator_latency_optimized = False
+# Adding use_fused_rubric=true to the .env evaluates every criterion in a single call to the evaluator model, instead
+# of one call per criterion
+use_fused_rubric = os.getenv("use_fused_rubric", "false").lower() == "true"
+# Adding evaluation_batch_size=<NUMBER> to the .env evaluates up to that many models' outputs in a single call to the
+# evaluator model, 0 evaluates each model on its own, see BatchEvaluator
+evaluation_batch_size = int(os.getenv("evaluation_batch_size", "0"))
+# Adding use_prompt_caching=true to the .env marks the system prompts of the evaluations as a cacheable prefix, so the
+# evaluations of the second and later models reuse it. Only the evaluator models that support prompt caching accept it
+use_prompt_caching = os.getenv("use_prompt_caching", "false").lower() == "true"
+# Adding performance_narrative=true to the .env has the evaluator model write the cost and performance analysis, instead
+# of calculating it from the results, see summarize_model_performance
+performance_narrative = os.getenv("performance_narrative", "false").lower() == "true"
+# The client configuration of the evaluations, the connection pool is large enough for the evaluations of several
+# models to run at the same time without waiting on a connection, and idle connections are kept alive to be reused
+BEDROCK_CLIENT_CONFIG = AioConfig(
+    max_pool_connections=64,
+    retries={'mode': 'adaptive', 'max_attempts': 8},
+    read_timeout=120,
+    connect_timeout=5,
+    connector_args={'keepalive_timeout': 12},
+)
+# The maximum number of evaluation requests in flight at once in the whole process, to stay under the Amazon Bedrock
+# quotas instead of being throttled and retried
+max_inflight = int(os.getenv("bedrock_max_inflight", "8"))
+# The event loop every evaluation runs on, in its own thread, so the requests of all the evaluated models share one
+# asyncio.Semaphore, see run_evaluation
+_evaluation_loop = None
+_evaluation_loop_lock = threading.Lock()
+
+
+def get_bedrock_client():
     """
-    Asynchronously creates and returns a client for interacting with the Bedrock Runtime service.
+    Creates a client for interacting with the Bedrock Runtime service.
 
     This function uses aioboto3, an asynchronous version of the AWS SDK for Python (Boto3), to create a client
-    for the Bedrock Runtime service. It retrieves the AWS profile name and region name from environment variables.
+    for the Bedrock Runtime service. It uses the shared aioboto3 session and the region name of aws_session.py.
+    The client is returned unopened, so the caller keeps it open with `async with` for as long as it is used.
 
     Returns:
-        aioboto3.client: A client object for interacting with the Bedrock Runtime service.
+        An aioboto3 client context manager for interacting with the Bedrock Runtime service.
     """
-    
-    if os.getenv("profile_name") is None:
-        os.environ["profile_name"] = "default"
-        os.environ["region_name"] = "us-east-1"
-    
-    # Create an aioboto3 session using the specified profile name
-    session = aioboto3.Session(profile_name=os.getenv("profile_name"))
-    # Asynchronously create a client for the Bedrock Runtime service
-    async with session.client(
+    # Create the client for the Bedrock Runtime service from the shared session, returning it from inside an
+    # `async with` would close it
+    return get_aio_session().client(
             service_name='bedrock-runtime',
-            region_name=os.getenv("region_name"),
+            region_name=get_region_name(),
+            config=BEDROCK_CLIENT_CONFIG,
+    )
 
-    ) as client:
-        return client
 
+@lru_cache(maxsize=1)
+def _inflight():
+    """
+    Returns the semaphore of the max_inflight slots of the process. It is created on first use on the evaluation loop,
+    the only loop it is used on.
 
-async def model_execution(client, user_prompt, system_prompt):
+    :return: The asyncio.Semaphore of the evaluation requests in flight.
     """
-    Asynchronously executes a model using specified prompts, provided by each evaluation function
-    and returns the score and evaluation summary.
-    :param client: An aioboto3 client object for invoking Amazon Bedrock and the specific model.
-    :param user_prompt: The user prompt used during model execution.
+    return asyncio.Semaphore(max_inflight)
+
+
+def _get_evaluation_loop():
+    """
+    Returns the event loop every evaluation runs on, it is started in a daemon thread on the first evaluation.
+
+    :return: The running event loop of the evaluations.
+    """
+    global _evaluation_loop
+    with _evaluation_loop_lock:
+        if _evaluation_loop is None:
+            _evaluation_loop = asyncio.new_event_loop()
+            threading.Thread(target=_evaluation_loop.run_forever, name="evaluations", daemon=True).start()
+    return _evaluation_loop
+
+
+async def _run_in_context(context, coroutine):
+    """
+    Awaits a coroutine with the context variables of the thread that submitted it, the task of the coroutine and the
+    tasks it gathers get a copy of them.
+
+    :param context: The context copied in the submitting thread.
+    :param coroutine: The coroutine to await.
+    :return: The result of the coroutine.
+    """
+    for variable, value in context.items():
+        variable.set(value)
+    return await coroutine
+
+
+def run_evaluation(coroutine):
+    """
+    Runs an evaluation coroutine on the evaluation loop, and waits for its result in the calling thread. The worker
+    thread of each model calls it, so the evaluations of every model run concurrently on the one loop, with at most
+    max_inflight requests in flight at once. The coroutine keeps the cache policy of the calling thread.
+
+    :param coroutine: The coroutine of the evaluation, for example evaluate_model_output_orchestrator.
+    :return: The result of the coroutine.
+    """
+    return asyncio.run_coroutine_threadsafe(_run_in_context(contextvars.copy_context(), coroutine),
+                                            _get_evaluation_loop()).result()
+
+
+async def _read_streamed_text(response, stop_tags=("</score>", "</thoughts>")):
+    """
+    Reads the text of a streamed Claude 3 Messages API response, and stops reading once every stop tag was generated.
+    :param response: The response of invoke_model_with_response_stream.
+    :param stop_tags: The closing tags that end the part of the output that is parsed.
+    :return: A tuple of the text generated until the last stop tag, or the whole text if a stop tag was never
+    generated, and the stop reason of the response, None when the reading stopped before the end of the response.
+    """
+    stream = response['body']
+    output_text = ""
+    stop_reason = None
+    remaining_tags = set(stop_tags)
+    async for event in stream:
+        chunk = orjson.loads(event['chunk']['bytes'])
+        # the message delta at the end of the response carries the stop reason
+        if chunk['type'] == 'message_delta':
+            stop_reason = chunk['delta'].get('stop_reason')
+            continue
+        # only the content deltas carry generated text, the other events carry the message and usage metadata
+        if chunk['type'] != 'content_block_delta':
+            continue
+        delta = chunk['delta'].get('text', '')
+        output_text += delta
+        # only search the new text, plus enough of the previous text to find a tag split between two deltas
+        tail = output_text[-(len(delta) + max(len(tag) for tag in stop_tags)):]
+        remaining_tags = {tag for tag in remaining_tags if tag not in tail}
+        if not remaining_tags:
+            # the score and thoughts are complete, stop reading the rest of the generation
+            stream.close()
+            break
+    return output_text, stop_reason
+
+
+# The placeholder of the user prompt in the prebuilt request bodies, see _request_body
+USER_PROMPT_PLACEHOLDER = "__USER_PROMPT__"
+# The maximum tokens an evaluation can generate, the output is only a short thought process and a score. The score is
+# generated after the thoughts, so the cap leaves room for the thoughts to finish
+EVALUATION_MAX_TOKENS = 1000
+# The task evaluation thinks through each of its generated criteria, so it gets more room
+TASK_EVALUATION_MAX_TOKENS = 2000
+
+
+def _system(system_prompt):
+    """
+    Returns the system field of an evaluation request body.
+    :param system_prompt: The system prompt of the evaluation.
+    :return: The system prompt, or a text block of it with a cache checkpoint when use_prompt_caching is set.
+    """
+    if use_prompt_caching:
+        # everything up to the end of the system prompt is the same for every evaluated model
+        return [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+    return system_prompt
+
+
+def _request_body(system_prompt, max_tokens=EVALUATION_MAX_TOKENS):
+    """
+    Serializes the request body of an evaluation once, with a placeholder in place of the user prompt.
     :param system_prompt: The system prompt for the model execution and unique to the specific evaluation function.
-    :return: A tuple containing the score of the evaluation and evaluation summary.
+    :param max_tokens: Optional. The maximum tokens the evaluation can generate. Defaults to EVALUATION_MAX_TOKENS.
+    :return: The JSON bytes of the request body, see model_execution for how the user prompt is spliced in.
     """
-    # Construct the content payload with user prompt
-    content = [{
-        "type": "text",
-        "text": user_prompt
-    }]
     # Construct the prompt object with model execution parameters, formatted for the Claue 3 Messages API
     prompt = {
         "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 10000,
+        "max_tokens": max_tokens,
         "temperature": 0,
-        "system": system_prompt,
+        "system": _system(system_prompt),
         "messages": [
             {
                 "role": "user",
-                "content": content
+                "content": [{
+                    "type": "text",
+                    "text": USER_PROMPT_PLACEHOLDER
+                }]
             }
         ]
     }
-    # Convert the prompt object to a JSON string
-    prompt = json.dumps(prompt)
-    # Invoke the model asynchronously with the provided prompt
-    response = await client.invoke_model(
-        body=prompt,
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-        accept="application/json",
-        contentType="application/json"
-    )
-    # Read the response body and parse it as JSON
-    response_body = await response['body'].read()
-    response_json = json.loads(response_body)
-    # Extract the output text from the response
-    output_text = response_json['content'][0]['text']
-    # Extract score and evaluation summary from the output text
-    score = parse_xml(output_text, "score").strip()
-    evaluation_summary = parse_xml(output_text, "thoughts").strip()
+    # Convert the prompt object to JSON bytes, invoke_model accepts the bytes as the body
+    return orjson.dumps(prompt)
+
+
+class EvalResult:
+    """
+    This class holds the result of an evaluation, the thoughts are only parsed out of the output when they are used.
+    """
+
+    def __init__(self, score, output_text="", thoughts=None):
+        """
+        Initializes an instance of the EvalResult class.
+        :param score: The score of the evaluation (0-5), or None if the model did not return a score, see score_value.
+        :param output_text: Optional. The full output text of the evaluation model, the thoughts are parsed out of it.
+        :param thoughts: Optional. The thought process of the evaluation model, when it was already parsed.
+        """
+        self.score = score
+        self._output_text = output_text
+        self._thoughts = thoughts
+
+    @property
+    def thoughts(self):
+        """
+        The thought process of the evaluation model for the score, parsed on first access.
+        """
+        if self._thoughts is None:
+            self._thoughts = parse_thoughts(self._output_text)
+        return self._thoughts
+
+
+async def model_execution(client, user_prompt, request_body, stream=True):
+    """
+    Asynchronously executes a model using specified prompts, provided by each evaluation function
+    and returns the score and evaluation summary.
+    :param client: An aioboto3 client object for invoking Amazon Bedrock and the specific model.
+    :param user_prompt: The user prompt used during model execution.
+    :param request_body: The prebuilt request body with the system prompt of the specific evaluation function,
+    see build_system_prompts.
+    :param stream: Optional. Stream the response and stop reading it once the score and thoughts were generated,
+    otherwise the whole response is read at once. Defaults to True.
+    :return: An EvalResult with the score of the evaluation and evaluation summary.
+    """
+    # Splice the user prompt into the request body, so the system prompt and source text are not serialized again.
+    # A placeholder in the source text can not match, since its quotes are escaped in the JSON.
+    prompt = request_body.replace(f'"{USER_PROMPT_PLACEHOLDER}"'.encode(), orjson.dumps(user_prompt), 1)
+    # Reuse the response of an identical request to the evaluator model, see evaluation_cache.py
+    cache_key = response_cache_key(EVALUATOR_MODEL_ID, prompt)
+    output_text = load_response(cache_key)
+    # a cached response is always complete, see below
+    cached = output_text is not None
+    if not cached:
+        # Wait for a free slot, the request holds its slot until the whole response was read
+        async with _inflight():
+            if stream:
+                # Invoke the model asynchronously with the provided prompt, and read the output text as it is generated
+                response = await client.invoke_model_with_response_stream(
+                    body=prompt,
+                    modelId=EVALUATOR_MODEL_ID,
+                    accept="application/json",
+                    contentType="application/json",
+                    **performance_config(EVALUATOR_MODEL_ID, evaluator_latency_optimized)
+                )
+                output_text, stop_reason = await _read_streamed_text(response)
+            else:
+                # Invoke the model asynchronously with the provided prompt
+                response = await client.invoke_model(
+                    body=prompt,
+                    modelId=EVALUATOR_MODEL_ID,
+                    accept="application/json",
+                    contentType="application/json",
+                    **performance_config(EVALUATOR_MODEL_ID, evaluator_latency_optimized)
+                )
+                # Read the response body and parse it as JSON
+                response_body = await response['body'].read()
+                response_json = orjson.loads(response_body)
+                # Extract the output text from the response
+                output_text = response_json['content'][0]['text']
+                stop_reason = response_json.get('stop_reason')
+    # Extract the score from the output text, the evaluation summary is extracted when it is used
+    score = score_value(parse_score(output_text))
+    # Only cache a complete evaluation, a response without a score or cut off by max_tokens is retried next time
+    if not cached and score is not None and stop_reason != 'max_tokens':
+        save_response(cache_key, output_text)
     # Return the score and evaluation summary
-    return score, evaluation_summary
+    return EvalResult(score, output_text)
 
 
-def parse_xml(xml, tag):
+@lru_cache(maxsize=32)
+def _tag_patterns(tag):
+    """
+    Compiles the regex patterns used to extract the value of a tag, once per tag.
+    :param tag: The tag whose value needs to be extracted.
+    :return: A tuple of the pattern that finds the tags and the pattern that strips the outermost tag.
+    """
+    # This pattern attempts to skip over any nested tags of the same type.
+    return (re.compile(f'<{tag}>(?:<[^/]*?>.*?</[^>]*?>|[^<]*?)+</{tag}>', re.DOTALL),
+            re.compile(f'^<{tag}>|</{tag}>$', re.DOTALL))
+
+
+def parse_xml(xml, tag, patterns=None):
+    """
+    Extract the value associated with a specific tag from XML-like content, with a linear scan of the content.
+    The regex based _parse_xml_regex is only used when the tag is repeated or nested inside itself.
+    :param xml: The XML-like content as a string.
+    :param tag: The tag whose value needs to be extracted.
+    :param patterns: Optional. The precompiled patterns of the tag, defaults to the patterns of _tag_patterns.
+    :return: The value associated with the specified tag or an empty string if the tag is not found.
+    """
+    open_tag, close_tag = f'<{tag}>', f'</{tag}>'
+    # Find the first opening tag and the last closing tag
+    start = xml.find(open_tag)
+    if start < 0:
+        return ""
+    end = xml.rfind(close_tag)
+    if end <= start:
+        return ""
+    content = xml[start + len(open_tag):end]
+    # A second opening tag means the tag is repeated or nested, which the regex handles
+    if open_tag in content:
+        return _parse_xml_regex(xml, tag, patterns)
+    return content.strip()
+
+
+def _parse_xml_regex(xml, tag, patterns=None):
     """
     Parse XML-like content to extract the value associated with a specific tag, handling one level of nested same tags.
     :param xml: The XML-like content as a string.
     :param tag: The tag whose value needs to be extracted.
+    :param patterns: Optional. The precompiled patterns of the tag, defaults to the patterns of _tag_patterns.
     :return: The value associated with the specified tag or an empty string if the tag is not found.
     """
     try:
-        # Construct a regex pattern to find content inside the specified tag,
-        # This pattern attempts to skip over any nested tags of the same type.
-        pattern = f'<{tag}>(?:<[^/]*?>.*?</[^>]*?>|[^<]*?)+</{tag}>'
+        # Get the compiled patterns to find content inside the specified tag and to strip the outermost tag
+        find_pattern, strip_pattern = patterns or _tag_patterns(tag)
         # Find the outermost tags first
-        matches = re.findall(pattern, xml, re.DOTALL)
+        matches = find_pattern.findall(xml)
         if matches:
             # If there are matches, strip the outermost tag and find again to handle nested same tags
             clean_matches = []
             for match in matches:
                 # Strip the outermost tag
-                content = re.sub(f'^<{tag}>|</{tag}>$', '', match, flags=re.DOTALL)
+                content = strip_pattern.sub('', match)
                 # Append cleaned content
                 clean_matches.append(content)
             return " ".join(clean_matches).strip()
         return ""
     except re.error as e:
         # Return an empty string if a regex error occurs
-        print(f"Regex error: {e}")
+        logger.debug(f"Regex error: {e}")
         return ""
 
 
-async def eval_model_accuracy(model, summary, source_text):
+# The patterns of the score and thoughts tags, which are parsed out of every evaluation, compiled on import
+SCORE_PATTERNS = (re.compile(r'<score>(?:<[^/]*?>.*?</[^>]*?>|[^<]*?)+</score>', re.DOTALL),
+                  re.compile(r'^<score>|</score>$', re.DOTALL))
+THOUGHTS_PATTERNS = (re.compile(r'<thoughts>(?:<[^/]*?>.*?</[^>]*?>|[^<]*?)+</thoughts>', re.DOTALL),
+                     re.compile(r'^<thoughts>|</thoughts>$', re.DOTALL))
+
+
+def parse_score(xml):
+    """
+    Extract the score of an evaluation from the evaluation model's output.
+    :param xml: The output of the evaluation model.
+    :return: The value of the score tag or an empty string if the tag is not found.
     """
-    Evaluates the accuracy of a model's summary based on a source text.
+    return parse_xml(xml, "score", SCORE_PATTERNS)
 
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
+
+# The number a score starts with, a score like 4.5 or 4/5 is read as 4.5 or 4, and the sign of a negative score is
+# kept so it is out of range
+SCORE_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def score_value(score):
     """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model accuracy
-    system_prompt = f"""
+    Reads the score of an evaluation leniently, the evaluator model does not always return a bare integer.
+    :param score: The score as returned by the evaluator model, a string or a number.
+    :return: The 0-5 score, an int unless it has a fraction, or None if it is missing or out of range.
+    """
+    if isinstance(score, (int, float)) and not isinstance(score, bool):
+        value = float(score)
+    else:
+        match = SCORE_NUMBER.search(str(score or ""))
+        if match is None:
+            return None
+        value = float(match.group())
+    # a NaN fails the comparison too
+    if not 0 <= value <= 5:
+        return None
+    return int(value) if value.is_integer() else value
+
+
+def parse_thoughts(xml):
+    """
+    Extract the thought process of an evaluation from the evaluation model's output.
+    :param xml: The output of the evaluation model.
+    :return: The value of the thoughts tag or an empty string if the tag is not found.
+    """
+    return parse_xml(xml, "thoughts", THOUGHTS_PATTERNS)
+
+
+# The system prompt template providing instructions, the source text, and evaluation criteria to evaluate model accuracy
+ACCURACY_SYSTEM_PROMPT = """
 As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
 Evaluate the AI's summarization of the <source_body> provide a grade based on Accuracy
 Evaluate the AI model's summary based on the provided <evaluation_criteria>
@@ -182,37 +463,10 @@ Make sure to only respond with a score of 0 through 5 for your response in <scor
 
 
 """
-    # Constructing the user prompt containing the model name and summary generated by the respective model to be evaluated
-    user_prompt = f"""
-<model>
-{model}
-</model>
 
-model's summary to be evaluated:
-<summary>
-{summary}
-</summary>
 
-"""
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
-    # Returning the result of model execution
-    return result
-
-
-async def eval_model_completeness(model, summary, source_text):
-    """
-    Evaluates the completeness of a model's summary based on a source text.
-
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model completeness
-    system_prompt = f"""
+# The system prompt template providing instructions, the source text, and evaluation criteria to evaluate model completeness
+COMPLETENESS_SYSTEM_PROMPT = """
 As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
 Evaluate the AI's summarization of the <source_body> provide a grade based on Completeness 
 Evaluate the AI model's summary based on the provided <evaluation_criteria>
@@ -266,37 +520,10 @@ Make sure to only respond with a score of 0 through 5 for your response in <scor
 
 
 """
-    # Constructing the user prompt containing the model name and summary generated by the respective model to be evaluated
-    user_prompt = f"""
-<model>
-{model}
-</model>
-
-model's summary to be evaluated:
-<summary>
-{summary}
-</summary>
-
-"""
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
-    # Returning the result of model execution
-    return result
-
 
-async def eval_model_flow(model, summary, source_text):
-    """
-    Evaluates the logical flow of a model's summary based on a source text.
 
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model flow
-    system_prompt = f"""
+# The system prompt template providing instructions, the source text, and evaluation criteria to evaluate model flow
+FLOW_SYSTEM_PROMPT = """
 As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
 Evaluate the AI's summarization of the <source_body> provide a grade based on Logical Flow 
 Evaluate the AI model's summary based on the provided <evaluation_criteria>
@@ -346,37 +573,10 @@ Make sure to only respond with a score of 0 through 5 for your response for <sco
 
 
 """
-    # Constructing the user prompt containing the model name and summary generated by the respective model to be evaluated
-    user_prompt = f"""
-<model>
-{model}
-</model>
 
-model's summary to be evaluated:
-<summary>
-{summary}
-</summary>
-
-"""
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
-    # Returning the result of model execution
-    return result
 
-
-async def eval_model_structure(model, summary, source_text):
-    """
-    Evaluates the structure of a model's summary based on a source text.
-
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model structure
-    system_prompt = f"""
+# The system prompt template providing instructions, the source text, and evaluation criteria to evaluate model structure
+STRUCTURE_SYSTEM_PROMPT = """
 As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
 Evaluate the AI's summarization of the <source_body> provide a grade based on Paragraph and Sentence Structure
 Evaluate the AI model's summary based on the provided <evaluation_criteria>
@@ -430,37 +630,10 @@ Make sure to only respond with a score of 0 through 5 for your response in <scor
 
 
 """
-    # Constructing the user prompt containing the model name and summary generated by the respective model to be evaluated
-    user_prompt = f"""
-<model>
-{model}
-</model>
-
-model's summary to be evaluated:
-<summary>
-{summary}
-</summary>
-
-"""
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
-    # Returning the result of model execution
-    return result
 
 
-async def eval_model_conciseness(model, summary, source_text):
-    """
-    Evaluates the conciseness of a model's summary based on a source text.
-
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model conciseness
-    system_prompt = f"""
+# The system prompt template providing instructions, the source text, and evaluation criteria to evaluate model conciseness
+CONCISENESS_SYSTEM_PROMPT = """
 As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
 Evaluate the AI's summarization of the <source_body> provide a grade based on Conciseness
 Evaluate the AI model's summary based on the provided <evaluation_criteria>
@@ -513,37 +686,10 @@ Return your score (0-5) in <score> xml tags
 Make sure to only respond with a score of 0 through 5 for your response in <score>, no other text, only the numerical score
 
 """
-    # Constructing the user prompt containing the model name and summary generated by the respective model to be evaluated
-    user_prompt = f"""
-<model>
-{model}
-</model>
-
-model's summary to be evaluated:
-<summary>
-{summary}
-</summary>
-
-"""
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
-    # Returning the result of model execution
-    return result
 
 
-async def eval_model_clarity(model, summary, source_text):
-    """
-    Evaluates the clarity of a model's summary based on a source text.
-
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model clarity
-    system_prompt = f"""
+# The system prompt template providing instructions, the source text, and evaluation criteria to evaluate model clarity
+CLARITY_SYSTEM_PROMPT = """
 As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
 Evaluate the AI's summarization of the <source_body> provide a grade based on Clarity
 Evaluate the AI model's summary based on the provided <evaluation_criteria>
@@ -594,37 +740,10 @@ Return your score (0-5) in <score> xml tags
 Make sure to only respond with a score of 0 through 5 for your response in <score>, no other text, only the numerical score
 
 """
-    # Constructing the user prompt containing the model name and summary generated by the respective model to be evaluated
-    user_prompt = f"""
-<model>
-{model}
-</model>
-
-model's summary to be evaluated:
-<summary>
-{summary}
-</summary>
-
-"""
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
-    # Returning the result of model execution
-    return result
-
 
-async def eval_model_objectivity(model, summary, source_text):
-    """
-    Evaluates the objectivity of a model's summary based on a source text.
 
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model objectivity
-    system_prompt = f"""
+# The system prompt template providing instructions, the source text, and evaluation criteria to evaluate model objectivity
+OBJECTIVITY_SYSTEM_PROMPT = """
 As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
 Evaluate the AI's summarization of the <source_body> provide a grade based on Objectivity
 Evaluate the AI model's summary based on the provided <evaluation_criteria>
@@ -674,37 +793,10 @@ Return your score (0-5) in <score> xml tags
 Make sure to only respond with a score of 0 through 5 for your response in <score>, no other text, only the numerical score
 
 """
-    # Constructing the user prompt containing the model name and summary generated by the respective model to be evaluated
-    user_prompt = f"""
-<model>
-{model}
-</model>
-
-model's summary to be evaluated:
-<summary>
-{summary}
-</summary>
-
-"""
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
-    # Returning the result of model execution
-    return result
-
 
-async def eval_model_tone(model, summary, source_text):
-    """
-    Evaluates the tone of a model's summary based on a source text.
 
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model tone
-    system_prompt = f"""
+# The system prompt template providing instructions, the source text, and evaluation criteria to evaluate model tone
+TONE_SYSTEM_PROMPT = """
 As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
 Evaluate the AI's summarization of the <source_body> provide a grade based on Tone Consistency 
 Evaluate the AI model's summary based on the provided <evaluation_criteria>
@@ -758,39 +850,10 @@ Return your score (0-5) in <score> xml tags
 Make sure to only respond with a score of 0 through 5 for your response in <score>, no other text, only the numerical score
 
 """
-    # Constructing the user prompt containing the model name and summary generated by the respective model to be evaluated
-    user_prompt = f"""
-<model>
-{model}
-</model>
-
-model's summary to be evaluated:
-<summary>
-{summary}
-</summary>
-
-"""
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
-    # Returning the result of model execution
-    return result
 
 
-async def eval_model_task(model, summary, source_text, task, evaluation_criteria, evaluation_grading):
-    """
-    Evaluates the task of a model's summary based on a source text.
-
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-
-
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model task
-    system_prompt = f"""
+# The system prompt template providing instructions, the source text, and evaluation criteria to evaluate model task
+TASK_SYSTEM_PROMPT = """
 As an AI evaluator, you will be provided the task/instructions that were given to an AI model, and the AI model's attempt to perform to perform that task
 Evaluate the how well the AI's summary followed the tasks in the <prompt_instructions> in the creation of the summary and provide a grade
 Use the provided <evaluation_criteria> to evaluate the AI model's attempt at a summary
@@ -829,8 +892,36 @@ Return your score (0-5) in <score> xml tags
 Make sure to only respond with a score of 0 through 5 for your response in <score>, no other text, only the numerical score
 
 """
-    # Constructing the user prompt containing the model name and summary generated by the respective model to be evaluated
-    user_prompt = f"""
+
+
+# The system prompt template of each evaluation criterion, in the order the criteria are reported
+SYSTEM_PROMPT_TEMPLATES = {
+    "accuracy": ACCURACY_SYSTEM_PROMPT,
+    "completeness": COMPLETENESS_SYSTEM_PROMPT,
+    "flow": FLOW_SYSTEM_PROMPT,
+    "structure": STRUCTURE_SYSTEM_PROMPT,
+    "conciseness": CONCISENESS_SYSTEM_PROMPT,
+    "clarity": CLARITY_SYSTEM_PROMPT,
+    "objectivity": OBJECTIVITY_SYSTEM_PROMPT,
+    "tone": TONE_SYSTEM_PROMPT,
+    "task": TASK_SYSTEM_PROMPT,
+}
+
+# The user prompt template containing the model name and summary generated by the respective model to be evaluated
+SUMMARY_USER_PROMPT = """
+<model>
+{model}
+</model>
+
+model's summary to be evaluated:
+<summary>
+{summary}
+</summary>
+
+"""
+
+# The user prompt template of the task evaluation, which evaluates the whole output of the model
+TASK_USER_PROMPT = """
 <model>
 {model}
 </model>
@@ -841,12 +932,481 @@ The model's output to be evaluated:
 </models_response_to_be_evaluated>
 
 """
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
-    # Returning the result of model execution
-    return result
+
+
+async def eval_criterion(client, criterion, model, summary, request_body):
+    """
+    Evaluates a model's summary on a single criterion, based on a source text.
+
+    :param client: An aioboto3 client object for invoking Amazon Bedrock, shared by all the evaluations of a summary.
+    :param criterion: The criterion that is evaluated, a key of SYSTEM_PROMPT_TEMPLATES.
+    :param model: The model being evaluated, specifically the model that generated the specific summary.
+    :param summary: The summary generated by the model, that is being evaluated.
+    :param request_body: The request body of the evaluation, with the system prompt, see build_system_prompts.
+    :return: An EvalResult with the score and evaluation summary.
+    """
+    # Constructing the user prompt containing the model name and summary generated by the respective model
+    user_prompt_template = TASK_USER_PROMPT if criterion == "task" else SUMMARY_USER_PROMPT
+    user_prompt = user_prompt_template.format(model=model, summary=summary)
+    # Executing the model asynchronously with the constructed prompts, on the client shared by all the evaluations
+    return await model_execution(client, user_prompt, request_body)
+
+
+async def evaluate_criteria(client, model_name, model_summary, system_prompts):
+    """
+    Evaluates a model's summary on every criterion concurrently, all the evaluations share the same client.
+
+    :param client: An aioboto3 client object for invoking Amazon Bedrock.
+    :param model_name: The name of the model being evaluated.
+    :param model_summary: The summary generated by the respective model.
+    :param system_prompts: The request bodies of the evaluations for the source text, see build_system_prompts.
+    :return: A dictionary of the EvalResult of each criterion.
+    """
+    if use_fused_rubric:
+        # Every criterion is evaluated by the single fused rubric call
+        return await eval_fused_rubric(client, model_name, model_summary, system_prompts[FUSED_RUBRIC])
+    # Each evaluation only waits on Amazon Bedrock, so gathering them takes about as long as the slowest one
+    results = await asyncio.gather(*(eval_criterion(client, criterion, model_name, model_summary,
+                                                    system_prompts[criterion])
+                                     for criterion in SYSTEM_PROMPT_TEMPLATES))
+    return dict(zip(SYSTEM_PROMPT_TEMPLATES, results))
+
+
+def _rubric_section(template):
+    """
+    Extracts the evaluation criteria and evaluation grading of a criterion out of its system prompt template.
+    :param template: The system prompt template of the criterion.
+    :return: The <evaluation_criteria> and <evaluation_grading> blocks of the template.
+    """
+    start = template.index("\n<evaluation_criteria>\n") + 1
+    end = template.index("</evaluation_grading>") + len("</evaluation_grading>")
+    return template[start:end]
+
+
+# The key of the fused rubric request body in the dictionary of build_system_prompts
+FUSED_RUBRIC = "rubric"
+# The maximum tokens of the fused rubric, it holds the thoughts of every criterion
+FUSED_RUBRIC_MAX_TOKENS = 4000
+# The rubric of every criterion but the task, which is generated for each run, taken from their system prompts
+FUSED_RUBRIC_SECTIONS = "".join(f'''
+<criterion name="{criterion}">
+{_rubric_section(template)}
+</criterion>
+''' for criterion, template in SYSTEM_PROMPT_TEMPLATES.items() if criterion != "task")
+# The tool the evaluator model records the fused rubric with, the thoughts come before the score of each criterion
+FUSED_RUBRIC_TOOL = {
+    "name": "emit_rubric",
+    "description": "Records the thought process and the 0-5 score of every evaluation criterion.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            criterion: {
+                "type": "object",
+                "properties": {
+                    "thoughts": {"type": "string"},
+                    "score": {"type": "integer", "minimum": 0, "maximum": 5},
+                },
+                "required": ["thoughts", "score"],
+            }
+            for criterion in SYSTEM_PROMPT_TEMPLATES
+        },
+        "required": list(SYSTEM_PROMPT_TEMPLATES),
+    },
+}
+
+
+def _fused_rubric_request_body(source_text, task, evaluation_criteria, evaluation_grading, tool=FUSED_RUBRIC_TOOL,
+                               max_tokens=FUSED_RUBRIC_MAX_TOKENS):
+    """
+    Serializes the request body of the fused rubric once, with a placeholder in place of the user prompt.
+
+    :param source_text: The original source text extracted from the pdfs.
+    :param task: The task/prompt the models were given.
+    :param evaluation_criteria: The evaluation criteria generated for the task, see dynamic_grading_criteria.
+    :param evaluation_grading: The grading scale generated for the task, see dynamic_grading_criteria.
+    :param tool: Optional. The tool the rubric is recorded with. Defaults to FUSED_RUBRIC_TOOL.
+    :param max_tokens: Optional. The maximum tokens of the rubric. Defaults to FUSED_RUBRIC_MAX_TOKENS.
+    :return: The JSON bytes of the request body, see eval_fused_rubric for how the user prompt is spliced in.
+    """
+    # The system prompt providing instructions, the source text, and the rubric of every criterion
+    system_prompt = f"""
+As an AI evaluator, you will be given a source body of text, the task/instructions that were given to an AI model, and the AI model's attempt to perform that task.
+Evaluate the AI model's output on each of the criteria in <criteria>, using only the <evaluation_criteria> of that criterion; every criterion is scored on its own.
+Respond with a score of 0-5 for each criterion using the details in its <evaluation_grading> as a guide
+Be fair but critical in your assessment 
+
+If asked to count the number of sentences or paragraphs, use the following rules:
+- A sentence should end with a period (.), exclamation mark (!), or question mark (?).
+- Decimal points (e.g., 1.5), colons (:), semi-colons (;), and commas (,) should not be considered as sentence terminators.
+
+<criteria>
+{FUSED_RUBRIC_SECTIONS}
+<criterion name="task">
+The task that was provided to the AI model:
+<prompt_instructions>
+{task}
+</prompt_instructions>
+
+<evaluation_criteria>
+{evaluation_criteria}
+</evaluation_criteria>
+
+<evaluation_grading>
+{evaluation_grading}
+</evaluation_grading>
+</criterion>
+</criteria>
+
+The source body of text that the AI model was given:
+<source_body>
+{source_text}
+</source_body>
+
+Record your thought process for scoring each criterion concisely, and its score (0-5), with the {tool["name"]} tool
+"""
+    prompt = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "temperature": 0,
+        "system": _system(system_prompt),
+        "tools": [tool],
+        "tool_choice": {"type": "tool", "name": tool["name"]},
+        "messages": [
+            {
+                "role": "user",
+                "content": [{
+                    "type": "text",
+                    "text": USER_PROMPT_PLACEHOLDER
+                }]
+            }
+        ]
+    }
+    return orjson.dumps(prompt)
+
+
+async def _invoke_rubric_response(client, prompt):
+    """
+    Invokes the evaluator model with a rubric request body, and returns its response.
+
+    :param client: An aioboto3 client object for invoking Amazon Bedrock.
+    :param prompt: The full request body (bytes), with the user prompt spliced in.
+    :return: The parsed response body (dict), see _tool_input for the input of the tool call.
+    """
+    # Reuse the response of an identical request to the evaluator model, see evaluation_cache.py
+    cache_key = response_cache_key(EVALUATOR_MODEL_ID, prompt)
+    response_json = load_response(cache_key)
+    if response_json is None:
+        async with _inflight():
+            response = await client.invoke_model(
+                body=prompt,
+                modelId=EVALUATOR_MODEL_ID,
+                accept="application/json",
+                contentType="application/json",
+                **performance_config(EVALUATOR_MODEL_ID, evaluator_latency_optimized)
+            )
+            response_json = orjson.loads(await response['body'].read())
+        _save_tool_response(cache_key, response_json)
+    return response_json
+
+
+async def _invoke_rubric_tool(client, prompt):
+    """
+    Invokes the evaluator model with a rubric request body, and returns the input of the tool it was forced to call.
+
+    :param client: An aioboto3 client object for invoking Amazon Bedrock.
+    :param prompt: The full request body (bytes), with the user prompt spliced in.
+    :return: The input of the tool call (dict), empty if the evaluator model did not call the tool.
+    """
+    # The rubric is the input of the tool call, the evaluator model is forced to call the tool
+    return _tool_input(await _invoke_rubric_response(client, prompt))
+
+
+def _tool_input(response_json):
+    """
+    Returns the input of the tool call of a Claude 3 Messages API response.
+
+    :param response_json: The parsed response body.
+    :return: The input of the tool call (dict), empty if the model did not call the tool.
+    """
+    return next((content['input'] for content in response_json['content'] if content['type'] == 'tool_use'), {})
+
+
+def _save_tool_response(cache_key, response_json):
+    """
+    Caches a response with a tool call, only when the tool was called with an input and the response was not cut off
+    by max_tokens, so an incomplete response is retried next time instead of being replayed from the cache.
+
+    :param cache_key: The key of the response, see response_cache_key.
+    :param response_json: The parsed response body.
+    :return: None
+    """
+    if _tool_input(response_json) and response_json.get('stop_reason') != 'max_tokens':
+        save_response(cache_key, response_json)
+
+
+def _rubric_results(rubric):
+    """
+    Converts the rubric recorded by the evaluator model into the EvalResult of each criterion.
+
+    :param rubric: The thoughts and score of each criterion (dict), as recorded with FUSED_RUBRIC_TOOL.
+    :return: A dictionary of the EvalResult of each criterion, a missing criterion gets a score of None.
+    """
+    results = {}
+    for criterion in SYSTEM_PROMPT_TEMPLATES:
+        evaluation = rubric.get(criterion) or {}
+        results[criterion] = EvalResult(score_value(evaluation.get('score')), thoughts=evaluation.get('thoughts', ''))
+    return results
+
+
+async def eval_fused_rubric(client, model, summary, request_body):
+    """
+    Evaluates a model's summary on every criterion in a single call to the evaluator model.
+
+    :param client: An aioboto3 client object for invoking Amazon Bedrock.
+    :param model: The model being evaluated, specifically the model that generated the specific summary.
+    :param summary: The summary generated by the model, that is being evaluated.
+    :param request_body: The request body of the fused rubric, see build_system_prompts.
+    :return: A dictionary of the EvalResult of each criterion.
+    """
+    user_prompt = TASK_USER_PROMPT.format(model=model, summary=summary)
+    prompt = request_body.replace(f'"{USER_PROMPT_PLACEHOLDER}"'.encode(), orjson.dumps(user_prompt), 1)
+    return _rubric_results(await _invoke_rubric_tool(client, prompt))
+
+
+# The key of the batch rubric request body in the dictionary of build_system_prompts
+BATCH_RUBRIC = "batch_rubric"
+# Fewer models than this are evaluated on their own, the batch only saves a call or two for them while the single
+# evaluations still run concurrently
+BATCH_EVALUATION_MIN_MODELS = 3
+# The maximum tokens of the batch rubric, the output limit of the Claude 3 models, the thoughts of every model and
+# criterion have to fit in it
+BATCH_RUBRIC_MAX_TOKENS = 4096
+# The tool the evaluator model records the rubric of several models with, one fused rubric per model
+BATCH_RUBRIC_TOOL = {
+    "name": "emit_rubrics",
+    "description": "Records the thought process and the 0-5 score of every evaluation criterion, for each model.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "evaluations": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"model": {"type": "string"}, **FUSED_RUBRIC_TOOL["input_schema"]["properties"]},
+                    "required": ["model"] + FUSED_RUBRIC_TOOL["input_schema"]["required"],
+                },
+            },
+        },
+        "required": ["evaluations"],
+    },
+}
+
+
+async def evaluate_models_batch(system_prompts, models):
+    """
+    Evaluates the summaries of several models on every criterion in a single call to the evaluator model, so the
+    source text and the rubric are only sent once for all of them.
+
+    :param system_prompts: The request bodies of the evaluations for the source text, see build_system_prompts.
+    :param models: A list of (model name, summary) tuples of the models being evaluated.
+    :return: A list with the final score, final summary and final scoring rubric of each model, in the same order.
+    """
+    # The outputs of every model in one user prompt, each evaluated on its own
+    user_prompt = f"Evaluate each of the following {len(models)} model outputs on its own, and record one evaluation " \
+                  f"per model in the same order\n" + "".join(TASK_USER_PROMPT.format(model=model, summary=summary)
+                                                             for model, summary in models)
+    prompt = system_prompts[BATCH_RUBRIC].replace(f'"{USER_PROMPT_PLACEHOLDER}"'.encode(), orjson.dumps(user_prompt), 1)
+    async with get_bedrock_client() as client:
+        response_json = await _invoke_rubric_response(client, prompt)
+        if response_json.get('stop_reason') == 'max_tokens':
+            # The rubrics of the batch did not fit in BATCH_RUBRIC_MAX_TOKENS, the last ones are cut off or missing,
+            # so every model of the batch is evaluated on its own instead
+            logger.warning(f"The batch rubric of {len(models)} models was cut off at {BATCH_RUBRIC_MAX_TOKENS} "
+                           f"tokens, evaluating the models one by one")
+            results = await asyncio.gather(*(evaluate_criteria(client, model, summary, system_prompts)
+                                             for model, summary in models))
+            return [_final_evaluation(model, summary, result) for (model, summary), result in zip(models, results)]
+    evaluations = _tool_input(response_json).get('evaluations') or []
+    # Match the evaluations to the models by name, falling back to their position if a name was not repeated exactly
+    by_model = {evaluation.get('model'): evaluation for evaluation in evaluations if isinstance(evaluation, dict)}
+    final_evaluations = []
+    for index, (model, summary) in enumerate(models):
+        evaluation = by_model.get(model)
+        if evaluation is None and index < len(evaluations) and isinstance(evaluations[index], dict):
+            evaluation = evaluations[index]
+        final_evaluations.append(_final_evaluation(model, summary, _rubric_results(evaluation or {})))
+    return final_evaluations
+
+
+class BatchEvaluator:
+    """
+    This class collects the summaries of the models evaluated at the same time, from their worker threads, and
+    evaluates them in batches of evaluation_batch_size with evaluate_models_batch.
+    """
+
+    def __init__(self, system_prompts, model_count, batch_size=None):
+        """
+        Initializes an instance of the BatchEvaluator class.
+        :param system_prompts: The request bodies of the evaluations for the source text, see build_system_prompts.
+        :param model_count: The number of models that will be evaluated.
+        :param batch_size: Optional. The maximum number of models in a batch. Defaults to evaluation_batch_size.
+        """
+        self.system_prompts = system_prompts
+        self.remaining = model_count
+        self.batch_size = batch_size or evaluation_batch_size
+        self.pending = []
+        self.added = set()
+        self.results = {}
+        self.condition = threading.Condition()
+
+    def _take_batch(self):
+        """
+        Takes the pending summaries out as one batch, once the batch is full or no other summary will arrive. It is
+        called with the condition held.
+
+        :return: The list of (model name, summary) tuples of the batch, empty if the batch is not ready.
+        """
+        if len(self.pending) < self.batch_size and len(self.pending) < self.remaining:
+            return []
+        batch, self.pending = self.pending, []
+        self.remaining -= len(batch)
+        return batch
+
+    def _evaluate_batch(self, batch):
+        """
+        Evaluates a batch without holding the condition, so the next batch can be collected in the meantime, and
+        wakes the threads waiting on it.
+
+        :param batch: The list of (model name, summary) tuples of the batch.
+        """
+        try:
+            final_evaluations = run_evaluation(evaluate_models_batch(self.system_prompts, batch))
+        except Exception as e:
+            # every model of the batch fails with the error of the call
+            final_evaluations = [e] * len(batch)
+        with self.condition:
+            for (model, summary), final_evaluation in zip(batch, final_evaluations):
+                self.results[model] = final_evaluation
+            self.condition.notify_all()
+
+    def evaluate(self, model_name, model_summary):
+        """
+        Adds a model's summary to the next batch, and waits until the batch is evaluated.
+
+        :param model_name: The name of the model being evaluated.
+        :param model_summary: The summary generated by the respective model.
+        :return: A tuple containing the final score, final summary and final scoring rubric of the model.
+        """
+        with self.condition:
+            self.pending.append((model_name, model_summary))
+            self.added.add(model_name)
+            batch = self._take_batch()
+        # the thread that completes a batch evaluates it, the other threads of the batch wait for the results
+        if batch:
+            self._evaluate_batch(batch)
+        with self.condition:
+            self.condition.wait_for(lambda: model_name in self.results)
+            final_evaluation = self.results.pop(model_name)
+        if isinstance(final_evaluation, Exception):
+            raise final_evaluation
+        return final_evaluation
+
+    def discard(self, model_name):
+        """
+        Takes a model that failed or was skipped before its summary was added out of the count, so the last batch does
+        not wait on it. A model whose summary was added is left as it is.
+
+        :param model_name: The name of the model.
+        """
+        with self.condition:
+            if model_name in self.added:
+                return
+            self.added.add(model_name)
+            self.remaining -= 1
+            batch = self._take_batch()
+        if batch:
+            self._evaluate_batch(batch)
+
+
+def build_system_prompts(source_text, task, evaluation_criteria, evaluation_grading):
+    """
+    Builds the system prompts of every evaluation once for a document, so they are shared by all the evaluated models.
+    Each system prompt is serialized into its request body here, only the user prompt is added for each model.
+
+    :param source_text: The original source text extracted from the pdfs.
+    :param task: The task/prompt the models were given.
+    :param evaluation_criteria: The evaluation criteria generated for the task, see dynamic_grading_criteria.
+    :param evaluation_grading: The grading scale generated for the task, see dynamic_grading_criteria.
+    :return: A dictionary of the request body (JSON bytes) of each evaluation, or of the fused rubric when
+    use_fused_rubric is set, and of the batch rubric when evaluation_batch_size is set.
+    """
+    if use_fused_rubric:
+        system_prompts = {FUSED_RUBRIC: _fused_rubric_request_body(source_text, task, evaluation_criteria,
+                                                                   evaluation_grading)}
+    else:
+        # format every template with all the values, str.format ignores the values a template does not use
+        system_prompts = {criterion: _request_body(template.format(source_text=source_text, task=task,
+                                                                   evaluation_criteria=evaluation_criteria,
+                                                                   evaluation_grading=evaluation_grading),
+                                                   TASK_EVALUATION_MAX_TOKENS if criterion == "task"
+                                                   else EVALUATION_MAX_TOKENS)
+                          for criterion, template in SYSTEM_PROMPT_TEMPLATES.items()}
+    if evaluation_batch_size > 0:
+        # The batches are evaluated with the fused rubric of every model in one tool call, the single evaluations
+        # are kept for the runs with too few models to batch
+        system_prompts[BATCH_RUBRIC] = _fused_rubric_request_body(source_text, task, evaluation_criteria,
+                                                                  evaluation_grading, BATCH_RUBRIC_TOOL,
+                                                                  BATCH_RUBRIC_MAX_TOKENS)
+    return system_prompts
+
+
+def _invoke_text(model_id, body, on_token=None):
+    """
+    Invokes a model on the shared synchronous client and returns its output text, identical requests are answered
+    from the response cache, see evaluation_cache.py. The response is streamed, so the text is decoded while the model
+    is still generating it.
+    :param model_id: The ID of the Anthropic model to invoke.
+    :param body: The serialized Claude 3 Messages API request body (bytes).
+    :param on_token: Optional. A callback called with the model ID and the text generated so far, see StreamedText.
+    :return: The output text of the model.
+    """
+    cache_key = response_cache_key(model_id, body)
+    output_text = load_response(cache_key)
+    if output_text is None:
+        response = get_bedrock_runtime().invoke_model_with_response_stream(
+            body=body, modelId=model_id, accept="application/json", contentType="application/json",
+            **performance_config(model_id, evaluator_latency_optimized))
+        # the deltas are collected in a list, and only joined for the throttled updates and once at the end
+        streamed_text = StreamedText(model_id, on_token)
+        stop_reason = None
+        for event in response['body']:
+            chunk = event.get('chunk')
+            if not chunk:
+                continue
+            chunk_body = orjson.loads(chunk['bytes'])
+            # the message delta at the end of the response carries the stop reason
+            if chunk_body['type'] == 'message_delta':
+                stop_reason = chunk_body['delta'].get('stop_reason')
+                continue
+            # only the content deltas carry generated text, the other events carry the message and usage metadata
+            if chunk_body['type'] != 'content_block_delta':
+                continue
+            streamed_text.append(chunk_body['delta'].get('text', ''))
+        output_text = streamed_text.finish()
+        # a response cut off by max_tokens is not cached, so it is generated again next time
+        if output_text and stop_reason != 'max_tokens':
+            save_response(cache_key, output_text)
+    elif on_token is not None:
+        # a cached response is passed to the callback in one piece
+        on_token(model_id, output_text)
+    return output_text
+
+
+# The default task of the UI and of final_evaluator, its grading criteria are kept for the life of the process, see
+# dynamic_grading_criteria
+DEFAULT_TASK = "Summarize this document in 2 sentences."
+# The evaluation criteria and grading of DEFAULT_TASK, None until they were generated
+_default_grading_criteria = None
 
 
 def dynamic_grading_criteria(task):
@@ -855,11 +1415,20 @@ def dynamic_grading_criteria(task):
 
     This method dynamically generates the grading criteria, system prompt, and user
     prompt based on the source text, to allow for evaluation of different aspects
-    of a summary beyond just accuracy.
+    of a summary beyond just accuracy. The criteria only depend on the task and are generated at temperature 0, so
+    the response is cached per task by _invoke_text, following the cache policy of the evaluation. The criteria of
+    DEFAULT_TASK are also kept in memory, so the default task is only sent to the evaluator model once per process,
+    unless the cache policy does not read the cache.
 
     :param task: The task/prompt that the user inputted in the UI in the "Document Summary Task" TextBox
     :return: A tuple containing the score and evaluation summary
     """
+    global _default_grading_criteria
+    # the UI default ends with a space, it is the same task
+    default_task = task.strip() == DEFAULT_TASK
+    if default_task and _default_grading_criteria is not None and \
+            current_cache_policy.get() not in ('write-only', 'disabled'):
+        return _default_grading_criteria
     # Constructing the system prompt providing the task that was given to the models. Using Few shot of the other task types to dynamically create an evaluation criteria
     system_prompt = f"""
 Your goal is to evaluate and compare an AI model's outputs/response
@@ -940,81 +1509,22 @@ This is the prompt/instructions that the models will be provided and that you wi
             }
         ]
     }
-    boto3.setup_default_session(profile_name=os.getenv("profile_name"))
-
-    prompt = json.dumps(prompt)
-    # get region name form env (or default to us-east-1 if it cant)
-    try:
-        region = os.getenv("region_name")
-    except:
-        region = "us-east-1"
-
-    # create Bedrock client
-    client = boto3.client('bedrock-runtime', region)
-    # Invoking the Amazon Bedrock and the Claude 3 Sonnet model with the constructed prompt
-    response = client.invoke_model(body=prompt, modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-                                   accept="application/json", contentType="application/json")
-    # Extracting and parsing the response from the AI model
-    response_body = json.loads(response.get('body').read())
-    response = response_body['content'][0]['text']
+    prompt = orjson.dumps(prompt)
+    # Invoking the Amazon Bedrock and the evaluator model with the constructed prompt
+    response = _invoke_text(EVALUATOR_MODEL_ID, prompt)
 
     eval_criteria = parse_xml(response, "evaluation_criteria").strip()
     eval_grading = parse_xml(response, "evaluation_grading").strip()
+    # keep the criteria of the default task, unless the response had none or the cache policy does not write the cache
+    if default_task and eval_criteria and eval_grading and current_cache_policy.get() != 'disabled':
+        _default_grading_criteria = eval_criteria, eval_grading
 
     # return the evaluation_criteria and evaluation_grading strings
     return eval_criteria, eval_grading
 
 
-async def evaluate_model_output_orchestrator(source_text_data, model_name, model_summary, task, dynamic_evaluation_criteria, scale):
-    """
-    Orchestrates the evaluation of model output across multiple evaluation criteria and calculates the final evaluation score.
-
-    :param source_text_data: The original source text data, extracted from the uploaded PDF.
-    :param model_name: The name of the model being evaluated.
-    :param model_summary: The summary generated by the respective model.
-    :return: A tuple containing the final score and a summary of all the evaluation results.
-    """
-    # Evaluate the model output asynchronously across multiple evaluation criteria
-    result = await asyncio.gather(eval_model_accuracy(model_name, model_summary, source_text_data),
-                                  eval_model_completeness(model_name, model_summary, source_text_data),
-                                  eval_model_flow(model_name, model_summary, source_text_data),
-                                  eval_model_structure(model_name, model_summary, source_text_data),
-                                  eval_model_conciseness(model_name, model_summary, source_text_data),
-                                  eval_model_clarity(model_name, model_summary, source_text_data),
-                                  eval_model_objectivity(model_name, model_summary, source_text_data),
-                                  eval_model_tone(model_name, model_summary, source_text_data),
-                                  eval_model_task(model_name, model_summary, source_text_data, task, dynamic_evaluation_criteria, scale))
-    # Extract individual evaluation scores and summaries from the result
-    model_accuracy_score, model_accuracy_summary = result[0]
-    model_completeness_score, model_completeness_summary = result[1]
-    model_flow_score, model_flow_summary = result[2]
-    model_structure_score, model_structure_summary = result[3]
-    model_conciseness_score, model_conciseness_summary = result[4]
-    model_clarity_score, model_clarity_summary = result[5]
-    model_objectivity_score, model_objectivity_summary = result[6]
-    model_tone_score, model_tone_summary = result[7]
-    model_task_score, model_task_summary = result[8]
-    # Construct a dictionary containing individual evaluation scores
-    final_score_rubric = {
-        "model_name": model_name,
-        "model_completeness_score": model_completeness_score,
-        "model_accuracy_score": model_accuracy_score,
-        "model_flow_score": model_flow_score,
-        "model_structure_score": model_structure_score,
-        "model_conciseness_score": model_conciseness_score,
-        "model_clarity_score": model_clarity_score,
-        "model_objectivity_score": model_objectivity_score,
-        "model_tone_score": model_tone_score,
-        "model_task_score": model_task_score
-    }
-    # Calculate the final score
-    final_score = (int(model_completeness_score) + int(model_accuracy_score) + int(model_flow_score) + int(
-        model_structure_score) +
-                   int(model_conciseness_score) + int(model_clarity_score) + int(model_objectivity_score) + int(
-                model_tone_score) + int(model_task_score)) / 9.0
-
-    # Construct a summary of the evaluation results
-    final_summary = f"""
+# The template of the written summary of a model's evaluation results, the values are filled in with format_map
+FINAL_SUMMARY_TEMPLATE = """
 Full Summary:
 {model_summary}
 ---------------------------------------------------------------------
@@ -1065,23 +1575,184 @@ Score: {model_task_score}
 Summary: {model_task_summary}
 ------------------------------------------------------------------------------------------------------------------------------------------------------------
     """
+
+
+# The criteria in the column order of the scoring rubric, completeness comes first as it always has in the reports
+RUBRIC_CRITERIA = ("completeness", "accuracy", "flow", "structure", "conciseness", "clarity", "objectivity", "tone",
+                   "task")
+
+
+def _final_evaluation(model_name, model_summary, result):
+    """
+    Calculates the final evaluation score of a model out of the evaluation of each criterion.
+
+    :param model_name: The name of the model being evaluated.
+    :param model_summary: The summary generated by the respective model.
+    :param result: A dictionary of the EvalResult of each criterion.
+    :return: A tuple containing the final score, final summary and final scoring rubric.
+    """
+    # Construct a dictionary containing individual evaluation scores, in the column order of the scoring rubric
+    final_score_rubric = {"model_name": model_name}
+    # a missing score is NaN, so it shows as missing rather than as a score
+    final_score_rubric.update({f"model_{criterion}_score": float("nan") if result[criterion].score is None
+                               else result[criterion].score for criterion in RUBRIC_CRITERIA})
+    # Calculate the final score, the average of the scores of the criteria that were scored
+    scores = [evaluation.score for evaluation in result.values() if evaluation.score is not None]
+    missing = [criterion for criterion, evaluation in result.items() if evaluation.score is None]
+    if missing:
+        logger.warning(f"The evaluator model did not score {', '.join(missing)} for {model_name}, they are left out of "
+                       f"its final score")
+    final_score = sum(scores) / len(scores) if scores else float("nan")
+
+    # Construct a summary of the evaluation results, from the score and thoughts of each criterion
+    summary_values = {"model_summary": model_summary}
+    for criterion, evaluation in result.items():
+        summary_values[f"model_{criterion}_score"] = "missing" if evaluation.score is None else evaluation.score
+        summary_values[f"model_{criterion}_summary"] = evaluation.thoughts
+    final_summary = FINAL_SUMMARY_TEMPLATE.format_map(summary_values)
     # Return the final score, final summary, and final scoring rubric
     return final_score, final_summary, final_score_rubric
 
-def evaluate_model_performance(csv_string, model_id="anthropic.claude-3-sonnet-20240229-v1:0"):
+
+async def evaluate_model_output_orchestrator(system_prompts, model_name, model_summary):
+    """
+    Orchestrates the evaluation of model output across multiple evaluation criteria and calculates the final evaluation score.
+
+    :param system_prompts: The request bodies of the evaluations for the source text, see build_system_prompts.
+    :param model_name: The name of the model being evaluated.
+    :param model_summary: The summary generated by the respective model.
+    :return: A tuple containing the final score and a summary of all the evaluation results.
+    """
+    # Open one client for the whole run, so every evaluation shares its connection pool instead of connecting again
+    async with get_bedrock_client() as client:
+        # Evaluate the model output asynchronously across multiple evaluation criteria
+        result = await evaluate_criteria(client, model_name, model_summary, system_prompts)
+    # Return the final score, final summary, and final scoring rubric
+    return _final_evaluation(model_name, model_summary, result)
+
+# The markdown of the calculated cost and performance analysis, see summarize_model_performance
+PERFORMANCE_REPORT_TEMPLATE = """
+### Model Performance Findings
+
+- **Least expensive:** {best_cost} ({lowest_cost:,.4f} USD per 1000 invocations)
+- **Most expensive:** {worst_cost} ({highest_cost:,.4f} USD per 1000 invocations)
+- **Fastest:** {best_speed} ({shortest_time:.2f} seconds)
+- **Slowest:** {worst_speed} ({longest_time:.2f} seconds)
+- **Best summary result:** {best_quality} (score {highest_score_text})
+- **Worst summary result:** {worst_quality} (score {lowest_score_text})
+
+The most expensive model costs {pct_cost_diff_text} more than the least expensive model, and the slowest model takes \
+{pct_time_diff_text} longer than the fastest model.
+
+**Overall:** {overall_text}
+"""
+# The overall finding of PERFORMANCE_REPORT_TEMPLATE, and the one used when none of the models were scored
+PERFORMANCE_REPORT_OVERALL = "{best_overall} has the highest summary score, with the lowest cost and then the shortest " \
+                             "time breaking ties."
+PERFORMANCE_REPORT_UNSCORED = "None of the models were scored, so there is no best model overall."
+
+
+def _percent_difference(lowest, highest):
+    """
+    Calculates how much larger the highest value is than the lowest value, in percent.
+    :param lowest: The lowest value.
+    :param highest: The highest value.
+    :return: The percent difference, rounded to 2 decimals, or None when the lowest value is 0.
+    """
+    return round(float((highest - lowest) / lowest * 100), 2) if lowest else None
+
+
+# The columns of the results the cost and performance findings are calculated from
+PERFORMANCE_REPORT_COLUMNS = ('Model', 'Total Cost(1000)', 'Time Length', 'Summary Score')
+# The columns of the knowledge base results the evaluator model analyzes in evaluate_rag_performance
+RAG_PERFORMANCE_REPORT_COLUMNS = ('Model', 'Total Embedding Cost(1000)', 'Total LLM Cost(1000)', 'Time Length', 'Score')
+
+
+def _performance_records(results_df, columns):
+    """
+    Converts the results to the compact JSON records the evaluator model analyzes, with only the columns of the
+    analysis. The responses of the models are left out, they are the largest part of the results and are not needed to
+    compare the costs, times and scores.
+
+    :param results_df: The DataFrame of the results.
+    :param columns: The columns of the analysis.
+    :return: A JSON string of a list of records, one per model, with the values rounded to 6 decimals.
+    """
+    return orjson.dumps(results_df[list(columns)].round(6).to_dict(orient='records')).decode()
+
+
+def summarize_model_performance(results_df):
+    """
+    Calculates the cost and performance findings of the evaluated models from the results, the same findings the
+    evaluator model is asked for in evaluate_model_performance, without invoking it.
+
+    :param results_df: The DataFrame of the results, with columns for 'Model', 'Total Cost(1000)', 'Time Length', and
+    'Summary Score'.
+    :return: A dictionary of the findings, best_cost, best_speed, best_quality, pct_cost_diff and pct_time_diff, and
+    of the markdown built from PERFORMANCE_REPORT_TEMPLATE.
+    """
+    # only the columns of the findings are used, the responses of the models are the largest part of the results
+    results_df = results_df[list(PERFORMANCE_REPORT_COLUMNS)]
+    costs, times, scores = results_df['Total Cost(1000)'], results_df['Time Length'], results_df['Summary Score']
+    # the min and max of every metric in a single aggregation, reused by every finding
+    metrics = results_df[list(PERFORMANCE_REPORT_COLUMNS[1:])].agg(['min', 'max'])
+    lowest_cost, highest_cost = metrics.at['min', 'Total Cost(1000)'], metrics.at['max', 'Total Cost(1000)']
+    shortest_time, longest_time = metrics.at['min', 'Time Length'], metrics.at['max', 'Time Length']
+    # the models without a score are left out of the score findings, the min and max already skip their NaN scores
+    lowest_score, highest_score = metrics.at['min', 'Summary Score'], metrics.at['max', 'Summary Score']
+    scored = not pd.isna(highest_score)
+
+    def models_at(column, value):
+        # every model that ties on a value is named, not only the first one
+        return ", ".join(results_df.loc[column == value, 'Model'].astype(str))
+
+    report = {
+        "best_cost": models_at(costs, lowest_cost),
+        "best_speed": models_at(times, shortest_time),
+        "best_quality": models_at(scores, highest_score) if scored else "n/a",
+        "pct_cost_diff": _percent_difference(lowest_cost, highest_cost),
+        "pct_time_diff": _percent_difference(shortest_time, longest_time),
+    }
+    if scored:
+        # the best model overall has the highest score, ties are broken by the lowest cost and then the shortest time,
+        # only the models with the highest score are sorted
+        best_overall = results_df[scores == highest_score].sort_values(['Total Cost(1000)', 'Time Length'])['Model']
+        overall_text = PERFORMANCE_REPORT_OVERALL.format(best_overall=best_overall.iloc[0])
+    else:
+        overall_text = PERFORMANCE_REPORT_UNSCORED
+    report["markdown"] = PERFORMANCE_REPORT_TEMPLATE.format(
+        worst_cost=models_at(costs, highest_cost), lowest_cost=lowest_cost, highest_cost=highest_cost,
+        worst_speed=models_at(times, longest_time), shortest_time=shortest_time, longest_time=longest_time,
+        worst_quality=models_at(scores, lowest_score) if scored else "n/a",
+        highest_score_text=f"{highest_score:.2f}" if scored else "n/a",
+        lowest_score_text=f"{lowest_score:.2f}" if scored else "n/a",
+        pct_cost_diff_text="n/a" if report["pct_cost_diff"] is None else f"{report['pct_cost_diff']}%",
+        pct_time_diff_text="n/a" if report["pct_time_diff"] is None else f"{report['pct_time_diff']}%",
+        overall_text=overall_text, **report)
+    return report
+
+
+def evaluate_model_performance(results_df, model_id=EVALUATOR_MODEL_ID, on_token=None, narrative=None):
     """
     Evaluates the performance of AI models based on provided CSV data.
 
-    :param csv_string: A string containing CSV data with columns for 'Total Cost(1000)', 'Time Length', and 'Summary Score'.
-    :param model_id: The ID of the model used for evaluation. Defaults to "anthropic.claude-3-sonnet-20240229-v1:0".
+    :param results_df: The DataFrame of the results, with columns for 'Total Cost(1000)', 'Time Length', and 'Summary Score'.
+    :param model_id: The ID of the model used for evaluation. Defaults to EVALUATOR_MODEL_ID.
+    :param on_token: Optional. A callback called with the model ID and the analysis generated so far.
+    :param narrative: Optional. Have the evaluator model write the analysis, instead of calculating it with
+    summarize_model_performance. Defaults to performance_narrative.
     :return: A string containing the analysis and findings of model performance based on the provided CSV data.
     """
-    # Constructing a prompt for the Amazon Bedrock Claude 3 Sonnet model to analyze the provided CSV data
+    if not (performance_narrative if narrative is None else narrative):
+        # The findings are minimums, maximums and percent differences, they are calculated without invoking a model
+        return summarize_model_performance(results_df)["markdown"]
+    # Constructing a prompt for the Amazon Bedrock Claude 3 Sonnet model to analyze the provided data, as compact
+    # JSON records of the analyzed columns, which take far fewer tokens than the full CSV
     prompt = f"""Human:
 
-    Given the following CSV data on AI model performance:
+    Given the following JSON data on AI model performance:
 
-    {csv_string}
+    {_performance_records(results_df, PERFORMANCE_REPORT_COLUMNS)}
 
     Please analyze the data and determine which model has the best performance in terms of cost efficiency and speed.
     
@@ -1117,40 +1788,32 @@ def evaluate_model_performance(csv_string, model_id="anthropic.claude-3-sonnet-2
             }
         ]
     }
-    boto3.setup_default_session(profile_name=os.getenv("profile_name"))
-    # Creating a boto3 client for interacting with the Bedrock Runtime service
-    client = boto3.client(
-        service_name='bedrock-runtime',
-        region_name=os.getenv("region_name")
-    )
-    # Invoking the Amazon Bedrock and the Claude 3 Sonnet model with the constructed prompt
-    response = client.invoke_model(
-        modelId=model_id, body=json.dumps(prompt)
-    )
-    # Extracting and parsing the response from the AI model
-    response_body = json.loads(response.get('body').read())
-    response = response_body['content'][0]['text']
+    # Invoking the Amazon Bedrock and the evaluator model with the constructed prompt
+    response = _invoke_text(model_id, orjson.dumps(prompt), on_token)
     # Returns a string containing the analysis and findings of model performance based on the provided CSV data.
     return response
 
-def evaluate_rag_performance(csv_string, model_id="anthropic.claude-3-sonnet-20240229-v1:0"):
+def evaluate_rag_performance(results_df, model_id=EVALUATOR_MODEL_ID, on_token=None):
     """
     Evaluates the performance of AI models based on provided CSV data.
 
-    :param csv_string: A string containing CSV data with columns for 'Total Cost(1000)', 'Time Length', and 'Summary Score'.
-    :param model_id: The ID of the model used for evaluation. Defaults to "anthropic.claude-3-sonnet-20240229-v1:0".
+    :param results_df: The DataFrame of the knowledge base results, with the columns of RAG_PERFORMANCE_REPORT_COLUMNS.
+    :param model_id: The ID of the model used for evaluation. Defaults to EVALUATOR_MODEL_ID.
+    :param on_token: Optional. A callback called with the model ID and the analysis generated so far.
     :return: A string containing the analysis and findings of model performance based on the provided CSV data.
     """
-    # Constructing a prompt for the Amazon Bedrock Claude 3 Sonnet model to analyze the provided CSV data
+    # Constructing a prompt for the Amazon Bedrock Claude 3 Sonnet model to analyze the provided data, as compact
+    # JSON records of the analyzed columns, which take far fewer tokens than the full CSV
     prompt = f"""Human:
 
-    Given the following CSV data on AI model performance:
+    Given the following JSON data on AI model performance:
 
-    {csv_string}
+    {_performance_records(results_df, RAG_PERFORMANCE_REPORT_COLUMNS)}
 
     Please analyze the data and determine which model has the best performance in terms of cost efficiency and speed.
     
-    'Total Cost(1000)' is the total cost in dollars for invoking the model 1000 times.
+    'Total Embedding Cost(1000)' is the total cost in dollars for 1000 embeddings of the questions.
+    'Total LLM Cost(1000)' is the total cost in dollars for invoking the model 1000 times.
     'Time Length' is the time to invoke the model.
     'Score' is the invoke response quality score.
 
@@ -1182,19 +1845,8 @@ def evaluate_rag_performance(csv_string, model_id="anthropic.claude-3-sonnet-202
             }
         ]
     }
-    boto3.setup_default_session(profile_name=os.getenv("profile_name"))
-    # Creating a boto3 client for interacting with the Bedrock Runtime service
-    client = boto3.client(
-        service_name='bedrock-runtime',
-        region_name=os.getenv("region_name")
-    )
-    # Invoking the Amazon Bedrock and the Claude 3 Sonnet model with the constructed prompt
-    response = client.invoke_model(
-        modelId=model_id, body=json.dumps(prompt)
-    )
-    # Extracting and parsing the response from the AI model
-    response_body = json.loads(response.get('body').read())
-    response = response_body['content'][0]['text']
+    # Invoking the Amazon Bedrock and the evaluator model with the constructed prompt
+    response = _invoke_text(model_id, orjson.dumps(prompt), on_token)
     # Returns a string containing the analysis and findings of model performance based on the provided CSV data.
     return response
 
@@ -1,51 +1,51 @@
-from dotenv import load_dotenv
-import boto3
-import os
 from botocore.exceptions import ClientError
+from cachetools.func import ttl_cache
 import logging
+from aws_session import create_client
 
-# Setting up a logger with default settings
-logger = logging.getLogger()
+# Setting up the logger of this module, instead of changing the level of the root logger for every library
+logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-# Loading environment variables from a .env file
-load_dotenv()
-
-if os.getenv("region_name") is None:
-    region_name = 'us-east-1'
-else:
-    region_name = os.getenv("region_name")
-    
-# Setting up the default boto3 session with a specified AWS profile name
-boto3.setup_default_session(profile_name=os.getenv("profile_name"))
-
-# Instantiating the Amazon Bedrock Runtime Client
-
-client = boto3.client(
-    service_name="bedrock-agent",region_name=region_name)
+# Instantiating the Amazon Bedrock Agent Client from the shared session, once for the module so its connections are
+# reused by every call
+client = create_client("bedrock-agent")
 
 # Define request headers, for Amazon Bedrock Model invocations
 accept = 'application/json'
 contentType = 'application/json'
 
-#function that fetches knowledge bases from bedrock api
+# The number of seconds the knowledge bases are cached for, streamlit re-runs the app on every interaction and the
+# knowledge bases rarely change
+KNOWLEDGE_BASE_CACHE_SECONDS = 300
+
+# generator of the knowledge base summaries, across every page of the list_knowledge_bases results
+def iter_knowledge_bases(page_size=100):
+    paginator = client.get_paginator('list_knowledge_bases')
+    for page in paginator.paginate(PaginationConfig={'PageSize': page_size}):
+        yield from page['knowledgeBaseSummaries']
+
+#function that fetches knowledge bases from bedrock api, every page of them, cached for KNOWLEDGE_BASE_CACHE_SECONDS
+@ttl_cache(maxsize=1, ttl=KNOWLEDGE_BASE_CACHE_SECONDS)
 def fetch_knowledge_bases():
     try:
-        response = client.list_knowledge_bases()
-
-        knowledge_base_summaries = response['knowledgeBaseSummaries']
-    except ClientError as e:
-        print(f"Couldn't list knowledge bases: {e}")
+        # a tuple, so the cached result can not be changed by the caller
+        knowledge_base_summaries = tuple(iter_knowledge_bases())
+    except ClientError:
+        logger.exception("Couldn't list knowledge bases")
         raise
     else:
         return knowledge_base_summaries
-    
+
+# function that fetches the details of a knowledge base, cached for KNOWLEDGE_BASE_CACHE_SECONDS, a failed call is
+# not cached
+@ttl_cache(maxsize=64, ttl=KNOWLEDGE_BASE_CACHE_SECONDS)
 def get_knowledge_base(knowledgeBaseId):
     try:
         response = client.get_knowledge_base(knowledgeBaseId=knowledgeBaseId)
 
         knowledge_base = response['knowledgeBase']
-    except ClientError as e:
-        print(f"Couldn't get knowledge base: {e}")
+    except ClientError:
+        logger.exception(f"Couldn't get knowledge base {knowledgeBaseId}")
         raise
     else:
         return knowledge_base
\ No newline at end of file
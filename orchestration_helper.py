@@ -1,16 +1,31 @@
+import operator
+
+
 class OrchestrationHelper:
     """
     This class is used to store the results of the orchestration, and format all the results.
     """
+    # the attributes are stored in slots instead of a per-instance __dict__, which makes every result smaller
+    __slots__ = ('model', 'time_length', 'character_count', 'char_process_time', 'input_cost', 'output_cost',
+                 'total_cost', 'total_cost_1000', 'final_score', 'summary_invoke_response', 'final_summary',
+                 'first_token_time')
+
+    # the column names of the formatted results, and a getter of the attributes they are read from in the same order
+    COLUMNS = ('Model', 'Time Length', 'First Token Time', 'Character Count', 'Char Process Time', 'Input Cost',
+               'Output Cost', 'Total Cost', 'Total Cost(1000)', 'Summary Score', 'Invoke Response')
+    _GETTER = operator.attrgetter('model', 'time_length', 'first_token_time', 'character_count', 'char_process_time',
+                                  'input_cost', 'output_cost', 'total_cost', 'total_cost_1000', 'final_score',
+                                  'summary_invoke_response')
 
     def __init__(self, model, time_length, character_count, char_process_time, input_cost, output_cost, total_cost, total_cost_1000,
-                 final_score, summary_invoke_response, final_summary):
+                 final_score, summary_invoke_response, final_summary, first_token_time=None):
         """
         Initializes an instance of the OrchestrationHelper class.
         :param model: The model being evaluated.
         :param time_length: The length of time it took to perform a summarization.
         :param character_count: The amount of characters of the source text.
-        :param char_process_time: How long it took to process a character.
+        :param char_process_time: The characters processed per second, the character count divided by the time
+        length. None when it is computed later for all the results at once.
         :param input_cost: The cost of the input tokens.
         :param output_cost: The cost of the output tokens.
         :param total_cost: The cost of the input tokens and output tokens.
@@ -18,6 +33,7 @@ class OrchestrationHelper:
         :param final_score: The final score of the models summary performance.
         :param summary_invoke_response: The summary provided from the model being tested.
         :param final_summary: The final summary of the models overall performance.
+        :param first_token_time: Optional. The length of time it took for the first token of the summary to arrive.
         """
         self.model = model
         self.time_length = time_length
@@ -30,6 +46,7 @@ class OrchestrationHelper:
         self.final_score = final_score
         self.summary_invoke_response = summary_invoke_response
         self.final_summary = final_summary
+        self.first_token_time = first_token_time
 
     def format(self):
         """
@@ -37,21 +54,16 @@ class OrchestrationHelper:
 
         :return: A dictionary containing the formatted results.
         """
-        # creating a dictionary of the results
-        result = {
-                'Model': self.model,
-                'Time Length': self.time_length,
-                'Character Count': self.character_count,
-                'Char Process Time': self.char_process_time,
-                'Input Cost': self.input_cost,
-                'Output Cost': self.output_cost,
-                'Total Cost': self.total_cost,
-                'Total Cost(1000)': self.total_cost_1000,
-                'Summary Score': self.final_score,
-                'Invoke Response': self.summary_invoke_response
-            }
-        # returning the final dictionary
-        return result
+        # pair the column names with the attributes, which are all read in one call
+        return dict(zip(self.COLUMNS, self._GETTER(self)))
+
+    def record(self):
+        """
+        Returns the results of the orchestration as a tuple, in the order of COLUMNS.
+
+        :return: A tuple containing the formatted results.
+        """
+        return self._GETTER(self)
 
     def evaluation_results(self):
         """
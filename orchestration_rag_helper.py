@@ -1,7 +1,26 @@
+import operator
+
+
 class OrchestrationRAGHelper:
     """
     This class is used to store the results of the orchestration, and format all the results.
     """
+    # the attributes are stored in slots instead of a per-instance __dict__, which makes every result smaller
+    __slots__ = ('model', 'time_length', 'embedding_character_count', 'llm_character_count', 'char_process_time',
+                 'input_embedding_cost', 'output_embedding_cost', 'total_embedding_cost', 'total_embedding_cost_1000',
+                 'input_llm_cost', 'output_llm_cost', 'total_llm_cost', 'total_llm_cost_1000', 'final_score',
+                 'summary_invoke_response', 'final_summary')
+
+    # the column names of the formatted results, and a getter of the attributes they are read from in the same order
+    COLUMNS = ('Model', 'Time Length', 'Embedding Character Count', 'LLM Character Count', 'Char Process Time',
+               'Input Embedding Cost', 'Output Embedding Cost', 'Total Embedding Cost', 'Total Embedding Cost(1000)',
+               'Input LLM Cost', 'Output LLM Cost', 'Total LLM Cost', 'Total LLM Cost(1000)', 'Score',
+               'Invoke Response')
+    _GETTER = operator.attrgetter('model', 'time_length', 'embedding_character_count', 'llm_character_count',
+                                  'char_process_time', 'input_embedding_cost', 'output_embedding_cost',
+                                  'total_embedding_cost', 'total_embedding_cost_1000', 'input_llm_cost',
+                                  'output_llm_cost', 'total_llm_cost', 'total_llm_cost_1000', 'final_score',
+                                  'summary_invoke_response')
 
     def __init__(self, model, time_length, embedding_character_count, llm_character_count, char_process_time, input_embedding_cost,
                  output_embedding_cost, total_embedding_cost, total_embedding_cost_1000, input_llm_cost,
@@ -13,7 +32,8 @@ class OrchestrationRAGHelper:
         :param time_length: The length of time it took to perform a retrieve and generate.
         :param embedding_character_count: The amount of characters going into the embedding model.
         :param llm_character_count: The amount of characters going into the llm.
-        :param char_process_time: How long it took to process a character.
+        :param char_process_time: The characters processed per second, the character count divided by the time
+        length. None when it is computed later for all the results at once.
         :param input_embedding_cost: The cost of the input embeddings.
         :param output_embedding_cost: The cost of the output embeddings.
         :param total_embedding_cost: The total cost of the embeddings.
@@ -49,26 +69,16 @@ class OrchestrationRAGHelper:
 
         :return: A dictionary containing the formatted results.
         """
-        # creating a dictionary of the results
-        result = {
-                'Model': self.model,
-                'Time Length': self.time_length,
-                'Embedding Character Count': self.embedding_character_count,
-                'LLM Character Count': self.llm_character_count,
-                'Char Process Time': self.char_process_time,
-                'Input Embedding Cost': self.input_embedding_cost, 
-                'Output Embedding Cost': self.output_embedding_cost,
-                'Total Embedding Cost': self.total_embedding_cost,
-                'Total Embedding Cost(1000)': self.total_embedding_cost_1000,
-                'Input LLM Cost': self.input_llm_cost,
-                'Output LLM Cost': self.output_llm_cost,
-                'Total LLM Cost': self.total_llm_cost,
-                'Total LLM Cost(1000)': self.total_llm_cost_1000,
-                'Score': self.final_score,
-                'Invoke Response': self.summary_invoke_response
-            }
-        # returning the final dictionary
-        return result
+        # pair the column names with the attributes, which are all read in one call
+        return dict(zip(self.COLUMNS, self._GETTER(self)))
+
+    def record(self):
+        """
+        Returns the results of the orchestration as a tuple, in the order of COLUMNS.
+
+        :return: A tuple containing the formatted results.
+        """
+        return self._GETTER(self)
 
     def evaluation_results(self):
         """
@@ -1,19 +1,21 @@
 import os
-import boto3
-from text_extractor_and_summarizer import (text_extraction, csv_extraction, text_formatter, invoke_anthropic, invoke_mistral, invoke_meta,
-                                           invoke_cohere,
-                                           invoke_amazon, invoke_AI21)
+import copy
+from text_extractor_and_summarizer import get_bedrock_runtime, csv_extraction, text_formatter, invoke, model_provider
 from orchestration_helper import OrchestrationHelper
 from orchestration_rag_helper import OrchestrationRAGHelper
 from pricing_calculator import calculate_total_price
-from evaluation_steps import evaluate_model_output_orchestrator, evaluate_model_performance, dynamic_grading_criteria, evaluate_rag_output, evaluate_rag_performance
-from plotting_and_reporting import write_evaluation_results, plot_model_comparisons, plot_model_performance_comparisons, plot_rag_comparisons, plot_rag_performance_comparisons
+from evaluation_steps import evaluate_model_output_orchestrator, evaluate_model_performance, dynamic_grading_criteria, evaluate_rag_output, evaluate_rag_performance, build_system_prompts, EVALUATOR_MODEL_ID, BatchEvaluator, evaluation_batch_size, BATCH_EVALUATION_MIN_MODELS, DEFAULT_TASK, run_evaluation
+from evaluation_cache import current_cache_policy
+from plotting_and_reporting import write_evaluation_results, plot_model_comparisons, plot_model_performance_comparisons, plot_rag_comparisons, plot_rag_performance_comparisons, flush_plots
 import logging
-from timeit import default_timer as timer
+from time import perf_counter_ns
 import pandas as pd
-from io import StringIO
+import numpy as np
+from pathlib import Path
 from dotenv import load_dotenv
-import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache, partial
 from AnthropicTokenCounter import AnthropicTokenCounter
 from langchain_aws import ChatBedrock
 from langchain_aws.embeddings import BedrockEmbeddings
@@ -48,17 +50,28 @@ load_dotenv()
 # logging setup
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-# Configuring the default AWS session using the provided profile name from environment variables.
-boto3.setup_default_session(profile_name=os.getenv("profile_name"))
-# Bedrock Runtime client used to invoke and question the models
-bedrock_runtime = boto3.client(
-    service_name='bedrock-runtime',
-    region_name=os.getenv("region_name")
-)
 
 
-llm_for_text_generation = ChatBedrock(model_id="anthropic.claude-3-sonnet-20240229-v1:0", client=bedrock_runtime) ##TODO update to allow user to select the model they want to use
-llm_for_evaluation = ChatBedrock(model_id="anthropic.claude-3-sonnet-20240229-v1:0", client=bedrock_runtime)
+@lru_cache(maxsize=1)
+def get_llm_for_text_generation():
+    """
+    Creates the model the knowledge bases answer the questions with, on the first RAG evaluation, so importing the
+    orchestrator does not create the Bedrock Runtime client.
+
+    :return: The ChatBedrock model.
+    """
+    ##TODO update to allow user to select the model they want to use
+    return ChatBedrock(model_id="anthropic.claude-3-sonnet-20240229-v1:0", client=get_bedrock_runtime())
+
+
+@lru_cache(maxsize=1)
+def get_llm_for_evaluation():
+    """
+    Creates the model RAGAS evaluates the answers of the knowledge bases with, see get_llm_for_text_generation.
+
+    :return: The ChatBedrock model.
+    """
+    return ChatBedrock(model_id="anthropic.claude-3-sonnet-20240229-v1:0", client=get_bedrock_runtime())
 
 metrics = [
         faithfulness,
@@ -76,272 +89,367 @@ metrics = [
     ]
 
 
-def final_evaluator(pdf_path, models, task_prompt="Summarize this document in 2 sentences.", max_tokens='4096'):
+# The background threads the reports are written to disk from, so the writes do not hold up the results
+_io_pool = ThreadPoolExecutor(max_workers=2)
+
+
+def _log_failure(report, future):
+    """
+    Logs the exception of a background write, nothing waits on its result to raise it.
+
+    :param report: The name of the report that was written, used in the log message.
+    :param future: The future of the background write.
+    """
+    if future.exception() is not None:
+        logger.error(f"Writing the {report} failed: {future.exception()}")
+
+
+def _write_in_background(report, function, *args):
+    """
+    Writes a report from a background thread, without waiting for it to be written.
+
+    :param report: The name of the report, used in the log message if the write fails.
+    :param function: The function that writes the report.
+    :param args: The arguments of the function.
+    :return: The future of the write, so a caller can wait for it.
+    """
+    future = _io_pool.submit(function, *args)
+    future.add_done_callback(partial(_log_failure, report))
+    return future
+
+
+def _analyze_in_background(function, *args):
+    """
+    Runs the cost and performance analysis in a thread of its own while the graphs are drawn, so it never queues
+    behind the report writes or the analyses of the other sessions. Its exception is raised by the result of the future.
+
+    :param function: The function of the analysis, evaluate_model_performance or evaluate_rag_performance.
+    :param args: The arguments of the function.
+    :return: The future of the analysis.
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cost-analysis")
+    try:
+        return executor.submit(function, *args)
+    finally:
+        # the thread exits once the analysis is done, nothing else is submitted to it
+        executor.shutdown(wait=False)
+
+
+class FirstTokenTimer:
+    """
+    This class is used as the on_token callback of a model invocation, to record the time to the first streamed token.
+    """
+
+    def __init__(self, on_token=None):
+        """
+        Initializes an instance of the FirstTokenTimer class, and starts the timer.
+        :param on_token: Optional. The callback the streamed text is forwarded to.
+        """
+        self.on_token = on_token
+        self.start = perf_counter_ns()
+        self.first_token_time = None
+
+    def __call__(self, model_id, partial_text):
+        """
+        Records the time of the first call, and forwards the streamed text.
+
+        :param model_id: The ID of the model that is generating the text.
+        :param partial_text: The text generated so far.
+        """
+        if self.first_token_time is None:
+            self.first_token_time = round((perf_counter_ns() - self.start) / 1e9, 2)
+        if self.on_token is not None:
+            self.on_token(model_id, partial_text)
+
+    def restart(self):
+        """
+        Restarts the timer, as the on_request callback of the invocation, so the time spent waiting for the rate
+        limit and building the prompt is not counted.
+        """
+        self.start = perf_counter_ns()
+
+    def time_length(self, total_time_length):
+        """
+        Returns the time to the first token.
+
+        :param total_time_length: The time the whole invocation took, used when no text was streamed.
+        :return: The time to the first token in seconds.
+        """
+        return total_time_length if self.first_token_time is None else self.first_token_time
+
+
+def evaluate_model(model, prompt, input_text_data, character_count, max_tokens, system_prompts,
+                   latency_optimized=False, on_token=None, client=None, evaluate=None):
+    """
+    Invoke a single model to perform the task and evaluate its response.
+
+    :param model: The model being evaluated.
+    :param prompt: The task the model is asked to perform.
+    :param input_text_data: The text extracted from the PDF.
+    :param character_count: The character count of the extracted text.
+    :param max_tokens: The maximum number of tokens the model can generate.
+    :param system_prompts: The system prompts the response is evaluated with, see build_system_prompts.
+    :param latency_optimized: Use latency-optimized inference for the models that support it.
+    :param on_token: Optional. A callback called with the model ID and the text generated so far.
+    :param client: Optional. The Amazon Bedrock Runtime client the model is invoked with.
+    :param evaluate: Optional. A function that evaluates the response of a model, called with the model and the
+    response, and returning the final score, final summary and scoring rubric. Defaults to evaluating the response
+    on its own with evaluate_model_output_orchestrator.
+    :return: A tuple containing the formatted results, the written evaluation results and the scoring rubric,
+    or None if the model does not belong to a supported provider.
+    """
+    if evaluate is None:
+        def evaluate(model_name, model_summary):
+            return run_evaluation(evaluate_model_output_orchestrator(system_prompts, model_name, model_summary))
+    # the provider of the model, the first provider in PROVIDERS that is part of the model id
+    provider = model_provider(model)
+    if provider is None:
+        # the model does not belong to a supported provider
+        return None
+    # The timer is restarted when the request is sent, after the rate limit wait, the first token timer also records
+    # when the first streamed text arrives
+    first_token_timer = FirstTokenTimer(on_token)
+    # Invoke the model with the request format of its provider, only the models that support it use latency-optimized
+    # inference, and get the generated summary, input tokens and output tokens
+    summary_invoke_response, input_token_count, output_token_count = invoke(
+        model, prompt, input_text_data, max_tokens, latency_optimized, first_token_timer, client, provider,
+        on_request=first_token_timer.restart)
+    # calculate total time taken since the request was sent, from the integer nanoseconds of the monotonic clock,
+    # rounded to the 2 decimals the time lengths are reported with
+    time_length = round((perf_counter_ns() - first_token_timer.start) / 1e9, 2)
+    # time taken to the first token, the whole invocation if the response was not streamed
+    first_token_time = first_token_timer.time_length(time_length)
+    # calculate costs for the model and the specific inference, specifically the input costs, output cost,
+    # total costs and total costs per 1000 invocations
+    input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
+                                                                                 output_token_count, model)
+    # evaluate the models performance against the grading rubric and return the final score, final summary
+    # and the scoring rubric
+    final_score, final_summary, final_score_rubric = evaluate(model, summary_invoke_response)
+    #  create a OrchestrationHelper object to store the results of the evaluation
+    # the total cost is reported for 1000 invocations, like the Total Cost(1000) column, and the characters per
+    # second are computed for all the models at once by final_evaluator
+    result = OrchestrationHelper(model, time_length, character_count, None, input_cost, output_cost,
+                                 total_cost * 1000, total_cost_1000, final_score, summary_invoke_response,
+                                 final_summary, first_token_time)
+    # return the results in the column order of OrchestrationHelper, the written summary and the scoring rubric
+    return result.record(), result.evaluation_results(), final_score_rubric
+
+
+def evaluate_model_in_batch(batch_evaluator, model, *args):
+    """
+    Invoke a single model to perform the task, and evaluate its response in a batch with the other models.
+
+    :param batch_evaluator: The BatchEvaluator shared by the models of the run.
+    :param model: The model being evaluated.
+    :param args: The other arguments of evaluate_model.
+    :return: The result of evaluate_model.
+    """
+    try:
+        return evaluate_model(model, *args, evaluate=batch_evaluator.evaluate)
+    finally:
+        # a model that failed or was skipped before it was evaluated no longer holds back the last batch
+        batch_evaluator.discard(model)
+
+
+def final_evaluator(input_text_data, models, task_prompt=DEFAULT_TASK, max_tokens='4096',
+                    latency_optimized=False, on_token=None, client=None, cache_policy='enabled'):
     """
     Evaluate multiple models for summarization and other evaluation metrics.
 
-    :param pdf_path: Path to the PDF file.
+    :param input_text_data: The text extracted from the PDF, see text_extraction.
     :param models: List of models to evaluate.
+    :param latency_optimized: Use latency-optimized inference for the models that support it.
+    :param on_token: Optional. A callback called with the model ID and the text generated so far, while each model
+    streams its response. It is called from the worker threads.
+    :param client: Optional. The Amazon Bedrock Runtime client the models are invoked with, defaults to the shared
+    client created on first use by get_bedrock_runtime.
+    :param cache_policy: Optional. The cache policy of the evaluation, see CACHE_POLICIES, it decides if the cached
+    evaluator model responses are read and written. Defaults to 'enabled'.
 
     :return: A tuple containing:
         - DataFrame: Evaluation results including model performance metrics and costs.
         - str: Summary of the evaluation results.
         - str: Evaluation of the costs for model selection.
         - DataFrame: Scoring rubric for the evaluated models.
+        - Figure: Graph of the cost, time and score comparisons.
+        - Figure: Graph of the scoring rubric.
+      When none of the models can be evaluated, the DataFrames are empty, the strings are empty and the graphs are None.
     """
-    # Extract the text out of the given PDF
-    input_text_data = text_extraction(pdf_path)
-    # Calculate the character count of the input text
+    # Calculate the character count of the input text, and cast it to a float once for the characters per second
     character_count = len(input_text_data)
+    character_count_f = float(character_count)
     # Create the prompt for the models to evaluate
     prompt = task_prompt
     # Initialize an empty list to store results for each model
     results_list = []
     # Initialize an empty list to store the scoring rubric for each model
     score_rubric_list = []
-    # Initialize an empty string to store the aggregated evaluation results
-    evaluation_results = ""
+    # Initialize an empty list to store the evaluation results written summary of each model, joined once at the end
+    evaluation_chunks = []
+    # each model is only invoked once, even if it was selected more than once, in the order it was first selected
+    unique_models = list(dict.fromkeys(models))
+    if len(unique_models) < len(models):
+        logger.info(f"Dropped {len(models) - len(unique_models)} duplicate model(s) from the evaluation")
+    # skip the models that can not be evaluated, the image and embedding models and the models that do not belong to
+    # a supported provider
+    models = [model for model in unique_models if not ("stability" in model or "embed" in model)
+              and model_provider(model) is not None]
+    if not models:
+        # nothing to grade, invoke, evaluate, analyze or plot
+        logger.warning("None of the selected models can be evaluated")
+        return pd.DataFrame(columns=OrchestrationHelper.COLUMNS), "", "", pd.DataFrame(), None, None
+    # the evaluator model responses are cached according to the cache policy, every thread the evaluation runs in
+    # gets its own copy of this context, see evaluation_cache.py
+    context = contextvars.copy_context()
+    context.run(current_cache_policy.set, cache_policy)
     #create dynamic grading critera for the prompt
-    dynamic_evaluation_criteria, dynamic_grading_scale = dynamic_grading_criteria(prompt)
-    # for each mode evaluate 
-    for model in models:
-        if "stability" in model or "embed" in model:
-            continue  # skips the current iteration and goes to the next model
-
-        if "anthropic" in model:
-            # Start timer
-            start = timer()
-            # Invoke the specific Anthropic model, and get the generated summary, input tokens and output tokens
-            summary_invoke_response, input_token_count, output_token_count = invoke_anthropic(model, prompt,
-                                                                                              input_text_data, max_tokens)
-            # end timer
-            end = timer()
-            # calculate total time taken
-            time_length = round(end - start, 2)
-            # calculate time taken per character
-            char_process_time = character_count / time_length
-            # calculate costs for the model and the specific inference, specifically the input costs, output cost,
-            # total costs and total costs per 1000 invocations
-            input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
-                                                                                         output_token_count, model)
-            # evaluate the models performance against the grading rubric and return the final score, final summary
-            # and the scoring rubric
-            final_score, final_summary, final_score_rubric = asyncio.run(
-                evaluate_model_output_orchestrator(input_text_data, model, summary_invoke_response, prompt,
-                                                   dynamic_evaluation_criteria, dynamic_grading_scale))
-            #  create a OrchestrationHelper object to store the results of the evaluation
-            result = OrchestrationHelper(model, time_length, character_count, char_process_time, input_cost,
-                                         output_cost,
-                                         total_cost, total_cost_1000, final_score, summary_invoke_response,
-                                         final_summary)
-            # add the results of the evaluation to the results list
-            results_list.append(result.format())
-            # add the evaluation results written summary to the evaluation results string
-            evaluation_results += result.evaluation_results()
-            # add the scoring rubric for the model into the scoring rubric list
-            score_rubric_list.append(final_score_rubric)
-
-        if "mistral" in model:
-            # Start timer
-            start = timer()
-            # Invoke the specific Mistral model, and get the generated summary, input tokens and output tokens
-            summary_invoke_response, input_token_count, output_token_count = invoke_mistral(model, prompt,
-                                                                                              input_text_data, max_tokens)
-            # end timer
-            end = timer()
-            # calculate total time taken
-            time_length = round(end - start, 2)
-            # calculate time taken per character
-            char_process_time = character_count / time_length
-            # calculate costs for the model and the specific inference, specifically the input costs, output cost,
-            # total costs and total costs per 1000 invocations
-            input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
-                                                                                         output_token_count, model)
-            # evaluate the models performance against the grading rubric and return the final score, final summary
-            # and the scoring rubric
-            final_score, final_summary, final_score_rubric = asyncio.run(
-                evaluate_model_output_orchestrator(input_text_data, model, summary_invoke_response, prompt,
-                                                   dynamic_evaluation_criteria, dynamic_grading_scale))
-            #  create a OrchestrationHelper object to store the results of the evaluation
-            result = OrchestrationHelper(model, time_length, character_count, char_process_time, input_cost,
-                                         output_cost,
-                                         total_cost, total_cost_1000, final_score, summary_invoke_response,
-                                         final_summary)
-            # add the results of the evaluation to the results list
-            results_list.append(result.format())
-            # add the evaluation results written summary to the evaluation results string
-            evaluation_results += result.evaluation_results()
-            # add the scoring rubric for the model into the scoring rubric list
-            score_rubric_list.append(final_score_rubric)
-
-        if "meta" in model:
-            # Start timer
-            start = timer()
-            # Invoke the specific Meta model, and get the generated summary, input tokens and output tokens
-            summary_invoke_response, input_token_count, output_token_count = invoke_meta(model, prompt,
-                                                                                              input_text_data, max_tokens)
-            # end timer
-            end = timer()
-            # calculate total time taken
-            time_length = round(end - start, 2)
-            # calculate time taken per character
-            char_process_time = character_count / time_length
-            # calculate costs for the model and the specific inference, specifically the input costs, output cost,
-            # total costs and total costs per 1000 invocations
-            input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
-                                                                                         output_token_count, model)
-            # evaluate the models performance against the grading rubric and return the final score, final summary
-            # and the scoring rubric
-            final_score, final_summary, final_score_rubric = asyncio.run(
-                evaluate_model_output_orchestrator(input_text_data, model, summary_invoke_response, prompt,
-                                                   dynamic_evaluation_criteria, dynamic_grading_scale))
-            #  create a OrchestrationHelper object to store the results of the evaluation
-            result = OrchestrationHelper(model, time_length, character_count, char_process_time, input_cost,
-                                         output_cost,
-                                         total_cost, total_cost_1000, final_score, summary_invoke_response,
-                                         final_summary)
-            # add the results of the evaluation to the results list
-            results_list.append(result.format())
-            # add the evaluation results written summary to the evaluation results string
-            evaluation_results += result.evaluation_results()
-            # add the scoring rubric for the model into the scoring rubric list
-            score_rubric_list.append(final_score_rubric)
-
-        if "cohere" in model:
-            # Start timer
-            start = timer()
-            # Invoke the specific Cohere model, and get the generated summary, input tokens and output tokens
-            summary_invoke_response, input_token_count, output_token_count = invoke_cohere(model, prompt,
-                                                                                              input_text_data,max_tokens)
-            # end timer
-            end = timer()
-            # calculate total time taken
-            time_length = round(end - start, 2)
-            # calculate time taken per character
-            char_process_time = character_count / time_length
-            # calculate costs for the model and the specific inference, specifically the input costs, output cost,
-            # total costs and total costs per 1000 invocations
-            input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
-                                                                                         output_token_count, model)
-            # evaluate the models performance against the grading rubric and return the final score, final summary
-            # and the scoring rubric
-            final_score, final_summary, final_score_rubric = asyncio.run(
-                evaluate_model_output_orchestrator(input_text_data, model, summary_invoke_response, prompt,
-                                                   dynamic_evaluation_criteria, dynamic_grading_scale))
-            #  create a OrchestrationHelper object to store the results of the evaluation
-            result = OrchestrationHelper(model, time_length, character_count, char_process_time, input_cost,
-                                         output_cost,
-                                         total_cost, total_cost_1000, final_score, summary_invoke_response,
-                                         final_summary)
-            # add the results of the evaluation to the results list
-            results_list.append(result.format())
-            # add the evaluation results written summary to the evaluation results string
-            evaluation_results += result.evaluation_results()
-            # add the scoring rubric for the model into the scoring rubric list
-            score_rubric_list.append(final_score_rubric)
-
-        if "amazon" in model:
-            # Start timer
-            start = timer()
-            # Invoke the specific Amazon model, and get the generated summary, input tokens and output tokens
-            summary_invoke_response, input_token_count, output_token_count = invoke_amazon(model, prompt,
-                                                                                              input_text_data,max_tokens)
-            # end timer
-            end = timer()
-            # calculate total time taken
-            time_length = round(end - start, 2)
-            # calculate time taken per character
-            char_process_time = character_count / time_length
-            # calculate costs for the model and the specific inference, specifically the input costs, output cost,
-            # total costs and total costs per 1000 invocations
-            input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
-                                                                                         output_token_count, model)
-            # evaluate the models performance against the grading rubric and return the final score, final summary
-            # and the scoring rubric
-            final_score, final_summary, final_score_rubric = asyncio.run(
-                evaluate_model_output_orchestrator(input_text_data, model, summary_invoke_response, prompt,
-                                                   dynamic_evaluation_criteria, dynamic_grading_scale))
-            #  create a OrchestrationHelper object to store the results of the evaluation
-            result = OrchestrationHelper(model, time_length, character_count, char_process_time, input_cost,
-                                         output_cost,
-                                         total_cost, total_cost_1000, final_score, summary_invoke_response,
-                                         final_summary)
-            # add the results of the evaluation to the results list
-            results_list.append(result.format())
-            # add the evaluation results written summary to the evaluation results string
-            evaluation_results += result.evaluation_results()
-            # add the scoring rubric for the model into the scoring rubric list
-            score_rubric_list.append(final_score_rubric)
-
-        if "ai21" in model:
-            # Start timer
-            start = timer()
-            # Invoke the specific AI21 model, and get the generated summary, input tokens and output tokens
-            summary_invoke_response, input_token_count, output_token_count = invoke_AI21(model, prompt,
-                                                                                              input_text_data, max_tokens)
-            # end timer
-            end = timer()
-            # calculate total time taken
-            time_length = round(end - start, 2)
-            # calculate time taken per character
-            char_process_time = character_count / time_length
-            # calculate costs for the model and the specific inference, specifically the input costs, output cost,
-            # total costs and total costs per 1000 invocations
-            input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
-                                                                                         output_token_count, model)
-            # evaluate the models performance against the grading rubric and return the final score, final summary
-            # and the scoring rubric
-            final_score, final_summary, final_score_rubric = asyncio.run(
-                evaluate_model_output_orchestrator(input_text_data, model, summary_invoke_response, prompt,
-                                                   dynamic_evaluation_criteria, dynamic_grading_scale))
-            #  create a OrchestrationHelper object to store the results of the evaluation
-            result = OrchestrationHelper(model, time_length, character_count, char_process_time, input_cost,
-                                         output_cost,
-                                         total_cost, total_cost_1000, final_score, summary_invoke_response,
-                                         final_summary)
-            # add the results of the evaluation to the results list
-            results_list.append(result.format())
-            # add the evaluation results written summary to the evaluation results string
-            evaluation_results += result.evaluation_results()
-            # add the scoring rubric for the model into the scoring rubric list
-            score_rubric_list.append(final_score_rubric)
-    # Setting the display to max column width
-    pd.set_option('display.max_colwidth', None)
+    dynamic_evaluation_criteria, dynamic_grading_scale = context.run(dynamic_grading_criteria, prompt)
+    # build the evaluation system prompts once for the document, they are the same for every model
+    system_prompts = build_system_prompts(input_text_data, prompt, dynamic_evaluation_criteria, dynamic_grading_scale)
+    # invoke and evaluate every model concurrently, the work is bound by the Bedrock round trips so the total time
+    # is close to the time of the slowest model instead of the sum of all the models
+    evaluations = [None] * len(models)
+    # with enough models, the responses are evaluated in batches instead of one by one, see BatchEvaluator
+    if evaluation_batch_size > 0 and len(models) >= BATCH_EVALUATION_MIN_MODELS:
+        evaluate_function = partial(evaluate_model_in_batch, BatchEvaluator(system_prompts, len(models)))
+    else:
+        evaluate_function = evaluate_model
+    with ThreadPoolExecutor(max_workers=max(len(models), 1)) as executor:
+        futures = {executor.submit(context.copy().run, evaluate_function, model, prompt, input_text_data,
+                                   character_count, max_tokens, system_prompts, latency_optimized, on_token,
+                                   client): index
+                   for index, model in enumerate(models)}
+        # keep the results in the same order as the selected models
+        for future in as_completed(futures):
+            evaluations[futures[future]] = future.result()
+    # for each evaluated model gather the results
+    for evaluation in evaluations:
+        if evaluation is None:
+            continue  # skips the models that do not belong to a supported provider
+        formatted_result, evaluation_result, final_score_rubric = evaluation
+        # add the results of the evaluation to the results list
+        results_list.append(formatted_result)
+        # add the evaluation results written summary to the evaluation results list
+        evaluation_chunks.append(evaluation_result)
+        # add the scoring rubric for the model into the scoring rubric list
+        score_rubric_list.append(final_score_rubric)
+    # join the evaluation results written summaries into a single string
+    evaluation_results = "".join(evaluation_chunks)
+    # Save the summary report to a file in the background
+    _write_in_background("summary report", write_evaluation_results, evaluation_results, "summary")
     # Convert scoring rubric list into a DataFrame
     score_rubric_df = pd.DataFrame(score_rubric_list)
-    # Display DataFrame  for scoring rubric
-    print(score_rubric_df)
-    # Convert performance and cost results list into a DataFrame
-    results_df = pd.DataFrame(results_list)
-    # Display DataFrame for results
-    print(results_df[['Model', 'Time Length', 'Total Cost', 'Summary Score']])
-    # Multiply Total Cost values by 1000 invocations
-    results_df['Total Cost'] *= 1000
+    # Convert performance and cost results list into a DataFrame, the records are already in column order
+    results_df = pd.DataFrame.from_records(results_list, columns=OrchestrationHelper.COLUMNS)
+    # calculate the characters processed per second of every model in a single vectorized divide
+    results_df['Char Process Time'] = character_count_f / results_df['Time Length'].to_numpy(dtype=np.float64)
+    # Display the DataFrames of the scoring rubric and the results, the full width strings of every cell are only
+    # built when debug logging is turned on
+    if logger.isEnabledFor(logging.DEBUG):
+        with pd.option_context('display.max_colwidth', None):
+            logger.debug("%s", score_rubric_df.to_string())
+            logger.debug("%s", results_df[['Model', 'Time Length', 'Total Cost', 'Summary Score']].to_string())
     # Save this dataframe as a CSV file      
     file_path = os.path.join('reports', 'model_performance_comparison.csv')
-    # Save DataFrame to CSV file
-    results_df.to_csv(file_path, index=False)
-    # Convert DataFrame to CSV format string to send to Bedrock for eval
-    csv_data = StringIO()
-    # Save DataFrame to CSV file
-    results_df.to_csv(csv_data, index=False)
-    # Move to start of StringIO object to read its content
-    csv_data.seek(0)
-    # Read CSV data from StringIO object (as a string)
-    csv_string = csv_data.getvalue()
-    # ask the model which is the best model to use for cost and performance
-    invoke_costs_eval_response = evaluate_model_performance(csv_string, "anthropic.claude-3-sonnet-20240229-v1:0")
-    # chart out the performance and cost results
-    plot_model_comparisons(results_df)
+    # Convert DataFrame to CSV format string once, it is saved to the CSV file
+    csv_string = results_df.to_csv(index=False)
+    # Save the CSV string to the CSV file in the background
+    _write_in_background("results CSV", Path(file_path).write_text, csv_string)
+    # ask the model which is the best model to use for cost and performance, streaming the analysis to on_token, in
+    # the background while the graphs are drawn
+    costs_eval_future = _analyze_in_background(context.copy().run, evaluate_model_performance, results_df,
+                                               EVALUATOR_MODEL_ID, on_token)
+    # chart out the performance and cost results, the graphs are drawn in this thread as pyplot is not thread-safe
+    graph_fig = plot_model_comparisons(results_df)
     # plot the performance rubric scores 
-    plot_model_performance_comparisons(score_rubric_df)
-    # Save the reports to a file
-    write_evaluation_results(evaluation_results, eval_name="summary")
-    write_evaluation_results(invoke_costs_eval_response, eval_name="cost")
-    #  return the results dataframe, evaluation results, invoke costs eval response and score rubric dataframe
-    return results_df, evaluation_results, invoke_costs_eval_response, score_rubric_df
+    rubric_fig = plot_model_performance_comparisons(score_rubric_df)
+    # wait for the cost and performance analysis, and save it to a file in the background
+    invoke_costs_eval_response = costs_eval_future.result()
+    _write_in_background("cost report", write_evaluation_results, invoke_costs_eval_response, "cost")
+    # wait for the graphs to be written to the reports folder, they were saved in the background during the analysis
+    flush_plots()
+    #  return the results dataframe, evaluation results, invoke costs eval response, score rubric dataframe and graphs
+    return results_df, evaluation_results, invoke_costs_eval_response, score_rubric_df, graph_fig, rubric_fig
+
+
+
+
+def evaluate_knowledge_base(knowledge_base, questions, ground_truths, embedding_character_count):
+    """
+    Answer the questions with a single knowledge base and evaluate its answers.
+
+    :param knowledge_base: The knowledge base being evaluated.
+    :param questions: The questions extracted from the question CSV file.
+    :param ground_truths: The answers extracted from the answer CSV file.
+    :param embedding_character_count: The character count of the questions.
+    :return: A tuple containing the formatted results, the written evaluation results and the scoring rubric.
+    """
+    embedding_model_name = knowledge_base['embedding_model_arn'].split('/')[1]
+
+    bedrock_embeddings = BedrockEmbeddings(model_id=embedding_model_name, client=get_bedrock_runtime())
+    llm_for_text_generation = get_llm_for_text_generation()
+    retriever = AmazonKnowledgeBasesRetriever(
+        knowledge_base_id=knowledge_base['id'],
+        retrieval_config={"vectorSearchConfiguration": {"numberOfResults": 4}}
+    )
+
+    input_embedding_token_count = len(text_formatter(questions))/6 ## TODO FIX ME!!!
+
+    qa_chain = RetrievalQA.from_chain_type(
+        llm=llm_for_text_generation, retriever=retriever, return_source_documents=True
+    )
+
+    answers = []
+    contexts = []
+    token_counter = AnthropicTokenCounter(llm_for_text_generation)
+    input_llm_token_count = 0
+    output_llm_token_count = 0
+
+    start = perf_counter_ns()
+    for question in questions:
+        answers.append(qa_chain.invoke(question, config={"callbacks": [token_counter]})["result"])
+        input_llm_token_count += token_counter.input_tokens
+        output_llm_token_count += token_counter.output_tokens
+        contexts.append([docs.page_content for docs in retriever.get_relevant_documents(question)])
+    # calculate total time taken, from the integer nanoseconds of the monotonic clock
+    time_length = round((perf_counter_ns() - start) / 1e9, 2)
+    # calculate llm_character_count
+    llm_character_count = embedding_character_count + len(" ".join(item[0] for item in contexts))
+
+    # To dict
+    data = {
+        "question": questions,
+        "answer": answers,
+        "contexts": contexts,
+        "ground_truth": ground_truths
+    }
+    # Convert dict to dataset
+    dataset = Dataset.from_dict(data)
+    # Run RAGAS on dataset, with this knowledge base's own copy of the metrics, ragas sets the LLM and embeddings on the
+    # metrics it is given and resets them when it is done, so the knowledge bases scored concurrently can't share them
+    result = evaluate(
+        dataset = dataset, 
+        metrics=copy.deepcopy(metrics),
+        llm=get_llm_for_evaluation(),
+        embeddings=bedrock_embeddings,
+    )
+
+    input_embedding_cost, output_embedding_cost, embedding_total_cost, embedding_total_cost_1000 = calculate_total_price(input_embedding_token_count, 0, embedding_model_name)
+    input_llm_cost, output_llm_cost, llm_total_cost, llm_total_cost_1000 = calculate_total_price(input_llm_token_count, output_llm_token_count, llm_for_text_generation.model_id)
 
+    # evaluate the models performance against the grading rubric and return the final score, final summary
+    # and the scoring rubric
+    final_score, final_summary, final_score_rubric = evaluate_rag_output(result, knowledge_base, contexts)
 
+    #  create a OrchestrationHelper object to store the results of the evaluation, the characters per second are
+    # computed for all the knowledge bases at once by final_rag_evaluator
+    result = OrchestrationRAGHelper(knowledge_base['name'], time_length, embedding_character_count, llm_character_count, None, input_embedding_cost, 
+                                 output_embedding_cost, embedding_total_cost, embedding_total_cost_1000, input_llm_cost, 
+                                 output_llm_cost, llm_total_cost, llm_total_cost_1000,
+                                 final_score, text_formatter(answers), final_summary)
+    # return the results in the column order of OrchestrationRAGHelper, the written summary and the scoring rubric
+    return result.record(), result.evaluation_results(), final_score_rubric
 
 
 def final_rag_evaluator(csv_path_1, csv_path_2, knowledge_bases):
@@ -357,6 +465,8 @@ def final_rag_evaluator(csv_path_1, csv_path_2, knowledge_bases):
         - str: Summary of the evaluation results.
         - str: Evaluation of the costs for model selection.
         - DataFrame: Scoring rubric for the evaluated models.
+        - Figure: Graph of the cost, time and score comparisons.
+        - Figure: Graph of the scoring rubric.
     """
     # Extract the questions out of the given CSV
     questions = csv_extraction(csv_path_1)
@@ -370,108 +480,55 @@ def final_rag_evaluator(csv_path_1, csv_path_2, knowledge_bases):
     results_list = []
     # Initialize an empty list to store the scoring rubric for each model
     score_rubric_list = []
-    # Initialize an empty string to store the aggregated evaluation results
-    evaluation_results = ""
-    # for each mode evaluate 
-    for knowledge_base in knowledge_bases:
-
-        embedding_model_name = knowledge_base['embedding_model_arn'].split('/')[1]
-
-        bedrock_embeddings = BedrockEmbeddings(model_id=embedding_model_name, client=bedrock_runtime)
-        retriever = AmazonKnowledgeBasesRetriever(
-            knowledge_base_id=knowledge_base['id'],
-            retrieval_config={"vectorSearchConfiguration": {"numberOfResults": 4}}
-        )
-
-        input_embedding_token_count = len(text_formatter(questions))/6 ## TODO FIX ME!!!
-
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm_for_text_generation, retriever=retriever, return_source_documents=True
-        )
-
-        answers = []
-        contexts = []
-        token_counter = AnthropicTokenCounter(llm_for_text_generation)
-        input_llm_token_count = 0
-        output_llm_token_count = 0
-
-        start = timer()
-        for question in questions:
-            answers.append(qa_chain.invoke(question, config={"callbacks": [token_counter]})["result"])
-            input_llm_token_count += token_counter.input_tokens
-            output_llm_token_count += token_counter.output_tokens
-            contexts.append([docs.page_content for docs in retriever.get_relevant_documents(question)])
-        # end timer
-        end = timer()
-        # calculate total time taken
-        time_length = round(end - start, 2)
-        # calculate time taken per character
-        char_process_time = embedding_character_count / time_length
-        # calculate llm_character_count
-        llm_character_count = embedding_character_count + len(" ".join(item[0] for item in contexts))
-
-        # To dict
-        data = {
-            "question": questions,
-            "answer": answers,
-            "contexts": contexts,
-            "ground_truth": ground_truths
-        }
-        # Convert dict to dataset
-        dataset = Dataset.from_dict(data)
-        # Run RAGAS on dataset
-        result = evaluate(
-            dataset = dataset, 
-            metrics=metrics,
-            llm=llm_for_evaluation,
-            embeddings=bedrock_embeddings,
-        )
-
-        input_embedding_cost, output_embedding_cost, embedding_total_cost, embedding_total_cost_1000 = calculate_total_price(input_embedding_token_count, 0, embedding_model_name)
-        input_llm_cost, output_llm_cost, llm_total_cost, llm_total_cost_1000 = calculate_total_price(input_llm_token_count, output_llm_token_count, llm_for_text_generation.model_id)
-
-        # evaluate the models performance against the grading rubric and return the final score, final summary
-        # and the scoring rubric
-        final_score, final_summary, final_score_rubric = evaluate_rag_output(result, knowledge_base, contexts)
-    
-        #  create a OrchestrationHelper object to store the results of the evaluation
-        result = OrchestrationRAGHelper(knowledge_base['name'], time_length, embedding_character_count, llm_character_count, char_process_time, input_embedding_cost, 
-                                     output_embedding_cost, embedding_total_cost, embedding_total_cost_1000, input_llm_cost, 
-                                     output_llm_cost, llm_total_cost, llm_total_cost_1000,
-                                     final_score, text_formatter(answers), final_summary)
+    # Initialize an empty list to store the evaluation results written summary of each model, joined once at the end
+    evaluation_chunks = []
+    # answer and evaluate the questions with every knowledge base concurrently, the work is bound by the Bedrock
+    # round trips so the total time is close to the time of the slowest knowledge base
+    evaluations = [None] * len(knowledge_bases)
+    with ThreadPoolExecutor(max_workers=max(len(knowledge_bases), 1)) as executor:
+        futures = {executor.submit(evaluate_knowledge_base, knowledge_base, questions, ground_truths,
+                                   embedding_character_count): index
+                   for index, knowledge_base in enumerate(knowledge_bases)}
+        # keep the results in the same order as the selected knowledge bases
+        for future in as_completed(futures):
+            evaluations[futures[future]] = future.result()
+    # for each evaluated knowledge base gather the results
+    for formatted_result, evaluation_result, final_score_rubric in evaluations:
         # add the results of the evaluation to the results list
-        results_list.append(result.format())
-        # add the evaluation results written summary to the evaluation results string
-        evaluation_results += result.evaluation_results()            
+        results_list.append(formatted_result)
+        # add the evaluation results written summary to the evaluation results list
+        evaluation_chunks.append(evaluation_result)
         # add the scoring rubric for the model into the scoring rubric list
         score_rubric_list.append(final_score_rubric)
+    # join the evaluation results written summaries into a single string
+    evaluation_results = "".join(evaluation_chunks)
+    # Save the summary report to a file in the background
+    _write_in_background("summary report", write_evaluation_results, evaluation_results, "summary")
 
-    # Setting the display to max column width
-    pd.set_option('display.max_colwidth', None)
     # Convert scoring rubric list into a DataFrame
     score_rubric_df = pd.DataFrame(score_rubric_list)
-    # Convert performance and cost results list into a DataFrame
-    results_df = pd.DataFrame(results_list)
+    # Convert performance and cost results list into a DataFrame, the records are already in column order
+    results_df = pd.DataFrame.from_records(results_list, columns=OrchestrationRAGHelper.COLUMNS)
+    # calculate the characters processed per second of every knowledge base in a single vectorized divide
+    results_df['Char Process Time'] = (float(embedding_character_count) /
+                                       results_df['Time Length'].to_numpy(dtype=np.float64))
     # Save this dataframe as a CSV file      
     file_path = os.path.join('reports', 'model_performance_comparison.csv')
-    # Save DataFrame to CSV file
-    results_df.to_csv(file_path, index=False)
-    # Convert DataFrame to CSV format string to send to Bedrock for eval
-    csv_data = StringIO()
-    # Save DataFrame to CSV file
-    results_df.to_csv(csv_data, index=False)
-    # Move to start of StringIO object to read its content
-    csv_data.seek(0)
-    # Read CSV data from StringIO object (as a string)
-    csv_string = csv_data.getvalue()
-    # ask the model which is the best model to use for cost and performance
-    invoke_costs_eval_response = evaluate_rag_performance(csv_string, "anthropic.claude-3-sonnet-20240229-v1:0")
-    # chart out the performance and cost results
-    plot_rag_comparisons(results_df)
+    # Convert DataFrame to CSV format string once, it is saved to the CSV file
+    csv_string = results_df.to_csv(index=False)
+    # Save the CSV string to the CSV file in the background
+    _write_in_background("results CSV", Path(file_path).write_text, csv_string)
+    # ask the model which is the best model to use for cost and performance, in the background while the graphs
+    # are drawn
+    costs_eval_future = _analyze_in_background(evaluate_rag_performance, results_df, EVALUATOR_MODEL_ID)
+    # chart out the performance and cost results, the graphs are drawn in this thread as pyplot is not thread-safe
+    graph_fig = plot_rag_comparisons(results_df)
     # plot the performance rubric scores 
-    plot_rag_performance_comparisons(score_rubric_df)
-    # Save the reports to a file
-    write_evaluation_results(evaluation_results, eval_name="summary")
-    write_evaluation_results(invoke_costs_eval_response, eval_name="cost")
-    #  return the results dataframe, evaluation results, invoke costs eval response and score rubric dataframe
-    return results_df, evaluation_results, invoke_costs_eval_response, score_rubric_df
+    rubric_fig = plot_rag_performance_comparisons(score_rubric_df)
+    # wait for the cost and performance analysis, and save it to a file in the background
+    invoke_costs_eval_response = costs_eval_future.result()
+    _write_in_background("cost report", write_evaluation_results, invoke_costs_eval_response, "cost")
+    # wait for the graphs to be written to the reports folder, they were saved in the background during the analysis
+    flush_plots()
+    #  return the results dataframe, evaluation results, invoke costs eval response, score rubric dataframe and graphs
+    return results_df, evaluation_results, invoke_costs_eval_response, score_rubric_df, graph_fig, rubric_fig
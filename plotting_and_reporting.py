@@ -1,9 +1,107 @@
-from datetime import datetime
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 from palettable.colorbrewer.qualitative import Set1_9, Pastel2_3
 from matplotlib.colors import ListedColormap
+from PIL import Image
+
+# configure the logger
+logger = logging.getLogger()
+# The folder the graphs and the written reports are saved to, relative to the directory the app is run from. It is
+# created once, so the first save of a run from another directory does not fail
+REPORTS_FOLDER = 'reports'
+os.makedirs(REPORTS_FOLDER, exist_ok=True)
+
+
+# The columns the comparison plots require
+_MODEL_COMPARISON_COLUMNS = frozenset(('Model', 'Total Cost(1000)', 'Time Length', 'Summary Score'))
+_RAG_COMPARISON_COLUMNS = frozenset(('Model', 'Total Embedding Cost(1000)', 'Total LLM Cost(1000)', 'Time Length',
+                                     'Score'))
+# The scores of the rubric plots, in the order they are shown on the x-axis
+_RUBRIC_METRICS = ('model_completeness_score', 'model_flow_score', 'model_structure_score', 'model_conciseness_score',
+                   'model_clarity_score', 'model_objectivity_score', 'model_tone_score', 'model_task_score')
+_RAG_RUBRIC_METRICS = ('faithfulness', 'answer_relevancy', 'context_precision', 'context_recall',
+                       'context_entity_recall', 'answer_similarity', 'answer_correctness', 'harmfulness',
+                       'maliciousness', 'coherence', 'correctness', 'conciseness')
+# The columns the rubric plots require, the model name and the scores
+_RUBRIC_COLUMNS = frozenset(('model_name',) + _RUBRIC_METRICS)
+_RAG_RUBRIC_COLUMNS = frozenset(('model_name',) + _RAG_RUBRIC_METRICS)
+# The Pillow options the graphs are saved with, a lower zlib level than the default of 6 encodes the flat colors of a
+# plot several times faster, for only slightly larger files
+_PNG_PIL_KWARGS = {'compress_level': 3, 'optimize': False}
+# The color palettes of the plots, read once instead of on every plot
+_PALETTE = Set1_9.mpl_colors
+_SET1_COLORS = plt.get_cmap('Set1', 9).colors
+# The background thread the rendered graphs are encoded and written to the reports directory from, and the saves that
+# have not finished yet, see flush_plots. The set is changed from the background thread when a save finishes, so it is
+# only read or changed with the lock held
+_save_pool = ThreadPoolExecutor(max_workers=1)
+_pending_saves = set()
+_pending_saves_lock = threading.Lock()
+
+
+def _write_png(pixels, path):
+    """
+    Encodes the pixels of a rendered graph as a PNG file, this is run in the background.
+
+    :param pixels: The RGBA pixels of the graph, a (height, width, 4) uint8 array.
+    :param path: The path the PNG file is written to.
+    :return: None
+    """
+    try:
+        Image.fromarray(pixels, mode='RGBA').save(path, format='PNG', **_PNG_PIL_KWARGS)
+    except Exception as e:
+        logger.error(f"Could not save the graph {path}: {e}")
+
+
+def _save_figure(fig, path):
+    """
+    Saves a graph to the reports directory without waiting for it to be encoded and written. The figure is rendered
+    in the calling thread, as pyplot is not thread-safe, and only a copy of its pixels is handed to the background.
+
+    :param fig: The matplotlib Figure of the graph.
+    :param path: The path the PNG file is written to.
+    :return: None
+    """
+    canvas = fig.canvas
+    if not hasattr(canvas, 'buffer_rgba'):
+        # the figure is not drawn by a raster backend, so it is saved the usual way
+        fig.savefig(path, pil_kwargs=_PNG_PIL_KWARGS)
+        return
+    canvas.draw()
+    with _pending_saves_lock:
+        future = _save_pool.submit(_write_png, np.array(canvas.buffer_rgba()), path)
+        _pending_saves.add(future)
+    future.add_done_callback(_discard_save)
+
+
+def _discard_save(future):
+    """
+    Takes a finished save out of the pending saves, it is called from the thread the save finished in.
+
+    :param future: The future of the save.
+    :return: None
+    """
+    with _pending_saves_lock:
+        _pending_saves.discard(future)
+
+
+def flush_plots():
+    """
+    Waits for the graphs that are still being saved in the background to be written, so a run does not end while a
+    graph is half written, and the next run does not overwrite a graph that is still being written.
+
+    :return: None
+    """
+    with _pending_saves_lock:
+        pending = list(_pending_saves)
+    wait(pending)
 
 
 def write_evaluation_results(evaluation_results, eval_name="summary"):
@@ -14,15 +112,42 @@ def write_evaluation_results(evaluation_results, eval_name="summary"):
     :param eval_name: Optional. The name of the evaluation. Defaults to "summary".
     :return: None
     """
-    # Get current date and time
-    now = datetime.now()
-    # Format date and time as a string in the format "ddmmyyyyHHMMSS"
-    dt_string = now.strftime("%d%m%Y%H%M%S")
+    # Format the current local date and time as a string in the format "ddmmyyyyHHMMSS"
+    dt_string = time.strftime("%d%m%Y%H%M%S")
     # Construct output file name using formatted date-time and evaluation name
-    output_file_name = f"reports/{eval_name}-evaluation_results-{dt_string}.txt"
-    # Write evaluation results to the output file
-    with open(output_file_name, "w") as f:
-        f.write(evaluation_results)
+    output_file = Path(REPORTS_FOLDER) / f"{eval_name}-evaluation_results-{dt_string}.txt"
+    # Write evaluation results to the output file, encoded once and written in a single call
+    output_file.write_bytes(evaluation_results.encode('utf-8'))
+
+
+def _plot_sorted_bars(ax, models, values, color, ylabel, title, ascending=True, ylim=None):
+    """
+    Plots a bar chart of one metric of the models, sorted by the metric.
+
+    :param ax: The matplotlib Axes of the subplot.
+    :param models: Array of the model names.
+    :param values: Array of the metric of each model.
+    :param color: The color of the bars.
+    :param ylabel: The label of the y-axis.
+    :param title: The title of the subplot.
+    :param ascending: Optional. Sort the bars from the lowest value. Defaults to True.
+    :param ylim: Optional. A tuple of the bottom and top limits of the y-axis.
+    :return: None
+    """
+    # sort the names and the values with one argsort of the metric, instead of sorting a copy of the whole results,
+    # ties keep the order of the results
+    order = np.argsort(values if ascending else -values, kind='stable')
+    # the bars are placed at numeric positions and the names are set as the tick labels, instead of converting the
+    # names to a categorical axis
+    positions = np.arange(len(order))
+    ax.bar(positions, values[order], color=color)  # Plot bar chart
+    ax.set_xticks(positions, models[order])
+    ax.set_xlabel('Model')  # Set x-axis label
+    ax.set_ylabel(ylabel)  # Set y-axis label
+    ax.set_title(title)  # Set plot title
+    if ylim is not None:
+        ax.set_ylim(*ylim)  # Set y-axis limits
+    ax.tick_params(axis='x', labelrotation=90)  # Rotate x-axis labels for better readability
 
 
 def plot_model_comparisons(results_df):
@@ -30,57 +155,41 @@ def plot_model_comparisons(results_df):
     Plots comparisons between different models based on specified metrics.
 
     :param results_df: A pandas DataFrame containing the results of model comparisons.
-    :return: None
+    :return: The matplotlib Figure of the plot.
     """
     # Check if input is a pandas DataFrame
     if not isinstance(results_df, pd.DataFrame):
         raise ValueError("The input must be a pandas DataFrame.")
 
-    # Define required columns for comparison
-    required_columns = {'Model', 'Total Cost(1000)', 'Time Length', 'Summary Score'}
     # Check if required columns are present in the DataFrame
-    if not required_columns.issubset(results_df.columns):
-        missing_cols = required_columns - set(results_df.columns)
-        raise ValueError(f"Missing required columns in the DataFrame: {missing_cols}")
+    missing_cols = _MODEL_COMPARISON_COLUMNS.difference(results_df.columns)
+    if missing_cols:
+        raise ValueError(f"Missing required columns in the DataFrame: {set(missing_cols)}")
 
-    # Set up the figure size and color palette
-    plt.figure(figsize=(15, 8))
-    colors = Set1_9.mpl_colors
+    # Set up the figure size and color palette, with one subplot per metric
+    fig, axes = plt.subplots(1, 3, figsize=(15, 8))
+    colors = _PALETTE
+    # the model names are read once, and every metric is sorted on its own
+    models = results_df['Model'].astype(str).to_numpy()
 
     # Plot Total Cost comparison
-    plt.subplot(1, 3, 1)  # Create subplot 1 out of 3
-    results_df_sort = results_df.sort_values(by='Total Cost(1000)')  # Sort DataFrame by Total Cost
-    plt.bar(results_df_sort['Model'], results_df_sort['Total Cost(1000)'], color=colors[0])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Total Cost per 1000 docs')  # Set y-axis label
-    plt.title('Total Cost Comparison (1000 docs)\n (Lowest is best)')  # Set plot title
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
-
+    _plot_sorted_bars(axes[0], models, results_df['Total Cost(1000)'].to_numpy(dtype=np.float64), colors[0],
+                      'Total Cost per 1000 docs', 'Total Cost Comparison (1000 docs)\n (Lowest is best)')
     # Plot Time Length comparison
-    plt.subplot(1, 3, 2)  # Create subplot 2 out of 3
-    results_df_sort = results_df.sort_values(by='Time Length')  # Sort DataFrame by Time Length
-    plt.bar(results_df_sort['Model'], results_df_sort['Time Length'], color=colors[1])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Time Length (s)')  # Set y-axis label
-    plt.title('Time Length Comparison\n (Lowest is best)')  # Set plot title
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
-
+    _plot_sorted_bars(axes[1], models, results_df['Time Length'].to_numpy(dtype=np.float64), colors[1],
+                      'Time Length (s)', 'Time Length Comparison\n (Lowest is best)')
     # Plot Summary Score comparison
-    plt.subplot(1, 3, 3) # Create subplot 3 out of 3
-    results_df_sort = results_df.sort_values(by='Summary Score', ascending=False)  # Sort DataFrame by Summary Score
-    plt.bar(results_df_sort['Model'], results_df_sort['Summary Score'], color=colors[2])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Summary Score')  # Set y-axis label
-    plt.title('Summary Score Comparison\n (Highest is best)')  # Set plot title
-    plt.ylim(bottom=0, top=5)  # Set y-axis limits
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
+    _plot_sorted_bars(axes[2], models, results_df['Summary Score'].to_numpy(dtype=np.float64), colors[2],
+                      'Summary Score', 'Summary Score Comparison\n (Highest is best)', ascending=False, ylim=(0, 5))
 
     # Adjust layout for better presentation
     plt.tight_layout()
-    # Save the plot as an image in the reports directory
-    plt.savefig("reports/graph.png")
-    # Close the plot to free up memory
-    plt.close()
+    # Save the plot as an image in the reports directory, in the background
+    _save_figure(fig, os.path.join(REPORTS_FOLDER, 'graph.png'))
+    # Close the plot to free up memory, the figure can still be rendered by the caller
+    plt.close(fig)
+    # return the figure so it can be displayed without reading the image back from disk
+    return fig
 
 
 def plot_model_performance_comparisons(results_df):
@@ -89,43 +198,46 @@ def plot_model_performance_comparisons(results_df):
     with each metric performance displayed as a separate series.
     
     :param results_df: A pandas DataFrame containing the results of model comparisons.
-    :return: None
+    :return: The matplotlib Figure of the plot.
     """
     
     # Check if input is a pandas DataFrame
     if not isinstance(results_df, pd.DataFrame):
         raise ValueError("The input must be a pandas DataFrame.")
         
-    # Define required columns for comparison (adjust according to actual data)
-    required_columns = {'model_name', 'model_completeness_score', 'model_flow_score',
-                        'model_structure_score', 'model_conciseness_score',
-                        'model_clarity_score', 'model_objectivity_score',
-                        'model_tone_score', 'model_task_score'}
-    
     # Check if required columns are present in the DataFrame
-    if not required_columns.issubset(results_df.columns):
-        missing_cols = required_columns - set(results_df.columns)
-        raise ValueError(f"Missing required columns in the DataFrame: {missing_cols}")
+    missing_cols = _RUBRIC_COLUMNS.difference(results_df.columns)
+    if missing_cols:
+        raise ValueError(f"Missing required columns in the DataFrame: {set(missing_cols)}")
     
-    # Prepare data for plotting
-    metrics = list(required_columns - {'model_name'})  # Exclude model_name from metrics
+    # Prepare data for plotting, the metrics are always shown in the same order
+    metrics = list(_RUBRIC_METRICS)
     
     models = results_df['model_name'].tolist()
 
     # Create color map based on number of metrics 
-    colors_list = plt.get_cmap('Set1', 9).colors
+    colors_list = _SET1_COLORS
     
     n_metrics = len(metrics)
     
     fig, ax = plt.subplots(figsize=(12 + n_metrics, 8))  # Adjust figure size dynamically based on number of metrics
     bar_width = 0.05  # Adjust bar width for clarity
     
+    # the scores of every model in one (models x metrics) matrix, the rows are in the same order as the models, a
+    # criterion the evaluator model did not score is NaN
+    score_matrix = results_df[metrics].to_numpy(dtype=np.float32, na_value=np.nan)
+    missing = np.isnan(score_matrix)
+    # a missing score is drawn as an empty bar labelled n/a, instead of as a score of 0
+    score_matrix = np.where(missing, 0, score_matrix)
+    # the positions of every bar, each row is the group of bars of a model next to the bars of the previous model
+    positions_all = np.arange(n_metrics)[None, :] + (np.arange(len(models)) * (bar_width + 0.02))[:, None]
+
     for i, model in enumerate(models):
-        positions = np.arange(len(metrics)) + i * (bar_width + 0.02)  # Positioning each group of bars
-        
-        scores = results_df[results_df['model_name'] == model][metrics].values.flatten().astype(int)
-        rects = ax.bar(positions, scores, bar_width, label=model, color=colors_list[i % len(colors_list)])
-        ax.bar_label(rects)
+        ax.bar(positions_all[i], score_matrix[i], bar_width, label=model, color=colors_list[i % len(colors_list)])
+    # label every bar with its score on top of the bar, the labels of the whole matrix are formatted in one call
+    labels = np.where(missing, 'n/a', np.char.mod('%g', score_matrix)).ravel()
+    for x, height, label in zip(positions_all.ravel(), score_matrix.ravel(), labels):
+        ax.text(x, height, label, ha='center', va='bottom')
         
      # Add some text for labels, title and custom x-axis tick labels, etc.
     ax.set_ylabel('Scores')
@@ -134,90 +246,62 @@ def plot_model_performance_comparisons(results_df):
     ax.set_xticks(np.arange(len(metrics)) + bar_width * (len(models) - 1) / 2)
     ax.set_xticklabels(metrics)
      
-    plt.xticks(rotation=90)  # Rotate metric names for better visibility
-    
-    # Including model names within x-tick labels for clarity 
-   # This requires custom formatting to intersperse metric names with model names dynamically.
-    #ax.set_xticklabels([f'{metric}\n' + '\n'.join(models) for metric in metrics], ha='center')
-    
-    # Remove model names from x-tick labels
-    ax.set_xticks(np.arange(len(metrics)) + bar_width * (len(models) - 1) / 2)
-    ax.set_xticklabels(metrics)
+    ax.tick_params(axis='x', labelrotation=90)  # Rotate metric names for better visibility
 
     ax.legend(loc='upper left', bbox_to_anchor=(1, 1), title="Models")
      
     plt.subplots_adjust(right=0.75)  # Adjust right edge to accommodate legend
     plt.ylim(bottom=0)  # Set y-axis bottom limit
     plt.tight_layout()
-    plt.savefig("reports/rubric_graph.png")
-     
-    plt.close()
+    _save_figure(fig, os.path.join(REPORTS_FOLDER, 'rubric_graph.png'))
+    # Close the plot to free up memory, the figure can still be rendered by the caller
+    plt.close(fig)
+    # return the figure so it can be displayed without reading the image back from disk
+    return fig
 
 def plot_rag_comparisons(results_df):
     """
     Plots comparisons between different models based on specified metrics.
 
     :param results_df: A pandas DataFrame containing the results of model comparisons.
-    :return: None
+    :return: The matplotlib Figure of the plot.
     """
     # Check if input is a pandas DataFrame
     if not isinstance(results_df, pd.DataFrame):
         raise ValueError("The input must be a pandas DataFrame.")
 
-    # Define required columns for comparison
-    required_columns = {'Model', 'Total Embedding Cost(1000)', 'Total LLM Cost(1000)', 'Time Length', 'Score'}
     # Check if required columns are present in the DataFrame
-    if not required_columns.issubset(results_df.columns):
-        missing_cols = required_columns - set(results_df.columns)
-        raise ValueError(f"Missing required columns in the DataFrame: {missing_cols}")
+    missing_cols = _RAG_COMPARISON_COLUMNS.difference(results_df.columns)
+    if missing_cols:
+        raise ValueError(f"Missing required columns in the DataFrame: {set(missing_cols)}")
 
-    # Set up the figure size and color palette
-    plt.figure(figsize=(15, 8))
-    colors = Set1_9.mpl_colors
+    # Set up the figure size and color palette, with one subplot per metric
+    fig, axes = plt.subplots(1, 4, figsize=(15, 8))
+    colors = _PALETTE
+    # the knowledge base names are read once, and every metric is sorted on its own
+    models = results_df['Model'].astype(str).to_numpy()
 
     # Plot Total Cost comparison
-    plt.subplot(1, 4, 1)  # Create subplot 1 out of 4
-    results_df_sort = results_df.sort_values(by='Total Embedding Cost(1000)')  # Sort DataFrame by Total Cost
-    plt.bar(results_df_sort['Model'], results_df_sort['Total Embedding Cost(1000)'], color=colors[0])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Total Cost per 1000 embeddings')  # Set y-axis label
-    plt.title('Total Cost Comparison (1000 embeddings)\n (Lowest is best)')  # Set plot title
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
-
+    _plot_sorted_bars(axes[0], models, results_df['Total Embedding Cost(1000)'].to_numpy(dtype=np.float64), colors[0],
+                      'Total Cost per 1000 embeddings', 'Total Cost Comparison (1000 embeddings)\n (Lowest is best)')
     # Plot Total Cost comparison
-    plt.subplot(1, 4, 2)  # Create subplot 2 out of 4
-    results_df_sort = results_df.sort_values(by='Total LLM Cost(1000)')  # Sort DataFrame by Total Cost
-    plt.bar(results_df_sort['Model'], results_df_sort['Total LLM Cost(1000)'], color=colors[0])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Total Cost per 1000 llm invocations')  # Set y-axis label
-    plt.title('Total Cost Comparison (1000 invocations)\n (Lowest is best)')  # Set plot title
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
-
+    _plot_sorted_bars(axes[1], models, results_df['Total LLM Cost(1000)'].to_numpy(dtype=np.float64), colors[0],
+                      'Total Cost per 1000 llm invocations', 'Total Cost Comparison (1000 invocations)\n (Lowest is best)')
     # Plot Time Length comparison
-    plt.subplot(1, 4, 3)  # Create subplot 3 out of 4
-    results_df_sort = results_df.sort_values(by='Time Length')  # Sort DataFrame by Time Length
-    plt.bar(results_df_sort['Model'], results_df_sort['Time Length'], color=colors[1])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Time Length (s)')  # Set y-axis label
-    plt.title('Time Length Comparison\n (Lowest is best)')  # Set plot title
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
-
+    _plot_sorted_bars(axes[2], models, results_df['Time Length'].to_numpy(dtype=np.float64), colors[1],
+                      'Time Length (s)', 'Time Length Comparison\n (Lowest is best)')
     # Plot Summary Score comparison
-    plt.subplot(1, 4, 4) # Create subplot 4 out of 4
-    results_df_sort = results_df.sort_values(by='Score', ascending=False)  # Sort DataFrame by Summary Score
-    plt.bar(results_df_sort['Model'], results_df_sort['Score'], color=colors[2])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Score')  # Set y-axis label
-    plt.title('Score Comparison\n (Highest is best)')  # Set plot title
-    plt.ylim(bottom=0, top=1)  # Set y-axis limits
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
+    _plot_sorted_bars(axes[3], models, results_df['Score'].to_numpy(dtype=np.float64), colors[2],
+                      'Score', 'Score Comparison\n (Highest is best)', ascending=False, ylim=(0, 1))
 
     # Adjust layout for better presentation
     plt.tight_layout()
-    # Save the plot as an image in the reports directory
-    plt.savefig("reports/graph.png")
-    # Close the plot to free up memory
-    plt.close()
+    # Save the plot as an image in the reports directory, in the background
+    _save_figure(fig, os.path.join(REPORTS_FOLDER, 'graph.png'))
+    # Close the plot to free up memory, the figure can still be rendered by the caller
+    plt.close(fig)
+    # return the figure so it can be displayed without reading the image back from disk
+    return fig
 
 
 def plot_rag_performance_comparisons(results_df):
@@ -226,45 +310,43 @@ def plot_rag_performance_comparisons(results_df):
     with each metric performance displayed as a separate series.
     
     :param results_df: A pandas DataFrame containing the results of model comparisons.
-    :return: None
+    :return: The matplotlib Figure of the plot.
     """
     
     # Check if input is a pandas DataFrame
     if not isinstance(results_df, pd.DataFrame):
         raise ValueError("The input must be a pandas DataFrame.")
         
-    # Define required columns for comparison (adjust according to actual data)
-    required_columns = {'model_name', 'faithfulness', 'answer_relevancy',
-                        'context_precision', 'context_recall',
-                        'context_entity_recall', 'answer_similarity',
-                        'answer_correctness', 'harmfulness', 'maliciousness', 
-                        'coherence', 'correctness', 'conciseness'}
-    
     # Check if required columns are present in the DataFrame
-    if not required_columns.issubset(results_df.columns):
+    missing_cols = _RAG_RUBRIC_COLUMNS.difference(results_df.columns)
+    if missing_cols:
         print(results_df)
-        missing_cols = required_columns - set(results_df.columns)
-        raise ValueError(f"Missing required columns in the DataFrame: {missing_cols}")
+        raise ValueError(f"Missing required columns in the DataFrame: {set(missing_cols)}")
     
-    # Prepare data for plotting
-    metrics = list(required_columns - {'model_name'})  # Exclude model_name from metrics
+    # Prepare data for plotting, the metrics are always shown in the same order
+    metrics = list(_RAG_RUBRIC_METRICS)
     
     models = results_df['model_name'].tolist()
 
     # Create color map based on number of metrics 
-    colors_list = plt.get_cmap('Set1', 9).colors
+    colors_list = _SET1_COLORS
     
     n_metrics = len(metrics)
     
     fig, ax = plt.subplots(figsize=(12 + n_metrics, 8))  # Adjust figure size dynamically based on number of metrics
     bar_width = 0.05  # Adjust bar width for clarity
     
+    # the scores of every model in one (models x metrics) matrix, the rows are in the same order as the models
+    score_matrix = results_df[metrics].to_numpy(dtype=np.float32)
+    # the positions of every bar, each row is the group of bars of a model next to the bars of the previous model
+    positions_all = np.arange(n_metrics)[None, :] + (np.arange(len(models)) * (bar_width + 0.02))[:, None]
+
     for i, model in enumerate(models):
-        positions = np.arange(len(metrics)) + i * (bar_width + 0.02)  # Positioning each group of bars
-        
-        scores = results_df[results_df['model_name'] == model][metrics].values.flatten().astype(float)
-        rects = ax.bar(positions, scores, bar_width, label=model, color=colors_list[i % len(colors_list)])
-        ax.bar_label(rects)
+        ax.bar(positions_all[i], score_matrix[i], bar_width, label=model, color=colors_list[i % len(colors_list)])
+    # label every bar with its score on top of the bar, the labels of the whole matrix are formatted in one call
+    labels = np.char.mod('%.2f', score_matrix.ravel())
+    for x, height, label in zip(positions_all.ravel(), score_matrix.ravel(), labels):
+        ax.text(x, height, label, ha='center', va='bottom')
         
      # Add some text for labels, title and custom x-axis tick labels, etc.
     ax.set_ylabel('Scores')
@@ -273,21 +355,15 @@ def plot_rag_performance_comparisons(results_df):
     ax.set_xticks(np.arange(len(metrics)) + bar_width * (len(models) - 1) / 2)
     ax.set_xticklabels(metrics)
      
-    plt.xticks(rotation=90)  # Rotate metric names for better visibility
-    
-    # Including model names within x-tick labels for clarity 
-   # This requires custom formatting to intersperse metric names with model names dynamically.
-    #ax.set_xticklabels([f'{metric}\n' + '\n'.join(models) for metric in metrics], ha='center')
-    
-    # Remove model names from x-tick labels
-    ax.set_xticks(np.arange(len(metrics)) + bar_width * (len(models) - 1) / 2)
-    ax.set_xticklabels(metrics)
+    ax.tick_params(axis='x', labelrotation=90)  # Rotate metric names for better visibility
 
     ax.legend(loc='upper left', bbox_to_anchor=(1, 1), title="Models")
      
     plt.subplots_adjust(right=0.75)  # Adjust right edge to accommodate legend
     plt.ylim(bottom=0)  # Set y-axis bottom limit
     plt.tight_layout()
-    plt.savefig("reports/rubric_graph.png")
-     
-    plt.close()
\ No newline at end of file
+    _save_figure(fig, os.path.join(REPORTS_FOLDER, 'rubric_graph.png'))
+    # Close the plot to free up memory, the figure can still be rendered by the caller
+    plt.close(fig)
+    # return the figure so it can be displayed without reading the image back from disk
+    return fig
\ No newline at end of file
@@ -1,5 +1,80 @@
 # TODO: Edit model versions available to choose
 # TODO: We need to validate the Claude 3 Haiku pricing, it seems to be constantly returning 0
+# Dictionary containing prices per 1000 input tokens for different models
+MODEL_INPUT_TOKEN_PRICES = {
+    'amazon.titan-embed-text-v1': 0.0001,
+    'amazon.titan-embed-text-v2:0': 0.00002,
+    'amazon.titan-text-lite-v1': 0.0003,
+    'amazon.titan-text-express-v1': 0.0075,
+    'ai21.j2-mid-v1': 0.0125,
+    'ai21.j2-ultra-v1': 0.0188,
+    'anthropic.claude-instant-v1': 0.00080,
+    'anthropic.claude-v2': 0.00800,
+    'anthropic.claude-v2:1': 0.00800,
+    'anthropic.claude-3-sonnet-20240229-v1:0': 0.00300,
+    'anthropic.claude-3-haiku-20240307-v1:0': 0.0002500,
+    'us.anthropic.claude-3-5-haiku-20241022-v1:0': 0.00080,
+    'cohere.command-text-v14': 0.0015,
+    'cohere.command-light-text-v14': 0.0003,
+    'cohere.embed-english-v3': 0.0001,
+    'cohere.embed-multilingual-v3': 0.0001,
+    'meta.llama2-13b-chat-v1': 0.00075,
+    'meta.llama2-70b-chat-v1': 0.00195,
+    'meta.llama3-8b-instruct-v1:0': 0.0004,
+    'meta.llama3-70b-instruct-v1:0': 0.00265,
+    'us.meta.llama3-1-70b-instruct-v1:0': 0.00072,
+    'us.meta.llama3-1-405b-instruct-v1:0': 0.0024,
+    'mistral.mistral-large-2402-v1:0': 0.008,
+    'mistral.mistral-7b-instruct-v0:2': 0.00015,
+    'mistral.mixtral-8x7b-instruct-v0:1': 0.00045,
+    'gpt-4-0125-preview': 0.01,
+    'gpt-4-32k': 0.06
+}
+# Dictionary containing prices per 1000 output tokens for different models
+MODEL_OUTPUT_TOKEN_PRICES = {
+    'amazon.titan-text-lite-v1': 0.0004,
+    'amazon.titan-text-express-v1': 0.0016,
+    'ai21.j2-mid-v1': 0.0125,
+    'ai21.j2-ultra-v1': 0.0188,
+    'anthropic.claude-instant-v1': 0.00240,
+    'anthropic.claude-v2': 0.02400,
+    'anthropic.claude-v2:1': 0.02400,
+    'anthropic.claude-3-sonnet-20240229-v1:0': 0.01500,
+    'anthropic.claude-3-haiku-20240307-v1:0': 0.0012500,
+    'us.anthropic.claude-3-5-haiku-20241022-v1:0': 0.00400,
+    'cohere.command-text-v14': 0.00200,
+    'cohere.command-light-text-v14': 0.00060,
+    'meta.llama2-13b-chat-v1': 0.00100,
+    'meta.llama2-70b-chat-v1': 0.00256,
+    'meta.llama3-8b-instruct-v1:0': 0.0006,
+    'meta.llama3-70b-instruct-v1:0': 0.0035,
+    'us.meta.llama3-1-70b-instruct-v1:0': 0.00072,
+    'us.meta.llama3-1-405b-instruct-v1:0': 0.0024,
+    'mistral.mistral-large-2402-v1:0': 0.024,
+    'mistral.mistral-7b-instruct-v0:2': 0.00020,
+    'mistral.mixtral-8x7b-instruct-v0:1': 0.00070,
+    'gpt-4-0125-preview': 0.03,
+    'gpt-4-32k': 0.12
+}
+# The input and output prices per token of every model, built once when the module is imported, so pricing an
+# invocation is one lookup. The models that only have an input price, the embedding models, have an output price of 0
+_PRICES = {model_id: (MODEL_INPUT_TOKEN_PRICES.get(model_id, 0.0) / 1000.0,
+                      MODEL_OUTPUT_TOKEN_PRICES.get(model_id, 0.0) / 1000.0)
+           for model_id in dict.fromkeys([*MODEL_INPUT_TOKEN_PRICES, *MODEL_OUTPUT_TOKEN_PRICES])}
+# The prices of a model that is not in the dictionaries
+_NO_PRICES = (0.0, 0.0)
+
+
+def _lookup(model_id):
+    """
+    Returns the input and output prices per token of a model.
+
+    :param model_id: Identifier of the model (str).
+    :return: A tuple of the price per input token and the price per output token, 0 if the model_id is not priced.
+    """
+    return _PRICES.get(model_id, _NO_PRICES)
+
+
 def calculate_input_price(token_number, model_id):
     """
     Calculate the cost for a given number of input tokens based on the model used.
@@ -9,45 +84,9 @@ def calculate_input_price(token_number, model_id):
     :return: The cost calculated based on the input tokens and the model used (float).Returns 0 if the model_id is not
     found in the predefined dictionary.
     """
-    # Dictionary containing prices per 1000 tokens for different models
-    model_input_token_prices = {
-        'amazon.titan-embed-text-v1': 0.0001,
-        'amazon.titan-embed-text-v2:0': 0.00002,
-        'amazon.titan-text-lite-v1': 0.0003,
-        'amazon.titan-text-express-v1': 0.0075,
-        'ai21.j2-mid-v1': 0.0125,
-        'ai21.j2-ultra-v1': 0.0188,
-        'anthropic.claude-instant-v1': 0.00080,
-        'anthropic.claude-v2': 0.00800,
-        'anthropic.claude-v2:1': 0.00800,
-        'anthropic.claude-3-sonnet-20240229-v1:0': 0.00300,
-        'anthropic.claude-3-haiku-20240307-v1:0': 0.0002500,
-        'cohere.command-text-v14': 0.0015,
-        'cohere.command-light-text-v14': 0.0003,
-        'cohere.embed-english-v3': 0.0001,
-        'cohere.embed-multilingual-v3': 0.0001,
-        'meta.llama2-13b-chat-v1': 0.00075,
-        'meta.llama2-70b-chat-v1': 0.00195,
-        'meta.llama3-8b-instruct-v1:0': 0.0004,
-        'meta.llama3-70b-instruct-v1:0': 0.00265,
-        'mistral.mistral-large-2402-v1:0': 0.008,
-        'mistral.mistral-7b-instruct-v0:2': 0.00015,
-        'mistral.mixtral-8x7b-instruct-v0:1': 0.00045,
-        'gpt-4-0125-preview': 0.01,
-        'gpt-4-32k': 0.06
-    }
-
-    # Check if the provided model_id exists in our dictionary
-    if model_id in model_input_token_prices:
-        # Get the price per 1000 input tokens for the given model_id
-        price_per_1000_tokens = model_input_token_prices[model_id]
-        # Calculate the cost for the given number of input tokens
-        cost = (token_number / 1000) * price_per_1000_tokens
-        # return the final input token cost, rounded to the 8 decimal place
-        return round(cost, 8)
-    else:
-        # Return 0 if the model_id is not found in the dictionary
-        return 0
+    # Calculate the cost for the given number of input tokens from the price per token, rounded to the 8 decimal place,
+    # 0 if the model_id is not found in the dictionary
+    return round(token_number * _lookup(model_id)[0], 8)
 
 
 def calculate_output_price(token_number, model_id):
@@ -59,40 +98,9 @@ def calculate_output_price(token_number, model_id):
     :return: The cost calculated based on the output tokens and the model used (float).
              Returns 0 if the model_id is not found in the predefined dictionary.
     """
-    # Dictionary containing prices per 1000 output tokens for different models
-    model_output_token_prices = {
-        'amazon.titan-text-lite-v1': 0.0004,
-        'amazon.titan-text-express-v1': 0.0016,
-        'ai21.j2-mid-v1': 0.0125,
-        'ai21.j2-ultra-v1': 0.0188,
-        'anthropic.claude-instant-v1': 0.00240,
-        'anthropic.claude-v2': 0.02400,
-        'anthropic.claude-v2:1': 0.02400,
-        'anthropic.claude-3-sonnet-20240229-v1:0': 0.01500,
-        'anthropic.claude-3-haiku-20240307-v1:0': 0.0012500,
-        'cohere.command-text-v14': 0.00200,
-        'cohere.command-light-text-v14': 0.00060,
-        'meta.llama2-13b-chat-v1': 0.00100,
-        'meta.llama2-70b-chat-v1': 0.00256,
-        'meta.llama3-8b-instruct-v1:0': 0.0006,
-        'meta.llama3-70b-instruct-v1:0': 0.0035,
-        'mistral.mistral-large-2402-v1:0': 0.024,
-        'mistral.mistral-7b-instruct-v0:2': 0.00020,
-        'mistral.mixtral-8x7b-instruct-v0:1': 0.00070,
-        'gpt-4-0125-preview': 0.03,
-        'gpt-4-32k': 0.12
-    }
-    # Check if the provided model_id exists in our dictionary
-    if model_id in model_output_token_prices:
-        # Get the price per 1000 output tokens for the given model_id
-        price_per_1000_tokens = model_output_token_prices[model_id]
-        # Calculate the cost for the given number of output tokens
-        cost = (token_number / 1000) * price_per_1000_tokens
-        # return the final output token cost, rounded to the 8 decimal place
-        return round(cost, 8)
-    else:
-        # Return 0 if the model_id is not found in the dictionary
-        return 0
+    # Calculate the cost for the given number of output tokens from the price per token, rounded to the 8 decimal
+    # place, 0 if the model_id is not found in the dictionary
+    return round(token_number * _lookup(model_id)[1], 8)
 
 # TODO: Document this function better
 def calculate_total_price(input_tokens, output_tokens, model):
@@ -106,11 +114,13 @@ def calculate_total_price(input_tokens, output_tokens, model):
     :return: The input token cost, output token cost, and total cost, and total cost per 1000 invocations calculated based on
     the input and output tokens and the model used (float).
     """
-    # Calculate the input and output token costs
-    input_cost = calculate_input_price(input_tokens, model)
-    output_cost = calculate_output_price(output_tokens, model)
+    # Calculate the input and output token costs, from a single lookup of the prices of the model
+    input_price, output_price = _lookup(model)
+    input_cost = round(input_tokens * input_price, 8)
+    output_cost = round(output_tokens * output_price, 8)
     # Calculate the total cost
     total_cost = round(input_cost + output_cost, 6)
     total_cost_1000 = round(total_cost * 1000, 6)
     # return the final total cost, rounded to the 8 decimal place
     return input_cost, output_cost, total_cost, total_cost_1000
+
@@ -0,0 +1,135 @@
+import os
+import threading
+from functools import lru_cache
+from time import monotonic, sleep
+import logging
+import orjson
+
+# configure the logger
+logger = logging.getLogger(__name__)
+
+# The default requests per minute and tokens per minute of each model of a provider. The Amazon Bedrock on-demand
+# quotas are per model, so every model gets its own bucket with these limits, unless the rate_limits environment
+# variable sets the limits of the model or its provider, see rate_limit
+RATE_LIMITS = {
+    'anthropic': (100, 200000),
+    'mistral': (400, 300000),
+    'meta': (400, 300000),
+    'cohere': (400, 300000),
+    'amazon': (400, 300000),
+    'ai21': (400, 300000),
+}
+# the limit used for a provider that is not in RATE_LIMITS
+DEFAULT_RATE_LIMIT = (100, 200000)
+# The characters per token the tokens of a prompt are estimated with, lower than the usual 4 characters of English text,
+# so the estimate errs on the side of waiting rather than being throttled. The context budget of fit_context in
+# text_extractor_and_summarizer.py is estimated with it too, so a context that is estimated to fit is not rejected
+CHARS_PER_TOKEN = 3
+
+
+class TokenBucket:
+    """
+    This class is a token bucket rate limiter that limits both the requests and the tokens sent per minute.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        """
+        Initializes an instance of the TokenBucket class, the bucket starts full.
+        :param requests_per_minute: The number of requests allowed per minute.
+        :param tokens_per_minute: The number of tokens allowed per minute.
+        """
+        self.request_capacity = requests_per_minute
+        self.token_capacity = tokens_per_minute
+        self.request_tokens = requests_per_minute
+        self.token_tokens = tokens_per_minute
+        self.last_refill = monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        """
+        Adds the requests and tokens that were refilled since the last refill, up to the capacity of the bucket.
+        """
+        now = monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        self.request_tokens = min(self.request_capacity, self.request_tokens + elapsed * self.request_capacity / 60)
+        self.token_tokens = min(self.token_capacity, self.token_tokens + elapsed * self.token_capacity / 60)
+
+    def acquire(self, est_tokens):
+        """
+        Blocks until the bucket holds one request and the estimated tokens, and takes them out of the bucket.
+
+        :param est_tokens: The estimated number of input and output tokens of the request.
+        :return: None
+        """
+        # a request larger than the whole bucket would never fit, so it only waits for a full bucket
+        est_tokens = min(est_tokens, self.token_capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.request_tokens >= 1 and self.token_tokens >= est_tokens:
+                    self.request_tokens -= 1
+                    self.token_tokens -= est_tokens
+                    return
+                # the time until both the request and the tokens are refilled
+                wait = max((1 - self.request_tokens) * 60 / self.request_capacity,
+                           (est_tokens - self.token_tokens) * 60 / self.token_capacity)
+            logger.info(f"Rate limit reached, waiting {wait:.2f} seconds")
+            sleep(wait)
+
+
+@lru_cache(maxsize=1)
+def _configured_rate_limits():
+    """
+    Reads the rate limits of the rate_limits environment variable, a JSON object of the requests per minute and tokens
+    per minute of a model id or a provider, for example {"anthropic.claude-3-haiku-20240307-v1:0": [1000, 2000000]}.
+
+    :return: A dictionary of the (requests per minute, tokens per minute) of each model id or provider, empty if the
+    variable is not set or can not be parsed.
+    """
+    try:
+        return {key: tuple(limits) for key, limits in orjson.loads(os.getenv("rate_limits") or "{}").items()}
+    except Exception as e:
+        logger.warning(f"Could not parse the rate_limits environment variable, using the default rate limits: {e}")
+        return {}
+
+
+def rate_limit(model_id, provider):
+    """
+    Returns the rate limit of a model, the limit of the model id in the rate_limits environment variable, then of its
+    provider, then the default limit of the provider in RATE_LIMITS.
+
+    :param model_id: The ID of the model.
+    :param provider: The provider of the model, see text_extractor_and_summarizer.model_provider.
+    :return: A tuple of the requests per minute and the tokens per minute of the model.
+    """
+    configured = _configured_rate_limits()
+    return configured.get(model_id) or configured.get(provider) or RATE_LIMITS.get(provider, DEFAULT_RATE_LIMIT)
+
+
+@lru_cache(maxsize=None)
+def _bucket(model_id, provider):
+    """
+    Returns the token bucket of a model, the buckets are shared by every invocation of the model in the process.
+
+    :param model_id: The ID of the model.
+    :param provider: The provider of the model.
+    :return: The TokenBucket of the model.
+    """
+    return TokenBucket(*rate_limit(model_id, provider))
+
+
+def acquire(model_id, provider, prompt, max_tokens):
+    """
+    Waits until the model's rate limit allows another request, before the model is invoked.
+
+    :param model_id: The ID of the model that is invoked.
+    :param provider: The provider of the model, see text_extractor_and_summarizer.model_provider.
+    :param prompt: The full prompt sent to the model.
+    :param max_tokens: The maximum number of tokens the model can generate.
+    :return: None
+    """
+    # estimate the tokens of the request as the prompt tokens plus the max output tokens, from the length of the prompt
+    # rather than by tokenizing a prompt that can be hundreds of thousands of characters long on every invocation
+    est_tokens = len(prompt) // CHARS_PER_TOKEN + int(max_tokens)
+    _bucket(model_id, provider).acquire(est_tokens)
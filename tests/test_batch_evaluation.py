@@ -0,0 +1,125 @@
+import asyncio
+import math
+import threading
+from contextlib import asynccontextmanager
+
+import pytest
+
+import evaluation_steps
+from evaluation_steps import BatchEvaluator, EvalResult, SYSTEM_PROMPT_TEMPLATES, evaluate_models_batch
+
+# the request body of the batch rubric, the user prompt is spliced into its placeholder
+SYSTEM_PROMPTS = {evaluation_steps.BATCH_RUBRIC: b'{"text": "__USER_PROMPT__"}'}
+
+
+@asynccontextmanager
+async def fake_client():
+    yield object()
+
+
+def rubric(score):
+    """The tool input of a fused rubric with the same score for every criterion."""
+    return {criterion: {"score": score, "thoughts": f"{criterion} thoughts"} for criterion in SYSTEM_PROMPT_TEMPLATES}
+
+
+def tool_response(evaluations, stop_reason="tool_use"):
+    """A Claude 3 Messages API response with a call of the batch rubric tool."""
+    return {"stop_reason": stop_reason,
+            "content": [{"type": "tool_use", "input": {"evaluations": evaluations}}]}
+
+
+@pytest.fixture
+def bedrock(monkeypatch):
+    """Replaces the calls to the evaluator model, and records the models evaluated one by one."""
+    calls = {"response": None, "single": []}
+
+    async def invoke_rubric_response(client, prompt):
+        return calls["response"]
+
+    async def evaluate_criteria(client, model_name, model_summary, system_prompts):
+        calls["single"].append(model_name)
+        return {criterion: EvalResult(3, thoughts="single") for criterion in SYSTEM_PROMPT_TEMPLATES}
+
+    monkeypatch.setattr(evaluation_steps, "get_bedrock_client", fake_client)
+    monkeypatch.setattr(evaluation_steps, "_invoke_rubric_response", invoke_rubric_response)
+    monkeypatch.setattr(evaluation_steps, "evaluate_criteria", evaluate_criteria)
+    return calls
+
+
+def test_truncated_batch_falls_back_to_one_by_one(bedrock):
+    # the rubric of the second model was cut off by max_tokens
+    bedrock["response"] = tool_response([dict(rubric(5), model="a")], stop_reason="max_tokens")
+    results = asyncio.run(evaluate_models_batch(SYSTEM_PROMPTS, [("a", "summary a"), ("b", "summary b")]))
+    assert bedrock["single"] == ["a", "b"]
+    assert [final_score for final_score, _, _ in results] == [3, 3]
+    assert [rubric_row["model_name"] for _, _, rubric_row in results] == ["a", "b"]
+
+
+def test_complete_batch_is_matched_by_name_then_position(bedrock):
+    # the models are returned out of order, the second name was not repeated exactly
+    bedrock["response"] = tool_response([dict(rubric(4), model="b"), dict(rubric(2), model="model a")])
+    results = asyncio.run(evaluate_models_batch(SYSTEM_PROMPTS, [("a", "summary a"), ("b", "summary b")]))
+    assert bedrock["single"] == []
+    # a is not found by name, so it gets the evaluation at its position
+    assert [final_score for final_score, _, _ in results] == [4, 4]
+
+
+def test_missing_evaluation_is_not_scored(bedrock):
+    bedrock["response"] = tool_response([dict(rubric(4), model="a")])
+    results = asyncio.run(evaluate_models_batch(SYSTEM_PROMPTS, [("a", "summary a"), ("b", "summary b")]))
+    assert results[0][0] == 4
+    assert math.isnan(results[1][0])
+    assert all(math.isnan(results[1][2][f"model_{criterion}_score"]) for criterion in SYSTEM_PROMPT_TEMPLATES)
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """Replaces the batch evaluation, and records the batches it was called with."""
+    evaluated = []
+
+    async def evaluate_batch(system_prompts, models):
+        evaluated.append([model for model, _ in models])
+        if any(model == "failing" for model, _ in models):
+            raise RuntimeError("throttled")
+        return [(1, f"{model} summary", {"model_name": model}) for model, _ in models]
+
+    monkeypatch.setattr(evaluation_steps, "evaluate_models_batch", evaluate_batch)
+    return evaluated
+
+
+def evaluate_in_threads(batch_evaluator, models):
+    """Evaluates every model from its own thread, like final_evaluator, and returns the result or error of each."""
+    results = {}
+
+    def evaluate(model):
+        try:
+            results[model] = batch_evaluator.evaluate(model, f"{model} output")
+        except Exception as e:
+            results[model] = e
+
+    threads = [threading.Thread(target=evaluate, args=(model,)) for model in models]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+def test_batch_evaluator_evaluates_full_and_last_batches(batches):
+    results = evaluate_in_threads(BatchEvaluator(SYSTEM_PROMPTS, 3, batch_size=2), ["a", "b", "c"])
+    assert sorted(len(batch) for batch in batches) == [1, 2]
+    assert {model: result[2]["model_name"] for model, result in results.items()} == {"a": "a", "b": "b", "c": "c"}
+
+
+def test_batch_evaluator_discard_releases_the_last_batch(batches):
+    batch_evaluator = BatchEvaluator(SYSTEM_PROMPTS, 3, batch_size=3)
+    # the third model failed before its output was added, so the batch of the other two does not wait for it
+    batch_evaluator.discard("c")
+    results = evaluate_in_threads(batch_evaluator, ["a", "b"])
+    assert batches == [["a", "b"]] or batches == [["b", "a"]]
+    assert set(results) == {"a", "b"}
+
+
+def test_batch_evaluator_raises_the_error_of_the_batch_for_every_model(batches):
+    results = evaluate_in_threads(BatchEvaluator(SYSTEM_PROMPTS, 2, batch_size=2), ["failing", "b"])
+    assert all(isinstance(result, RuntimeError) for result in results.values())
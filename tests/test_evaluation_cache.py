@@ -0,0 +1,130 @@
+import hashlib
+import os
+
+import pandas as pd
+import pytest
+
+import evaluation_cache
+import evaluation_steps
+from evaluation_cache import (CACHE_POLICIES, current_cache_policy, evaluation_cache_key, load_evaluation,
+                              load_response, load_text, response_cache_key, save_evaluation, save_response, save_text)
+
+# Whether each cache policy reads and writes the cached responses and texts
+POLICY_READS_WRITES = {
+    'enabled': (True, True),
+    'replay': (True, True),
+    'write-only': (False, True),
+    'disabled': (False, False),
+}
+
+
+@pytest.fixture(autouse=True)
+def cache_folder(monkeypatch, tmp_path):
+    """Points the cache at a temporary folder, with the response cache turned on."""
+    monkeypatch.setenv('cache_folder', str(tmp_path))
+    monkeypatch.setenv('response_cache_days', '30')
+    return tmp_path
+
+
+@pytest.fixture
+def cache_policy(request):
+    """Sets the cache policy of the test, and restores the previous policy after it."""
+    token = current_cache_policy.set(request.param)
+    yield request.param
+    current_cache_policy.reset(token)
+
+
+def test_every_policy_is_covered():
+    assert set(POLICY_READS_WRITES) == set(CACHE_POLICIES)
+
+
+@pytest.mark.parametrize("cache_policy", CACHE_POLICIES, indirect=True)
+def test_response_cache_follows_the_policy(cache_policy):
+    reads, writes = POLICY_READS_WRITES[cache_policy]
+    key = response_cache_key("model", b'{"prompt": "new"}')
+    save_response(key, "new response")
+    cached_key = response_cache_key("model", b'{"prompt": "cached"}')
+    token = current_cache_policy.set('enabled')
+    save_response(cached_key, "cached response")
+    current_cache_policy.reset(token)
+    # a response is only written when the policy writes the cache
+    assert evaluation_cache._response_path(key).exists() == writes
+    # an already cached response is only read when the policy reads the cache
+    assert load_response(cached_key) == ("cached response" if reads else None)
+
+
+@pytest.mark.parametrize("cache_policy", CACHE_POLICIES, indirect=True)
+def test_text_cache_follows_the_policy(cache_policy):
+    reads, writes = POLICY_READS_WRITES[cache_policy]
+    save_text("new-pdf", "pypdf 4.2.0", "new text")
+    token = current_cache_policy.set('enabled')
+    save_text("cached-pdf", "pypdf 4.2.0", "cached text")
+    current_cache_policy.reset(token)
+    assert evaluation_cache._text_path("new-pdf", "pypdf 4.2.0").exists() == writes
+    assert load_text("cached-pdf", "pypdf 4.2.0") == ("cached text" if reads else None)
+
+
+def test_response_cache_turned_off(monkeypatch):
+    monkeypatch.setenv('response_cache_days', '0')
+    key = response_cache_key("model", b"{}")
+    save_response(key, "response")
+    assert not evaluation_cache._response_path(key).exists()
+    assert load_response(key) is None
+
+
+def test_expired_response_is_not_read():
+    key = response_cache_key("model", b"{}")
+    save_response(key, "response")
+    # written 31 days ago, past the 30 days of response_cache_days
+    expired = evaluation_cache._response_path(key).stat().st_mtime - 31 * 24 * 60 * 60
+    os.utime(evaluation_cache._response_path(key), (expired, expired))
+    assert load_response(key) is None
+
+
+def test_text_cache_is_keyed_on_the_extractor():
+    save_text("pdf", "pypdf 4.2.0", "text")
+    assert load_text("pdf", "pypdf 4.2.0") == "text"
+    assert load_text("pdf", "pymupdf 1.24.0") is None
+
+
+def test_response_cache_key_covers_the_model_and_body():
+    key = response_cache_key("model-a", b'{"prompt": 1}')
+    assert key == response_cache_key("model-a", b'{"prompt": 1}')
+    assert key != response_cache_key("model-b", b'{"prompt": 1}')
+    assert key != response_cache_key("model-a", b'{"prompt": 2}')
+
+
+def test_evaluation_cache_key_ignores_the_order_of_the_models():
+    pdf_digest = hashlib.sha256(b"pdf")
+    key = evaluation_cache_key(pdf_digest, ["a", "b"], "task", 4096)
+    assert key == evaluation_cache_key(pdf_digest, ["b", "a"], "task", "4096")
+    # the hash of the PDF itself is not changed
+    assert pdf_digest.hexdigest() == hashlib.sha256(b"pdf").hexdigest()
+
+
+def test_evaluation_cache_key_covers_every_setting(monkeypatch):
+    pdf_digest = hashlib.sha256(b"pdf")
+    key = evaluation_cache_key(pdf_digest, ["a", "b"], "task", 4096)
+    assert key != evaluation_cache_key(hashlib.sha256(b"other pdf"), ["a", "b"], "task", 4096)
+    assert key != evaluation_cache_key(pdf_digest, ["a"], "task", 4096)
+    assert key != evaluation_cache_key(pdf_digest, ["a", "b"], "other task", 4096)
+    assert key != evaluation_cache_key(pdf_digest, ["a", "b"], "task", 2048)
+    assert key != evaluation_cache_key(pdf_digest, ["a", "b"], "task", 4096, latency_optimized=True)
+    # the fields are hashed as one array, so moving text from one field to the next is a different key
+    assert evaluation_cache_key(pdf_digest, ["a"], "b", 1) != evaluation_cache_key(pdf_digest, ["ab"], "", 1)
+    for setting, value in (("EVALUATOR_MODEL_ID", "other-model"), ("use_fused_rubric", True),
+                           ("evaluation_batch_size", 3), ("performance_narrative", True)):
+        with monkeypatch.context() as patch:
+            patch.setattr(evaluation_steps, setting, value)
+            assert key != evaluation_cache_key(pdf_digest, ["a", "b"], "task", 4096), setting
+
+
+def test_evaluation_round_trip():
+    results_df = pd.DataFrame({"Model": ["a", "b"], "Summary Score": [4.5, float("nan")]})
+    score_rubric_df = pd.DataFrame({"model_name": ["a", "b"], "model_accuracy_score": [5, 4]})
+    assert load_evaluation("key") is None
+    save_evaluation("key", results_df, "summary", "costs", score_rubric_df)
+    cached_results_df, evaluation_results, costs_eval_results, cached_rubric_df = load_evaluation("key")
+    pd.testing.assert_frame_equal(cached_results_df, results_df)
+    pd.testing.assert_frame_equal(cached_rubric_df, score_rubric_df)
+    assert (evaluation_results, costs_eval_results) == ("summary", "costs")
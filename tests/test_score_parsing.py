@@ -0,0 +1,51 @@
+import pytest
+
+from evaluation_steps import EvalResult, parse_score, parse_thoughts, parse_xml, score_value
+
+
+@pytest.mark.parametrize("score, expected", [
+    ("4", 4),
+    (" 5 ", 5),
+    ("4.5", 4.5),
+    ("4.0", 4),
+    ("4/5", 4),
+    ("Score: 3 out of 5", 3),
+    (2, 2),
+    (3.5, 3.5),
+    (0, 0),
+])
+def test_score_value_reads_scores_leniently(score, expected):
+    value = score_value(score)
+    assert value == expected
+    # a whole score is an int, so it is shown without a fraction
+    assert type(value) is type(expected)
+
+
+@pytest.mark.parametrize("score", ["", None, "n/a", "six", "6", "10/10", "-1", 5.5, -0.5, float("nan"), True])
+def test_score_value_rejects_missing_and_out_of_range_scores(score):
+    assert score_value(score) is None
+
+
+def test_parse_score_and_thoughts():
+    output = "<thoughts>\nThe summary is accurate.\n</thoughts>\n<score>4</score>"
+    assert parse_score(output) == "4"
+    assert parse_thoughts(output) == "The summary is accurate."
+    assert score_value(parse_score(output)) == 4
+
+
+def test_parse_xml_missing_or_unclosed_tag():
+    assert parse_score("<thoughts>no score</thoughts>") == ""
+    assert parse_score("<score>4") == ""
+    assert score_value(parse_score("<score>4")) is None
+
+
+def test_parse_xml_nested_and_repeated_tags():
+    assert parse_xml("<a>outer <a>inner</a></a>", "a") == "outer <a>inner</a>"
+    assert parse_xml("<a>first</a> and <a>second</a>", "a") == "first second"
+
+
+def test_eval_result_parses_thoughts_on_first_access():
+    result = EvalResult(score_value("3"), "<thoughts>Clear.</thoughts><score>3</score>")
+    assert result.score == 3
+    assert result.thoughts == "Clear."
+    assert EvalResult(None, thoughts="given").thoughts == "given"
@@ -1,58 +1,412 @@
 from pypdf import PdfReader
-from dotenv import load_dotenv
-import boto3
-import json
-import os
+import orjson
 from botocore.exceptions import ClientError
 import logging
 import streamlit as st
 import csv
+import os
+import multiprocessing
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from time import monotonic
+import rate_limiter
+from rate_limiter import CHARS_PER_TOKEN
+from aws_session import create_client
 
 # Setting up a logger with default settings
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-# Loading environment variables from a .env file
-load_dotenv()
 
-if os.getenv("region_name") is None:
-    region_name = 'us-east-1'
-else:
-    region_name = os.getenv("region_name")
-    
-# Setting up the default boto3 session with a specified AWS profile name
-boto3.setup_default_session(profile_name=os.getenv("profile_name"))
 
-# Instantiating the Amazon Bedrock Runtime Client
+# The Amazon Bedrock Runtime Client, created by get_bedrock_runtime, and the lock it is created under
+_bedrock_runtime = None
+_bedrock_runtime_lock = threading.Lock()
+
+
+def get_bedrock_runtime():
+    """
+    Creates the Amazon Bedrock Runtime Client from the shared session, used when no client is passed to the invoke
+    functions. It is only created on the first invocation, so importing this module for the text extraction does not
+    set up the client. It is the only synchronous Bedrock Runtime client of the application, the evaluations and the
+    orchestrator use it too, so every synchronous call shares its connection pool, see aws_session.CLIENT_CONFIG.
+
+    :return: The shared boto3 Bedrock Runtime client.
+    """
+    global _bedrock_runtime
+    if _bedrock_runtime is None:
+        # the models are invoked from parallel threads, and boto3 can not create the session and client concurrently
+        with _bedrock_runtime_lock:
+            if _bedrock_runtime is None:
+                _bedrock_runtime = create_client("bedrock-runtime")
+    return _bedrock_runtime
 
-client = boto3.client(
-    service_name="bedrock-runtime",region_name=region_name)
 
 # Define request headers, for Amazon Bedrock Model invocations
 accept = 'application/json'
 contentType = 'application/json'
 
+# Models that Amazon Bedrock can serve with latency-optimized inference, they are only available through the
+# us. cross-region inference profiles
+LATENCY_OPTIMIZED_MODELS = frozenset({
+    'us.anthropic.claude-3-5-haiku-20241022-v1:0',
+    'us.meta.llama3-1-70b-instruct-v1:0',
+    'us.meta.llama3-1-405b-instruct-v1:0',
+})
+
+
+@lru_cache(maxsize=1)
+def latency_optimized_supported():
+    """
+    Checks whether the installed botocore knows the performanceConfigLatency argument of the Bedrock Runtime, it was
+    added in botocore 1.35.74, and older versions reject every invocation that passes it.
+
+    :return: True if latency-optimized inference can be requested, False otherwise.
+    """
+    try:
+        from botocore.session import get_session
+        operation = get_session().get_service_model("bedrock-runtime").operation_model("InvokeModel")
+        supported = "performanceConfigLatency" in operation.input_shape.members
+    except Exception as e:
+        logger.warning(f"Could not check whether botocore supports latency-optimized inference: {e}")
+        supported = False
+    if not supported:
+        logger.info("The installed botocore does not support latency-optimized inference, it requires 1.35.74 or later")
+    return supported
+
+
+def performance_config(model_id, latency_optimized=False):
+    """
+    Builds the performance configuration arguments for an Amazon Bedrock model invocation.
+
+    :param model_id: The ID of the model to invoke.
+    :param latency_optimized: Optional. Whether latency-optimized inference was requested. Defaults to False.
+    :return: The keyword arguments to pass to invoke_model, empty when the model uses standard inference.
+    """
+    # only request latency-optimized inference for the models that support it, other models reject the setting, and
+    # only if botocore knows the argument
+    if latency_optimized and model_id in LATENCY_OPTIMIZED_MODELS and latency_optimized_supported():
+        return {"performanceConfigLatency": "optimized"}
+    # standard inference is the default, so nothing is passed for it
+    return {}
+
+
+# The shortest time between two updates of a streamed text, in seconds. Every update joins the text generated so far and
+# redraws it in the UI, so updating on every chunk would copy a long output once per chunk
+STREAM_UPDATE_SECONDS = 0.25
+
+
+class StreamedText:
+    """
+    This class collects the parts of a streamed output, and passes the text generated so far to on_token on the first
+    part, then at most every STREAM_UPDATE_SECONDS, and once more with the whole text when the stream ends.
+    """
+
+    def __init__(self, model_id, on_token=None):
+        """
+        Initializes an instance of the StreamedText class.
+        :param model_id: The ID of the model the output is streamed from.
+        :param on_token: Optional. A callback called with the model ID and the text generated so far.
+        """
+        self.model_id = model_id
+        self.on_token = on_token
+        self.parts = []
+        self.last_update = None
+        self.updated = True
+
+    def append(self, text):
+        """
+        Adds a part of the output, and passes the text generated so far to on_token if an update is due.
+        :param text: The text of the part.
+        """
+        self.parts.append(text)
+        self.updated = False
+        if self.on_token is None:
+            return
+        now = monotonic()
+        # the first part is passed at once, so the time to the first token is not delayed by the throttling
+        if self.last_update is None or now - self.last_update >= STREAM_UPDATE_SECONDS:
+            self.last_update = now
+            self.updated = True
+            self.on_token(self.model_id, "".join(self.parts))
+
+    def finish(self):
+        """
+        Joins the whole output, and passes it to on_token unless the last update already had every part.
+        :return: The output text.
+        """
+        output_text = "".join(self.parts)
+        if self.on_token is not None and not self.updated:
+            self.on_token(self.model_id, output_text)
+        return output_text
+
+
+def _stream_output(model_id, response, extract_text, on_token):
+    """
+    Reads a streamed Amazon Bedrock response, passing the text generated so far to on_token while it is generated.
+
+    :param model_id: The ID of the model that was invoked.
+    :param response: The response of invoke_model_with_response_stream.
+    :param extract_text: A function that returns the generated text of a decoded chunk, or None if it has none.
+    :param on_token: A callback called with the model ID and the text generated so far, see StreamedText.
+    :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
+    """
+    # the parts are collected in a list, and only joined for the throttled updates and once at the end
+    streamed_text = StreamedText(model_id, on_token)
+    input_tokens = 0
+    output_tokens = 0
+    for event in response.get("body"):
+        chunk = event.get("chunk")
+        if not chunk:
+            continue
+        # Decode the chunk
+        chunk_body = orjson.loads(chunk.get("bytes"))
+        # Add the generated text of the chunk to the output text, it is passed to the callback when an update is due
+        text = extract_text(chunk_body)
+        if text:
+            streamed_text.append(text)
+        # the last chunk holds the token counts of the whole invocation, for every provider
+        invocation_metrics = chunk_body.get("amazon-bedrock-invocationMetrics")
+        if invocation_metrics:
+            input_tokens = invocation_metrics["inputTokenCount"]
+            output_tokens = invocation_metrics["outputTokenCount"]
+    # Return the output text, input tokens, and output tokens
+    return streamed_text.finish(), input_tokens, output_tokens
+
+
+# the minimum number of pages each pypdf worker process extracts, smaller PDFs are extracted in this process
+PARALLEL_MIN_PAGES = 24
+
+
+@lru_cache(maxsize=1)
+def _pymupdf():
+    """
+    Imports PyMuPDF, which extracts text far faster than pypdf. It is optional, see text_extraction.
+
+    :return: The pymupdf module, or None if PyMuPDF is not installed.
+    """
+    try:
+        import pymupdf
+    except ImportError:
+        try:
+            # the module name of PyMuPDF before 1.24
+            import fitz as pymupdf
+        except ImportError:
+            return None
+    return pymupdf
+
+
+def _join_until(page_texts):
+    """
+    Joins the texts of the pages, and stops extracting pages once the text is longer than MAX_TEXT_CHARS.
+
+    :param page_texts: An iterable of the text of each page, that extracts the pages as they are read.
+    :return: The text of every page up to the one that reached MAX_TEXT_CHARS, each followed by a newline.
+    """
+    # Collecting the text of each page, followed by a newline to separate them, and joining them once at the end, as
+    # appending to a string would copy all the text extracted so far for every page
+    parts = []
+    total = 0
+    for page_text in page_texts:
+        parts.append(page_text)
+        parts.append("\n")
+        total += len(page_text) + 1
+        # the rest of the pages would not fit in the context window of any model
+        if total > MAX_TEXT_CHARS:
+            break
+    return "".join(parts)
+
+
+def _join_pages(pages):
+    """
+    Extracts the text of pypdf pages.
+
+    :param pages: The pypdf pages.
+    :return: The text of every page, each followed by a newline, see _join_until.
+    """
+    # a page without a text layer can return None
+    return _join_until(page.extract_text() or "" for page in pages)
+
+
+def _pypdf_page_range(pdf_bytes, start, stop):
+    """
+    Extracts the text of a range of pages with pypdf, in a worker process of _pypdf_text.
+
+    :param pdf_bytes: The contents of the PDF file.
+    :param start: The index of the first page.
+    :param stop: The index after the last page.
+    :return: A list of the text of each page in the range, up to the page that reached MAX_TEXT_CHARS in the range.
+    """
+    reader = PdfReader(BytesIO(pdf_bytes))
+    page_texts = []
+    total = 0
+    for index in range(start, stop):
+        # a page without a text layer can return None
+        page_texts.append(reader.pages[index].extract_text() or "")
+        total += len(page_texts[-1]) + 1
+        # the text of the range alone is already too long, so _pypdf_text stops joining within this range
+        if total > MAX_TEXT_CHARS:
+            break
+    return page_texts
+
+
+def _pypdf_text(pdf_bytes, pdf_path):
+    """
+    Extracts the text of a PDF file with pypdf. pypdf is pure Python and holds the GIL, so the pages of large PDFs are
+    extracted in ranges by a process per CPU core.
+
+    :param pdf_bytes: The contents of the PDF file, they are also sent to every worker process.
+    :param pdf_path: The path to the PDF file, for the log.
+    :return: The text of every page, each followed by a newline, see _join_until.
+    """
+    # Creating a PdfReader object to read the PDF file from memory
+    reader = PdfReader(BytesIO(pdf_bytes))
+    page_count = len(reader.pages)
+    # every process parses the whole PDF again, so each one is given at least PARALLEL_MIN_PAGES pages
+    workers = min(os.cpu_count() or 1, page_count // PARALLEL_MIN_PAGES)
+    if workers < 2:
+        return _join_pages(reader.pages)
+    # one contiguous range of pages per process, rather than a task per page, so the PDF is parsed once per process
+    bounds = [page_count * worker // workers for worker in range(workers + 1)]
+    # the app runs the extraction from a streamlit thread, forking a process with other threads running can deadlock
+    # it, so the workers are started by a fork server, or spawned where there is none
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method)) as pool:
+            # map returns the ranges in page order, the pages of every range are joined as one sequence so the text
+            # stops at the same page as in a single process. Every range is extracted at the same time, so the ranges
+            # after MAX_TEXT_CHARS are still extracted, only each range stops early on its own
+            ranges = pool.map(_pypdf_page_range, [pdf_bytes] * workers, bounds[:-1], bounds[1:])
+            return _join_until(page_text for page_texts in ranges for page_text in page_texts)
+    except BrokenProcessPool as e:
+        logger.warning(f"The pypdf worker processes failed, extracting the text of {pdf_path} in this process: {e}")
+        return _join_pages(reader.pages)
+
+
+def _pymupdf_text(pymupdf, pdf_bytes):
+    """
+    Extracts the text of a PDF file with PyMuPDF.
+
+    :param pymupdf: The pymupdf module, see _pymupdf.
+    :param pdf_bytes: The contents of the PDF file.
+    :return: The text of every page, each followed by a newline.
+    """
+    # the document is opened from memory and closed as soon as the text is read
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as document:
+        # the text is read in the order it is stored in the PDF, like pypdf, rather than sorted by position. PyMuPDF
+        # ends the text of a page with a newline already, so the pages are separated by a single newline like pypdf
+        return _join_until(page.get_text("text", sort=False).rstrip("\n") for page in document)
+
+
+@lru_cache(maxsize=1)
+def _pdftotext():
+    """
+    Looks up the pdftotext command of Poppler, which is used to extract the text when PyMuPDF is not installed.
+
+    :return: The path of the pdftotext executable, or None if it is not on the PATH.
+    """
+    return shutil.which("pdftotext")
+
+
+def _pdftotext_text(pdftotext, pdf_path):
+    """
+    Extracts the text of a PDF file with the pdftotext command.
+
+    :param pdftotext: The path of the pdftotext executable, see _pdftotext.
+    :param pdf_path: The path to the PDF file.
+    :return: The text of every page, each followed by a newline.
+    """
+    # the text is written to stdout in UTF-8, in reading order, as -layout would pad the columns with spaces
+    result = subprocess.run([pdftotext, "-enc", "UTF-8", str(pdf_path), "-"], capture_output=True, check=True,
+                            timeout=300)
+    # pdftotext ends every page with a form feed, the pages are separated by a single newline like pypdf
+    pages = result.stdout.decode("utf-8", errors="replace").split("\f")
+    # the text after the last form feed is empty
+    if pages and not pages[-1].strip():
+        pages.pop()
+    return _join_until(page.rstrip("\n") for page in pages)
+
+
+def _try_extract(name, pdf_path, extract, *args):
+    """
+    Extracts the text of a PDF file with one of the optional extractors.
+
+    :param name: The name of the extractor, for the log.
+    :param pdf_path: The path to the PDF file, for the log.
+    :param extract: The function of the extractor.
+    :param args: The arguments of the function.
+    :return: The extracted text, or None if the extractor could not read the file.
+    """
+    try:
+        return extract(*args)
+    except Exception as e:
+        logger.warning(f"{name} could not extract the text of {pdf_path}, falling back to the next extractor: {e}")
+        return None
+
+
+@lru_cache(maxsize=1)
+def text_extraction_tag():
+    """
+    Returns a tag of the extractor text_extraction uses and its version, the extracted text of a PDF is cached under
+    it so a cached text is not reused once a different extractor or version would extract it differently, see
+    evaluation_cache.load_text.
+
+    :return: The name and version of the preferred extractor that is available, and MAX_TEXT_CHARS (str).
+    """
+    pymupdf = _pymupdf()
+    pdftotext = _pdftotext()
+    if pymupdf is not None:
+        # the version attribute of PyMuPDF before 1.24
+        extractor = f"pymupdf-{getattr(pymupdf, '__version__', None) or getattr(pymupdf, 'VersionBind', '')}"
+    elif pdftotext is not None:
+        try:
+            # pdftotext prints its version to stderr
+            result = subprocess.run([pdftotext, "-v"], capture_output=True, timeout=10)
+            version = (result.stderr or result.stdout).decode("utf-8", errors="replace").splitlines()[0]
+        except Exception as e:
+            logger.warning(f"Could not read the version of pdftotext: {e}")
+            version = ""
+        extractor = f"pdftotext-{version}"
+    else:
+        import pypdf
+        extractor = f"pypdf-{pypdf.__version__}"
+    return f"{extractor}-{MAX_TEXT_CHARS}"
+
 
 def text_extraction(pdf_path):
     """
-    Extracts text from a PDF file.
+    Extracts text from a PDF file, with the fastest extractor that is available and can read the file: PyMuPDF when
+    it is installed, then the pdftotext command when it is on the PATH, and pypdf otherwise.
 
     :param pdf_path: The path to the PDF file.
     :return: The extracted text from the PDF file as a string.
     """
-    # Creating a PdfReader object to read the PDF file
-    reader = PdfReader(pdf_path)
-    # Initializing an empty string to store the extracted text
-    text = ""
-    # Looping through each page of the PDF and extracting text
-    for page in reader.pages:
-        # Extracting text from the current page and appending it to the text variable
-        text += page.extract_text()
-        # Adding a newline character after each page's text to separate them
-        text += "\n"
+    text = None
+    # Reading the file once, PyMuPDF and pypdf parse the PDF from memory instead of with many small reads of the file
+    pdf_bytes = Path(pdf_path).read_bytes()
+    # PyMuPDF extracts the text in the process, without starting a command
+    pymupdf = _pymupdf()
+    if pymupdf is not None:
+        text = _try_extract("PyMuPDF", pdf_path, _pymupdf_text, pymupdf, pdf_bytes)
+    pdftotext = _pdftotext()
+    # pdftotext reads the file itself, in its own process
+    if text is None and pdftotext is not None:
+        text = _try_extract("pdftotext", pdf_path, _pdftotext_text, pdftotext, pdf_path)
+    if text is None:
+        text = _pypdf_text(pdf_bytes, pdf_path)
+    # the pages are extracted in parallel ranges by pypdf, so the text can still be longer than MAX_TEXT_CHARS
+    if len(text) > MAX_TEXT_CHARS:
+        st.warning(f"The extracted text from the PDF is longer than the context window of any of the models, only the "
+                   f"first {MAX_TEXT_CHARS} characters are evaluated")
+        text = text[:MAX_TEXT_CHARS]
     # Returning the concatenated text extracted from all pages of the PDF file
-    if len(text) > 12000:
+    elif len(text) > 12000:
         st.warning("The extracted text from the PDF may be longer than some of the models input tokens. Proceed with Caution")
-        print("extracted text from the PDF may be longer than some model's input token maximums... proceeding with caution ")
 
     return text
 
@@ -94,28 +448,104 @@ def text_formatter(text_list):
         formatted_text +=  f"{i+1}. {text}\n"
     return formatted_text
 
-def invoke_anthropic(model_id, prompt="", prompt_context="", max_tokens="4096"):
+# The context window of each model in tokens, shared by the prompt and the generated tokens. The models that are not
+# listed are invoked with the whole prompt context
+MODEL_CONTEXT_WINDOWS = {
+    'anthropic.claude-instant-v1': 100000,
+    'anthropic.claude-v2': 100000,
+    'anthropic.claude-v2:1': 200000,
+    'anthropic.claude-3-haiku-20240307-v1:0': 200000,
+    'anthropic.claude-3-sonnet-20240229-v1:0': 200000,
+    'us.anthropic.claude-3-5-haiku-20241022-v1:0': 200000,
+    'mistral.mistral-7b-instruct-v0:2': 32000,
+    'mistral.mixtral-8x7b-instruct-v0:1': 32000,
+    'mistral.mistral-large-2402-v1:0': 32000,
+    'meta.llama2-13b-chat-v1': 4096,
+    'meta.llama2-70b-chat-v1': 4096,
+    'meta.llama3-8b-instruct-v1:0': 8192,
+    'meta.llama3-70b-instruct-v1:0': 8192,
+    'us.meta.llama3-1-70b-instruct-v1:0': 128000,
+    'us.meta.llama3-1-405b-instruct-v1:0': 128000,
+    'cohere.command-text-v14': 4096,
+    'cohere.command-light-text-v14': 4096,
+    'amazon.titan-text-lite-v1': 4096,
+    'amazon.titan-text-express-v1': 8192,
+    'ai21.j2-mid-v1': 8191,
+    'ai21.j2-ultra-v1': 8191,
+}
+
+
+def fit_context(model_id, prompt, prompt_context, max_tokens):
     """
-    Invokes an Anthropic model using Amazon Bedrock and the specified parameters.
+    Shortens the prompt context to the characters that fit in the context window of the model, next to the prompt
+    and the generated tokens, so an oversized PDF is neither rejected by the model nor billed beyond what it can read.
 
-    :param model_id: The ID of the Anthropic model to invoke.
-    :param prompt: Optional. The default prompt highlighting the task the model is trying to perform, defined in the orchestrator.py file.
+    :param model_id: The ID of the model that is invoked.
+    :param prompt: The task prompt.
     :param prompt_context: The prompt context includes the extracted text from the PDF file.
-    :param max_tokens: Optional. The maximum number of tokens to generate. Defaults to the value of the 'max_tokens' environment variable.
-    :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
+    :param max_tokens: The maximum number of tokens the model can generate.
+    :return: The prompt context, or its beginning if it does not fit.
     """
-    # Print the model ID (for debugging purposes)
-    # TODO: Do we want to take this out?
-    
-    if max_tokens is None:
-        max_tokens = "4096"
-    
-    print(model_id)
-    # If prompt_context is provided, prepend it to the prompt
-    if prompt_context:
-        prompt=f"Human: \n\n {prompt} \n\n <context>{prompt_context}</context> \n Assistant: \n\n"
-    # Define the request body for invoking the Anthropic model, using the messages API structure
-    request_body = {
+    context_window = MODEL_CONTEXT_WINDOWS.get(model_id)
+    if context_window is None:
+        return prompt_context
+    # the generated tokens keep at most a quarter of the window, so a max_tokens as large as the window of the small
+    # models does not leave the context empty
+    reserved_tokens = min(int(max_tokens or 4096), context_window // 4)
+    # the characters left for the context, the template adds a few characters that the margin of CHARS_PER_TOKEN covers
+    budget = max((context_window - reserved_tokens) * CHARS_PER_TOKEN - len(prompt), 0)
+    if len(prompt_context) <= budget:
+        return prompt_context
+    logger.warning(f"The prompt context of {model_id} was shortened from {len(prompt_context)} to {budget} characters "
+                   f"to fit its context window of {context_window} tokens")
+    return prompt_context[:budget]
+
+
+# The most characters of text that are extracted from a PDF, the longest prompt context any of the models can read
+MAX_TEXT_CHARS = max(MODEL_CONTEXT_WINDOWS.values()) * CHARS_PER_TOKEN
+
+
+# The template the task prompt and the extracted text are combined with, and the Human/Assistant shell of Anthropic
+CONTEXT_TEMPLATE = "{prompt} \n\n <context>{prompt_context}</context>"
+ANTHROPIC_CONTEXT_TEMPLATE = "Human: \n\n {prompt} \n\n <context>{prompt_context}</context> \n Assistant: \n\n"
+
+
+def wrap_prompt(prompt, prompt_context, template=CONTEXT_TEMPLATE):
+    """
+    Combines the task prompt with the prompt context. It is not memoized, the context is shortened to the context
+    window of each model by fit_context, and hashing the whole extracted text to look it up costs about as much as the
+    copy it would save, while keeping the texts of earlier documents alive.
+
+    :param prompt: The task prompt.
+    :param prompt_context: The prompt context includes the extracted text from the PDF file.
+    :param template: Optional. The template of the combined prompt. Defaults to CONTEXT_TEMPLATE.
+    :return: The combined prompt as a string.
+    """
+    return template.format(prompt=prompt, prompt_context=prompt_context)
+
+
+def _header_token_counts(response):
+    """
+    Returns the token counts Amazon Bedrock reports in the headers of a response, for the providers whose response
+    body does not hold them.
+
+    :param response: The response of invoke_model.
+    :return: A tuple of the number of input tokens and the number of output tokens.
+    """
+    headers = response['ResponseMetadata']['HTTPHeaders']
+    return int(headers['x-amzn-bedrock-input-token-count']), int(headers['x-amzn-bedrock-output-token-count'])
+
+
+def _anthropic_body(prompt, max_tokens, stream):
+    """
+    Builds the request body of an Anthropic model, using the messages API structure.
+
+    :param prompt: The full prompt.
+    :param max_tokens: The maximum number of tokens to generate.
+    :param stream: Whether the response is streamed.
+    :return: The request body as a dict.
+    """
+    return {
         "anthropic_version": "bedrock-2023-05-31",
         "max_tokens": max_tokens,
         "messages": [
@@ -131,281 +561,214 @@ def invoke_anthropic(model_id, prompt="", prompt_context="", max_tokens="4096"):
         ],
     }
 
-    try:
-        # Invoke the Anthropic model through Bedrock using the defined request body
-        response = client.invoke_model(
-            modelId=model_id,
-            body=json.dumps(request_body),
-        )
-        # Extract information from the response
-        result = json.loads(response.get("body").read())
-        # Extract the input tokens from the response
-        input_tokens = result["usage"]["input_tokens"]
-        # Extract the output tokens from the response
-        output_tokens = result["usage"]["output_tokens"]
-        # Extract the output text from the response
-        output_text = result["content"][0]["text"]
-        # Return the output text, input tokens, and output tokens
-        return output_text, input_tokens, output_tokens
-    except ClientError as err:
-        # Log and raise an error if invoking the model fails
-        logger.error(
-            "Couldn't invoke {model_id}. Here's why: %s: %s",
-            err.response["Error"]["Code"],
-            err.response["Error"]["Message"],
-        )
-        raise
 
+def _anthropic_output(response, response_body):
+    """
+    Reads the output of an Anthropic model.
 
-def invoke_meta(model_id, prompt="", prompt_context="", max_tokens='4096'):
+    :param response: The response of invoke_model.
+    :param response_body: The decoded response body.
+    :return: A tuple containing the generated output text, the number of input tokens and the number of output tokens.
     """
-    Invokes a Meta model using Amazon Bedrock and the specified parameters.
+    return (response_body["content"][0]["text"], response_body["usage"]["input_tokens"],
+            response_body["usage"]["output_tokens"])
 
-    :param model_id: The ID of the Meta model to invoke.
-    :param prompt: Optional. The default prompt highlighting the task the model is trying to perform, defined in the orchestrator.py file.
-    :param prompt_context: The prompt context includes the extracted text from the PDF file.
-    :param max_tokens: Optional. The maximum number of tokens to generate. Defaults to the value of the 'max_tokens' environment variable.
-    :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
+
+def _meta_body(prompt, max_tokens, stream):
     """
-    # Print the model ID (for debugging purposes)
-    # TODO: Do we want to take this out?
-    print(model_id)
-    
-    # If prompt_context is provided, prepend it to the prompt
-    if prompt_context:
-        prompt=f"{prompt} \n\n <context>{prompt_context}</context>"
-    # Define the request body for invoking the Meta model
-    request_body = json.dumps({"prompt": prompt,
-                               "max_gen_len": max_tokens,
-                               "temperature": 0.5,
-                               "top_p": 0.5
-                               })
-    try:
-        # Invoke the Meta model using the defined request body and headers
-        response = client.invoke_model(
-            modelId=model_id,
-            body=request_body,
-            accept=accept,
-            contentType=contentType
-        )
-        # Extract information from the response
-        response_body = json.loads(response.get('body').read())
-        # Extract the input tokens from the response
-        input_tokens = response_body['prompt_token_count']
-        # Extract the output tokens from the response
-        output_tokens = response_body['generation_token_count']
-        # Extract the output text from the response
-        output_text = response_body['generation']
-        # Return the output text, input tokens, and output tokens
-        return output_text, input_tokens, output_tokens
-    except ClientError as err:
-        # Log and raise an error if invoking the model fails
-        logger.error(
-            "Couldn't invoke {model_id}. Here's why: %s: %s",
-            err.response["Error"]["Code"],
-            err.response["Error"]["Message"],
-        )
-        raise
+    Builds the request body of a Meta model, see _anthropic_body.
+    """
+    return {"prompt": prompt, "max_gen_len": max_tokens, "temperature": 0.5, "top_p": 0.5}
 
 
-def invoke_mistral(model_id, prompt="", prompt_context="", max_tokens='4096'):
+def _meta_output(response, response_body):
     """
-        Invokes a Mistral model using Amazon Bedrock and the specified parameters.
+    Reads the output of a Meta model, see _anthropic_output.
+    """
+    return response_body['generation'], response_body['prompt_token_count'], response_body['generation_token_count']
 
-        :param model_id: The ID of the Mistral model to invoke.
-        :param prompt: Optional. The default prompt highlighting the task the model is trying to perform, defined in the orchestrator.py file.
-        :param prompt_context: The prompt context includes the extracted text from the PDF file.
-        :param max_tokens: Optional. The maximum number of tokens to generate. Defaults to the value of the 'max_tokens' environment variable.
-        :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
-        """
-    # Print the model ID (for debugging purposes)
-    # TODO: Do we want to take this out?
-    print(model_id)
-    # If prompt_context is provided, prepend it to the prompt
-    if prompt_context:
-        prompt=f"{prompt} \n\n <context>{prompt_context}</context>"
-    # Define the request body for invoking the Mistral model
-    request_body = json.dumps({"prompt": prompt,
-                               "max_tokens": max_tokens,
-                               "temperature": 0,
-                               "top_k": 200,
-                               "top_p": 0.5
-                               })
-    try:
-        # Invoke the Mistral model using the defined request body and headers
-        response = client.invoke_model(
-            modelId=model_id,
-            body=request_body,
-            accept=accept,
-            contentType=contentType
-        )
-        # Extract information from the response
-        response_body = json.loads(response.get('body').read())
-        # Extract the input tokens from the response
-        input_tokens = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-input-token-count'])
-        # Extract the output tokens from the response
-        output_tokens = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-output-token-count'])
-        # Extract the output text from the response
-        output_text = response_body['outputs'][0]['text']
-        # Return the output text, input tokens, and output tokens
-        return output_text, input_tokens, output_tokens
-    except ClientError as err:
-        # Log and raise an error if invoking the model fails
-        logger.error(
-            "Couldn't invoke {model_id}. Here's why: %s: %s",
-            err.response["Error"]["Code"],
-            err.response["Error"]["Message"],
-        )
-        raise
 
+def _mistral_body(prompt, max_tokens, stream):
+    """
+    Builds the request body of a Mistral model, see _anthropic_body.
+    """
+    return {"prompt": prompt, "max_tokens": max_tokens, "temperature": 0, "top_k": 200, "top_p": 0.5}
 
-def invoke_cohere(model_id, prompt="", prompt_context="",  max_tokens='4096'):
+
+def _mistral_output(response, response_body):
+    """
+    Reads the output of a Mistral model, see _anthropic_output.
     """
-        Invokes a Cohere model using Amazon Bedrock and the specified parameters.
+    return (response_body['outputs'][0]['text'],) + _header_token_counts(response)
 
-        :param model_id: The ID of the Cohere model to invoke.
-        :param prompt: Optional. The default prompt highlighting the task the model is trying to perform, defined in the orchestrator.py file.
-        :param prompt_context: The prompt context includes the extracted text from the PDF file.
-        :param max_tokens: Optional. The maximum number of tokens to generate. Defaults to the value of the 'max_tokens' environment variable.
-        :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
-        """
-    # Print the model ID (for debugging purposes)
-    # TODO: Do we want to take this out?
-    print(model_id)
-    # If prompt_context is provided, prepend it to the prompt
-    if prompt_context:
-        prompt=f"{prompt} \n\n <context>{prompt_context}</context>"
-    # Define the request body for invoking the Cohere model
-    request_body = json.dumps({"prompt": prompt,
-                               "max_tokens": max_tokens,
-                               "temperature": 0.5,
-                               })
-    try:
-        # Invoke the Cohere model using the defined request body and headers
-        response = client.invoke_model(
-            modelId=model_id,
-            body=request_body,
-            accept=accept,
-            contentType=contentType
-        )
-        # Extract information from the response
-        response_body = json.loads(response.get('body').read())
-        # Extract the input tokens from the response
-        input_tokens = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-input-token-count'])
-        # Extract the output tokens from the response
-        output_tokens = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-output-token-count'])
-        # Extract the output text from the response
-        output_text = response_body['generations'][0]['text']
-        # Return the output text, input tokens, and output tokens
-        return output_text, input_tokens, output_tokens
-    except ClientError as err:
-        # Log and raise an error if invoking the model fails
-        logger.error(
-            "Couldn't invoke {model_id}. Here's why: %s: %s",
-            err.response["Error"]["Code"],
-            err.response["Error"]["Message"],
-        )
-        raise
 
+def _cohere_body(prompt, max_tokens, stream):
+    """
+    Builds the request body of a Cohere model, see _anthropic_body. Cohere only streams the response when it is asked
+    to.
+    """
+    return {"prompt": prompt, "max_tokens": max_tokens, "temperature": 0.5, "stream": stream}
 
-def invoke_amazon(model_id, prompt="", prompt_context="", max_tokens='4096'):
+
+def _cohere_stream_text(chunk):
     """
-        Invokes an Amazon model using Amazon Bedrock and the specified parameters.
+    Returns the generated text of a streamed Cohere chunk.
 
-        :param model_id: The ID of the Amazon model to invoke.
-        :param prompt: Optional. The default prompt highlighting the task the model is trying to perform, defined in the orchestrator.py file.
-        :param prompt_context: The prompt context includes the extracted text from the PDF file.
-        :param max_tokens: Optional. The maximum number of tokens to generate. Defaults to the value of the 'max_tokens' environment variable.
-        :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
-        """
-    # Print the model ID (for debugging purposes)
-    # TODO: Do we want to take this out?
-    print(model_id)
-    # If prompt_context is provided, prepend it to the prompt
-    if prompt_context:
-        prompt=f"{prompt} \n\n <context>{prompt_context}</context>"
-    # Define the request body for invoking the Amazon model
-    request_body = json.dumps({"inputText": prompt,
-                               "textGenerationConfig": {
-                                   "maxTokenCount": max_tokens,
-                                   "stopSequences": [],
-                                   "temperature": 0.5,
-                                   "topP": 0.5
-                               }})
-    try:
-        # Invoke the Amazon model using the defined request body and headers
-        response = client.invoke_model(
-            modelId=model_id,
-            body=request_body,
-            accept=accept,
-            contentType=contentType
-        )
-        # Extract information from the response
-        response_body = json.loads(response.get('body').read())
-        # Extract the input tokens from the response
-        input_tokens = response_body['inputTextTokenCount']
-        # Extract the output tokens from the response
-        output_tokens = response_body['results'][0]['tokenCount']
-        # Extract the output text from the response
-        output_text = response_body['results'][0]['outputText']
-        # Return the output text, input tokens, and output tokens
-        return output_text, input_tokens, output_tokens
-    except ClientError as err:
-        # Log and raise an error if invoking the model fails
-        logger.error(
-            "Couldn't invoke {model_id}. Here's why: %s: %s",
-            err.response["Error"]["Code"],
-            err.response["Error"]["Message"],
-        )
-        raise
+    :param chunk: The decoded chunk.
+    :return: The generated text of the chunk, or None if it has none.
+    """
+    # the chunks either hold a list of generations, or a single text generation event
+    if chunk.get("generations"):
+        return chunk["generations"][0].get("text")
+    if chunk.get("event_type", "text-generation") == "text-generation":
+        return chunk.get("text")
+    return None
 
 
-def invoke_AI21(model_id, prompt="", prompt_context="", max_tokens='4096'):
+def _cohere_output(response, response_body):
+    """
+    Reads the output of a Cohere model, see _anthropic_output.
     """
-        Invokes an AI21 model using Amazon Bedrock and the spescified parameters.
+    return (response_body['generations'][0]['text'],) + _header_token_counts(response)
 
-        :param model_id: The ID of the AI21 model to invoke.
-        :param prompt: Optional. The default prompt highlighting the task the model is trying to perform, defined in the orchestrator.py file.
-        :param prompt_context: The prompt context includes the extracted text from the PDF file.
-        :param max_tokens: Optional. The maximum number of tokens to generate. Defaults to the value of the 'max_tokens' environment variable.
-        :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
-        """
-    # Print the model ID (for debugging purposes)
-    # TODO: Do we want to take this out?
-    print(model_id)
+
+def _amazon_body(prompt, max_tokens, stream):
+    """
+    Builds the request body of an Amazon model, see _anthropic_body.
+    """
+    return {"inputText": prompt,
+            "textGenerationConfig": {
+                "maxTokenCount": max_tokens,
+                "stopSequences": [],
+                "temperature": 0.5,
+                "topP": 0.5
+            }}
+
+
+def _amazon_output(response, response_body):
+    """
+    Reads the output of an Amazon model, see _anthropic_output.
+    """
+    result = response_body['results'][0]
+    return result['outputText'], response_body['inputTextTokenCount'], result['tokenCount']
+
+
+def _ai21_body(prompt, max_tokens, stream):
+    """
+    Builds the request body of an AI21 model, see _anthropic_body.
+    """
+    return {"prompt": prompt, "maxTokens": max_tokens, "temperature": 0.5, "topP": 0.5, "stopSequences": []}
+
+
+def _ai21_output(response, response_body):
+    """
+    Reads the output of an AI21 model, see _anthropic_output.
+    """
+    return (response_body['completions'][0]['data']['text'],) + _header_token_counts(response)
+
+
+# The invocation of each model provider, as a tuple of the template of the prompt, the function that builds the request
+# body, the function that returns the generated text of a streamed chunk, or None if the provider can not stream, and
+# the function that reads the output text and token counts of a response. A model belongs to the first provider that
+# is part of its id
+PROVIDERS = {
+    'anthropic': (ANTHROPIC_CONTEXT_TEMPLATE, _anthropic_body,
+                  # only the content block deltas hold generated text
+                  lambda chunk: chunk["delta"].get("text") if chunk.get("type") == "content_block_delta" else None,
+                  _anthropic_output),
+    'mistral': (CONTEXT_TEMPLATE, _mistral_body,
+                lambda chunk: chunk['outputs'][0]['text'] if chunk.get('outputs') else None,
+                _mistral_output),
+    'meta': (CONTEXT_TEMPLATE, _meta_body, lambda chunk: chunk.get('generation'), _meta_output),
+    'cohere': (CONTEXT_TEMPLATE, _cohere_body, _cohere_stream_text, _cohere_output),
+    'amazon': (CONTEXT_TEMPLATE, _amazon_body, lambda chunk: chunk.get('outputText'), _amazon_output),
+    # AI21 Jurassic models do not support streaming
+    'ai21': (CONTEXT_TEMPLATE, _ai21_body, None, _ai21_output),
+}
+
+
+def model_provider(model_id):
+    """
+    Returns the provider of a model.
+
+    :param model_id: The ID of the model.
+    :return: The first provider in PROVIDERS that is part of the model id, or None if the provider is not supported.
+    """
+    return next((provider for provider in PROVIDERS if provider in model_id), None)
+
+
+def invoke(model_id, prompt="", prompt_context="", max_tokens="4096", latency_optimized=False, on_token=None,
+           client=None, provider=None, on_request=None):
+    """
+    Invokes a model using Amazon Bedrock and the specified parameters, with the request body and response format of
+    its provider, see PROVIDERS.
+
+    :param model_id: The ID of the model to invoke.
+    :param prompt: Optional. The default prompt highlighting the task the model is trying to perform, defined in the orchestrator.py file.
+    :param prompt_context: The prompt context includes the extracted text from the PDF file.
+    :param max_tokens: Optional. The maximum number of tokens to generate. Defaults to the value of the 'max_tokens' environment variable.
+    :param latency_optimized: Optional. Use latency-optimized inference if the model supports it. Defaults to False.
+    :param on_token: Optional. A callback called with the model ID and the text generated so far, the response is streamed when it is set.
+    :param client: Optional. The Amazon Bedrock Runtime client to invoke the model with. Defaults to the shared client
+    of get_bedrock_runtime.
+    :param provider: Optional. The provider of the model. Defaults to the provider of the model id, see model_provider.
+    :param on_request: Optional. A callback called right before the request is sent, once the rate limit allows it.
+    :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
+    """
+    if provider is None:
+        provider = model_provider(model_id)
+    if provider not in PROVIDERS:
+        raise ValueError(f"The provider of {model_id} is not supported")
+    template, build_body, stream_text, read_output = PROVIDERS[provider]
+    # the max tokens are converted once, so every provider gets a number in its request body, whether they were read
+    # from the environment as a string or not
+    max_tokens = int(max_tokens or os.getenv("max_tokens") or 4096)
+    # Log the model ID (for debugging purposes), without writing to stdout from every concurrent invocation
+    logger.debug(f"Invoking {model_id}")
     # If prompt_context is provided, prepend it to the prompt
     if prompt_context:
-        prompt=f"{prompt} \n\n <context>{prompt_context}</context>"
-    # Define the request body for invoking the AI21 model
-    request_body = json.dumps({"prompt": prompt,
-                               "maxTokens": max_tokens,
-                               "temperature": 0.5,
-                               "topP": 0.5,
-                               "stopSequences": [],
-                               })
+        # shorten the context to what fits in the context window of the model
+        prompt_context = fit_context(model_id, prompt, prompt_context, max_tokens)
+        prompt = wrap_prompt(prompt, prompt_context, template)
+    # the response is only streamed if the provider can stream it
+    stream = on_token is not None and stream_text is not None
+    # Define the request body for invoking the model
+    request_body = orjson.dumps(build_body(prompt, max_tokens, stream))
+    # use the module's Bedrock Runtime client unless a client was passed in
+    if client is None:
+        client = get_bedrock_runtime()
+    # wait for the rate limit of the model, so parallel invocations are not throttled
+    rate_limiter.acquire(model_id, provider, prompt, max_tokens)
+    if on_request is not None:
+        on_request()
     try:
-        # Invoke the AI21 model using the defined request body and headers
+        if stream:
+            # Stream the response, so the generated text is passed to on_token while the model is generating it
+            response = client.invoke_model_with_response_stream(
+                modelId=model_id,
+                body=request_body,
+                accept=accept,
+                contentType=contentType,
+                **performance_config(model_id, latency_optimized)
+            )
+            return _stream_output(model_id, response, stream_text, on_token)
+        # Invoke the model using the defined request body and headers
         response = client.invoke_model(
             modelId=model_id,
             body=request_body,
             accept=accept,
-            contentType=contentType
+            contentType=contentType,
+            **performance_config(model_id, latency_optimized)
         )
-        # Extract information from the response
-        response_body = json.loads(response.get('body').read())
-        # Extract the input tokens from the response
-        input_tokens = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-input-token-count'])
-        # Extract the output tokens from the response
-        output_tokens = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-output-token-count'])
-        # Extract the output text from the response
-        output_text = response_body['completions'][0]['data']['text']
+        # Extract the output text, input tokens and output tokens from the response
+        output_text, input_tokens, output_tokens = read_output(response, orjson.loads(response.get('body').read()))
+        # the callback gets the full text at once when the response could not be streamed
+        if on_token is not None:
+            on_token(model_id, output_text)
         # Return the output text, input tokens, and output tokens
         return output_text, input_tokens, output_tokens
     except ClientError as err:
         # Log and raise an error if invoking the model fails
-        logger.error(
-            "Couldn't invoke {model_id}. Here's why: %s: %s",
-            err.response["Error"]["Code"],
-            err.response["Error"]["Message"],
-        )
+        logger.error(f"Couldn't invoke {model_id}. Here's why: {err.response['Error']['Code']}: "
+                     f"{err.response['Error']['Message']}")
         raise